@@ -1,117 +1,179 @@
 import os
-import json
 import subprocess
 import sys
+import importlib.util
 import tkinter as tk
 from tkinter import filedialog, messagebox, Toplevel
-from tkinter.ttk import Progressbar, Label, Frame, Style
+from tkinter.ttk import Progressbar, Label, Frame, Style, Treeview
+from queue import SimpleQueue, Empty
 from threading import Thread
 
-repo_label = None
+if sys.version_info < (3, 9):
+    sys.exit('YAD needs Python 3.9 or newer')
 
-try:
-    import yt_dlp
-except ImportError:
-    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'yt-dlp'])
-
-def save_config(destination_folder, language, dark_mode, audio_format):
-    config = {
-        'destination_folder': destination_folder,
-        'language': language,
-        'dark_mode': dark_mode,
-        'format': audio_format
-    }
-    with open('config.json', 'w') as config_file:
-        json.dump(config, config_file)
-
-def load_config():
-    if os.path.exists('config.json'):
-        with open('config.json', 'r') as config_file:
-            config = json.load(config_file)
-            return (config.get('destination_folder', ''), 
-                    config.get('language', 'ENG'), 
-                    config.get('dark_mode', False), 
-                    config.get('format', 'wav'))
-    return ('', 'ENG', False, 'wav')
+from yad import save_config, load_config, load_settings, save_settings, JobQueue, get_journal, get_metrics, get_bandwidth_scheduler, get_ffmpeg_path, get_youtubedl_pool, EventLog, start_service, DaemonClient, DaemonError, connect_daemon
+
+repo_label = None
+PROGRESS_FRAME_MS = 100
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled', 'ffmpeg_missing')
 
 def set_language(lang):
     global current_language
     current_language = lang
     update_language()
-    save_config(destination_folder_var.get(), current_language, dark_mode, audio_format)
-
-def update_progress(percent, progress_var, progress_bar):
-    progress_var.set(percent)
-    progress_bar.update()
-
-def download_audio(url, destination_folder, audio_format, progress_var, progress_bar, status_label, download_count_label):
-    ffmpeg_path = get_ffmpeg_path()
-    if not ffmpeg_path:
-        messagebox.showerror(translations[current_language]['error_title'], translations[current_language]['ffmpeg_missing'])
+    save_config(destination_folder_var.get(), current_language, dark_mode, audio_format, max_workers)
+
+def aggregate_percent(job):
+    if job['total'] == 0:
+        return 100
+    downloaded = sum(job['percents'].values())
+    converted = job['converted'] * 100
+    return int((downloaded + converted) / (job['total'] * 2))
+
+def apply_progress_event(job, status, index, data):
+    entry_label = '[{}/{}] '.format(index + 1, job['total']) if index is not None else ''
+    audio_format = format_label(job['audio_formats'])
+
+    if status == 'expanded':
+        job['total'] = data['total']
+
+    elif status == 'downloading':
+        job['percents'][index] = data['percent']
+        size_in_mib = data['total_bytes'] / 1024 / 1024
+        speed_in_kib = data['speed'] / 1024
+        job['status_text'] = entry_label + translations[current_language]['downloading'].format(data['percent'], speed_in_kib, size_in_mib)
+
+    elif status == 'downloaded':
+        job['percents'][index] = 100
+        job['downloaded'] += 1
+
+    elif status == 'processing':
+        job['status_text'] = entry_label + translations[current_language]['processing'].format(audio_format)
+
+    elif status == 'converted':
+        job['converted'] += 1
+        job['status_text'] = entry_label + translations[current_language]['conversion_complete'].format(audio_format)
+
+    elif status == 'retrying':
+        job['percents'][index] = 0
+        job['status_text'] = entry_label + translations[current_language]['retrying'].format(data['delay'], data['attempt'])
+
+    elif status == 'skipped':
+        job['percents'][index] = 100
+        job['downloaded'] += 1
+        job['converted'] += 1
+
+def prepare_environment():
+    # runs after the window is up: installing or importing yt-dlp and probing for ffmpeg must not delay the first frame
+    client = connect_daemon(settings['daemon_port'], progress_channel)
+    if client is None:
+        try:
+            if importlib.util.find_spec('yt_dlp') is None:
+                subprocess.run([sys.executable, '-m', 'pip', 'install', 'yt-dlp'], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+                importlib.invalidate_caches()
+            get_youtubedl_pool().warm()
+            get_ffmpeg_path()
+        except (subprocess.CalledProcessError, ImportError) as e:
+            stderr = getattr(e, 'stderr', None)
+            progress_channel.put((None, 'environment_failed', None, stderr.decode(errors='replace').strip() if stderr else str(e)))
+            return
+    progress_channel.put((None, 'environment_ready', None, client))
+
+def start_local_queue():
+    events = EventLog(progress_channel)
+    local_queue = JobQueue(events, settings['max_jobs'], {'stream': settings['download_mode'] == 'stream', 'segments': settings['download_segments'], 'loudness': settings['loudness'], 'dedupe': settings['dedupe']}, get_journal())
+    if settings['daemon_port']:
+        try:
+            start_service(local_queue, events, settings['daemon_port'])
+        except OSError:
+            pass
+    return local_queue
+
+def apply_environment_event(status, data):
+    global environment_ready, job_queue
+    if status == 'environment_failed':
+        status_label.config(text=translations[current_language]['dependency_error'].format(data))
+        messagebox.showerror(translations[current_language]['error_title'], translations[current_language]['dependency_error'].format(data))
         return
-
-    ydl_opts = {
-        'format': 'bestaudio/best',
-        'outtmpl': os.path.join(destination_folder, '%(playlist)s/%(title)s.%(ext)s'),
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': audio_format,
-            'preferredquality': '192',
-        }],
-        'ffmpeg_location': ffmpeg_path,
-        'progress_hooks': [lambda d: progress_hook(d, progress_var, progress_bar, status_label, download_count_label, audio_format)],
-        'noplaylist': False,
-        'playlistend': 0
-    }
-
-    try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
-        messagebox.showinfo(translations[current_language]['success_title'], translations[current_language]['download_complete'].format(audio_format.upper()))
-    except Exception as e:
-        messagebox.showerror(translations[current_language]['error_title'], translations[current_language]['download_error'].format(str(e)))
-
-def get_ffmpeg_path():
-    if getattr(sys, 'frozen', False):
-        bundle_dir = sys._MEIPASS
+    # a running download service owns the queue and the journal; otherwise this window serves them itself
+    job_queue = data if data is not None else start_local_queue()
+    environment_ready = True
+    restore_jobs()
+    if not active_jobs:
+        status_label.config(text=translations[current_language]['waiting'])
+
+def drain_progress():
+    changed = False
+    while True:
+        try:
+            job_id, status, index, data = progress_channel.get_nowait()
+        except Empty:
+            break
+
+        changed = True
+        if job_id is None:
+            apply_environment_event(status, data)
+        elif job_id not in active_jobs:
+            # the local API shares this event log, so jobs other clients submitted show up here too
+            continue
+        elif status == 'started':
+            active_jobs[job_id].update(data)
+        elif status in FINISHED_STATUSES:
+            del active_jobs[job_id]
+            finished_jobs.append((status, data))
+        else:
+            apply_progress_event(active_jobs[job_id], status, index, data)
+
+    if changed:
+        refresh_queue_view()
+    if active_jobs:
+        repaint_progress()
+    elif finished_jobs:
+        show_queue_summary()
+
+    root.after(PROGRESS_FRAME_MS, drain_progress)
+
+def show_queue_summary():
+    statuses = [status for status, _ in finished_jobs]
+    errors = [str(data) for status, data in finished_jobs if status == 'failed']
+    if 'ffmpeg_missing' in statuses:
+        errors.append(translations[current_language]['ffmpeg_missing'])
+    summary = translations[current_language]['queue_summary'].format(statuses.count('completed'), len(statuses) - statuses.count('completed') - statuses.count('cancelled'), statuses.count('cancelled'))
+    del finished_jobs[:]
+
+    if errors:
+        messagebox.showerror(translations[current_language]['error_title'], '\n\n'.join([summary] + errors))
     else:
-        bundle_dir = os.path.dirname(os.path.abspath(__file__))
-    
-    ffmpeg_path = os.path.join(bundle_dir, 'ffmpeg', 'ffmpeg.exe')
-    if not os.path.isfile(ffmpeg_path):
-        ffmpeg_path = None
-    return ffmpeg_path
-
-def progress_hook(d, progress_var, progress_bar, status_label, download_count_label, audio_format):
-    if not hasattr(progress_hook, 'downloaded_videos'):
-        progress_hook.downloaded_videos = 0
-        progress_hook.total_videos = 0
-
-    if d['status'] == 'downloading':
-        if progress_hook.total_videos == 0:
-            progress_hook.total_videos = d.get('playlist_count', 1)
-
-        total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
-        downloaded_bytes = d.get('downloaded_bytes', 0)
-        percent = int(downloaded_bytes / total_bytes * 100) if total_bytes > 0 else 0
-        speed = d.get('speed', 0) or 0
-        size_in_mib = total_bytes / 1024 / 1024 if total_bytes > 0 else 0
-        speed_in_kib = speed / 1024 if speed > 0 else 0
-        update_progress(percent, progress_var, progress_bar)
-        status_label.config(text=translations[current_language]['downloading'].format(percent, speed_in_kib, size_in_mib))
-
-    elif d['status'] == 'finished':
-        progress_hook.downloaded_videos += 1
-        update_progress(100, progress_var, progress_bar)
-        status_label.config(text=translations[current_language]['conversion_complete'].format(audio_format.upper()))
-        download_count_label.config(text=translations[current_language]['download_count'].format(progress_hook.downloaded_videos, progress_hook.total_videos))
-
-    elif d['status'] == 'processing':
-        status_label.config(text=translations[current_language]['processing'].format(audio_format.upper()))
-
-def start_download(audio_format):
-    url = url_entry.get()
-    if not url:
+        messagebox.showinfo(translations[current_language]['summary_title'], summary)
+
+def repaint_progress():
+    jobs = list(active_jobs.values())
+    total = sum(job['total'] for job in jobs)
+    downloaded = sum(job['downloaded'] for job in jobs)
+    converted = sum(job['converted'] for job in jobs)
+    weighted = sum(aggregate_percent(job) * job['total'] for job in jobs)
+
+    progress_var.set(int(weighted / total) if total > 0 else 0)
+    status_text = next((job['status_text'] for job in reversed(jobs) if job['status_text']), None)
+    if status_text:
+        status_label.config(text=status_text)
+    download_count_label.config(text='{} - {}'.format(
+        translations[current_language]['download_count'].format(downloaded, total),
+        translations[current_language]['conversion_count'].format(converted, total)))
+
+def format_label(audio_formats):
+    return '/'.join(audio_format.upper() for audio_format in audio_formats)
+
+def selected_formats():
+    return [audio_format for audio_format, selected in format_vars.items() if selected.get()]
+
+def start_download(audio_formats):
+    if not environment_ready:
+        messagebox.showwarning(translations[current_language]['warning_title'], translations[current_language]['preparing'])
+        return
+
+    urls = url_entry.get().split()
+    if not urls:
         messagebox.showwarning(translations[current_language]['warning_title'], translations[current_language]['enter_url'])
         return
 
@@ -120,10 +182,105 @@ def start_download(audio_format):
         messagebox.showwarning(translations[current_language]['warning_title'], translations[current_language]['choose_folder'])
         return
 
-    save_config(destination_folder, current_language, dark_mode, audio_format)
+    if not audio_formats:
+        messagebox.showwarning(translations[current_language]['warning_title'], translations[current_language]['choose_format'])
+        return
 
-    download_thread = Thread(target=download_audio, args=(url, destination_folder, audio_format, progress_var, progress_bar, status_label, download_count_label))
-    download_thread.start()
+    save_config(destination_folder, current_language, dark_mode, audio_formats[0], max_workers)
+
+    duplicates = 0
+    for url in urls:
+        try:
+            job_id = job_queue.submit(url, destination_folder, audio_formats, max_workers=max_workers)
+        except DaemonError as e:
+            messagebox.showerror(translations[current_language]['error_title'], str(e))
+            return
+        if job_id is None:
+            duplicates += 1
+            continue
+        track_job(job_id, audio_formats)
+
+    url_entry.delete(0, tk.END)
+    refresh_queue_view()
+    if duplicates:
+        messagebox.showwarning(translations[current_language]['warning_title'], translations[current_language]['duplicate_urls'].format(duplicates))
+
+def track_job(job_id, audio_formats):
+    active_jobs[job_id] = {
+        'total': 0,
+        'downloaded': 0,
+        'converted': 0,
+        'percents': {},
+        'status_text': None,
+        'audio_formats': audio_formats
+    }
+
+def restore_jobs():
+    restored = job_queue.restore()
+    for job in job_queue.snapshot():
+        if job['id'] in restored:
+            track_job(job['id'], job['audio_formats'])
+
+def import_urls():
+    path = filedialog.askopenfilename(filetypes=[('Text', '*.txt'), ('*', '*')])
+    if not path:
+        return
+    with open(path, encoding='utf-8') as url_file:
+        urls = [line.split()[0] for line in url_file if line.strip() and not line.startswith('#')]
+    urls = url_entry.get().split() + urls
+    url_entry.delete(0, tk.END)
+    url_entry.insert(0, ' '.join(urls))
+
+def refresh_queue_view():
+    selection = queue_view.selection()
+    queue_view.delete(*queue_view.get_children())
+    try:
+        jobs = job_queue.snapshot() if job_queue is not None else []
+    except DaemonError:
+        jobs = []
+    for job in jobs:
+        queue_view.insert('', tk.END, iid=str(job['id']), values=(
+            job['url'],
+            format_label(job['audio_formats']),
+            job['priority'],
+            translations[current_language]['state_' + job['state']]))
+    queue_view.selection_set([job_id for job_id in selection if queue_view.exists(job_id)])
+
+def selected_job_ids():
+    return [int(job_id) for job_id in queue_view.selection()]
+
+def pause_selected():
+    for job_id in selected_job_ids():
+        job_queue.pause(job_id)
+    refresh_queue_view()
+
+def resume_selected():
+    for job_id in selected_job_ids():
+        job_queue.resume(job_id)
+    refresh_queue_view()
+
+def cancel_selected():
+    for job_id in selected_job_ids():
+        job_queue.cancel(job_id)
+    refresh_queue_view()
+
+def apply_speed_limit(event=None):
+    try:
+        rate_limit = max(0, int(speed_limit_var.get())) * 1024
+    except ValueError:
+        speed_limit_var.set(str(settings['rate_limit'] // 1024))
+        return
+    if rate_limit != settings['rate_limit']:
+        settings['rate_limit'] = rate_limit
+        (job_queue if isinstance(job_queue, DaemonClient) else get_bandwidth_scheduler()).set_limits(rate=rate_limit)
+        save_settings(rate_limit=rate_limit)
+
+def change_priority(delta):
+    job_ids = selected_job_ids()
+    for job in job_queue.snapshot():
+        if job['id'] in job_ids:
+            job_queue.set_priority(job['id'], job['priority'] + delta)
+    refresh_queue_view()
 
 def select_destination_folder():
     folder = filedialog.askdirectory()
@@ -152,9 +309,17 @@ def update_mode():
         destination_entry.configure(bg='#555', fg='#FFF', insertbackground='white')
         url_entry.configure(bg='#555', fg='#FFF', insertbackground='white')
         select_button.configure(bg='#555', fg='#FFF')
+        import_button.configure(bg='#555', fg='#FFF')
+        speed_limit_spinbox.configure(bg='#555', fg='#FFF', insertbackground='white', buttonbackground='#555')
+        style.configure('Treeview', background='#555', fieldbackground='#555', foreground='#FFF')
+        for queue_button in queue_buttons.values():
+            queue_button.configure(bg='#555', fg='#FFF')
         mp3_button.configure(bg='#555', fg='#FFF')
         wav_button.configure(bg='#555', fg='#FFF')
         flac_button.configure(bg='#555', fg='#FFF')
+        selected_button.configure(bg='#555', fg='#FFF')
+        for format_checkbutton in format_checkbuttons:
+            format_checkbutton.configure(bg='#333', fg='#FFF', selectcolor='#555', activebackground='#333', activeforeground='#FFF')
     else:
         root.tk_setPalette(background='#FFF', foreground='#000')
         style.configure('TFrame', background='#FFF')
@@ -163,9 +328,17 @@ def update_mode():
         destination_entry.configure(bg='#FFF', fg='#000', insertbackground='black')
         url_entry.configure(bg='#FFF', fg='#000', insertbackground='black')
         select_button.configure(bg='#F0F0F0', fg='#000')
+        import_button.configure(bg='#F0F0F0', fg='#000')
+        speed_limit_spinbox.configure(bg='#FFF', fg='#000', insertbackground='black', buttonbackground='#F0F0F0')
+        style.configure('Treeview', background='#FFF', fieldbackground='#FFF', foreground='#000')
+        for queue_button in queue_buttons.values():
+            queue_button.configure(bg='#F0F0F0', fg='#000')
         mp3_button.configure(bg='#F0F0F0', fg='#000')
         wav_button.configure(bg='#F0F0F0', fg='#000')
         flac_button.configure(bg='#F0F0F0', fg='#000')
+        selected_button.configure(bg='#F0F0F0', fg='#000')
+        for format_checkbutton in format_checkbuttons:
+            format_checkbutton.configure(bg='#FFF', fg='#000', selectcolor='#FFF', activebackground='#FFF', activeforeground='#000')
     mode_menu.entryconfig(0, label=mode_text)
 
 def update_language():
@@ -179,9 +352,17 @@ def update_language():
     mp3_button.config(text=translations_for_current_language.get('mp3_button', "MP3"))
     wav_button.config(text=translations_for_current_language.get('wav_button', "WAV"))
     flac_button.config(text=translations_for_current_language.get('flac_button', "FLAC"))
+    selected_button.config(text=translations_for_current_language.get('download_selected', "Download Selected"))
     version_label.config(text=translations_for_current_language.get('version_label', "Version: 1.0"))
     select_button.config(text=translations_for_current_language.get('choose_export_folder', "Choose Export Folder"))
-    status_label.config(text=translations_for_current_language.get('waiting', "Waiting..."))
+    import_button.config(text=translations_for_current_language.get('import_urls', "Import Links"))
+    speed_limit_label.config(text=translations_for_current_language.get('speed_limit', "Speed limit (KiB/s, 0 = unlimited):"))
+    for column in queue_columns:
+        queue_view.heading(column, text=translations_for_current_language.get('queue_' + column, column))
+    for name, queue_button in queue_buttons.items():
+        queue_button.config(text=translations_for_current_language.get(name, name))
+    refresh_queue_view()
+    status_label.config(text=translations_for_current_language.get('waiting' if environment_ready else 'preparing', "Waiting..."))
 
     mode_text = translations_for_current_language.get('light_mode') if dark_mode else translations_for_current_language.get('dark_mode')
     mode_menu.entryconfig(0, label=mode_text)
@@ -254,6 +435,7 @@ translations = {
         'mp3_button': "MP3",
         'wav_button': "WAV",
         'flac_button': "FLAC",
+        'download_selected': "Download Selected",
         'language_menu': "Language",
         'mode_menu': "Mode",
         'dark_mode': "Dark Mode",
@@ -268,8 +450,34 @@ translations = {
         'warning_title': "Input Error",
         'enter_url': "Please enter a video URL.",
         'choose_folder': "Please choose a destination folder.",
+        'choose_format': "Please choose at least one format.",
         'download_count': "Downloaded {}/{} videos",
+        'conversion_count': "Converted {}/{} files",
+        'import_urls': "Import Links",
+        'queue_url': "Link",
+        'queue_formats': "Formats",
+        'queue_priority': "Priority",
+        'queue_state': "Status",
+        'pause': "Pause",
+        'resume': "Resume",
+        'cancel': "Cancel",
+        'priority_up': "Priority +",
+        'priority_down': "Priority -",
+        'duplicate_urls': "{} link(s) already in the queue were skipped.",
+        'queue_summary': "Completed: {} - Failed: {} - Cancelled: {}",
+        'summary_title': "Queue Finished",
+        'state_queued': "Queued",
+        'state_running': "Running",
+        'state_paused': "Paused",
+        'state_completed': "Completed",
+        'state_failed': "Failed",
+        'state_cancelled': "Cancelled",
+        'state_ffmpeg_missing': "FFmpeg missing",
+        'speed_limit': "Speed limit (KiB/s, 0 = unlimited):",
         'processing': "Processing: {}",
+        'retrying': "Retrying in {:.0f}s (attempt {})",
+        'preparing': "Preparing downloader, please wait...",
+        'dependency_error': "Could not install yt-dlp: {}",
         'version_label': "Version: 1.1.1",
         'about_menu': "About",
         'about_title': "About",
@@ -286,6 +494,7 @@ translations = {
         'mp3_button': "MP3",
         'wav_button': "WAV",
         'flac_button': "FLAC",
+        'download_selected': "Baixar Selecionados",
         'language_menu': "Linguagem",
         'mode_menu': "Modo",
         'dark_mode': "Modo Escuro",
@@ -300,8 +509,34 @@ translations = {
         'warning_title': "Erro de Entrada",
         'enter_url': "Por favor, insira o URL de um vídeo.",
         'choose_folder': "Por favor, escolha uma pasta de destino.",
+        'choose_format': "Por favor, escolha pelo menos um formato.",
         'download_count': "Baixado {}/{} vídeos",
+        'conversion_count': "Convertido {}/{} arquivos",
+        'import_urls': "Importar links",
+        'queue_url': "Link",
+        'queue_formats': "Formatos",
+        'queue_priority': "Prioridade",
+        'queue_state': "Status",
+        'pause': "Pausar",
+        'resume': "Retomar",
+        'cancel': "Cancelar",
+        'priority_up': "Prioridade +",
+        'priority_down': "Prioridade -",
+        'duplicate_urls': "{} link(s) já na fila foram ignorados.",
+        'queue_summary': "Concluídos: {} - Falharam: {} - Cancelados: {}",
+        'summary_title': "Fila concluída",
+        'state_queued': "Na fila",
+        'state_running': "Em andamento",
+        'state_paused': "Pausado",
+        'state_completed': "Concluído",
+        'state_failed': "Falhou",
+        'state_cancelled': "Cancelado",
+        'state_ffmpeg_missing': "FFmpeg ausente",
+        'speed_limit': "Limite de velocidade (KiB/s, 0 = ilimitado):",
         'processing': "Processando: {}",
+        'retrying': "Tentando novamente em {:.0f}s (tentativa {})",
+        'preparing': "Preparando o downloader, aguarde...",
+        'dependency_error': "Não foi possível instalar o yt-dlp: {}",
         'version_label': "Versão: 1.1.1",
         'about_menu': "Sobre",
         'about_title': "Sobre",
@@ -318,6 +553,7 @@ translations = {
         'mp3_button': "MP3",
         'wav_button': "WAV",
         'flac_button': "FLAC",
+        'download_selected': "Descarregar Selecionados",
         'language_menu': "Linguagem",
         'mode_menu': "Modo",
         'dark_mode': "Modo Escuro",
@@ -332,8 +568,34 @@ translations = {
         'warning_title': "Erro de Entrada",
         'enter_url': "Por favor, insira o URL de um vídeo.",
         'choose_folder': "Por favor, escolha uma pasta de destino.",
+        'choose_format': "Por favor, escolha pelo menos um formato.",
         'download_count': "Descarregado {}/{} vídeos",
+        'conversion_count': "Convertido {}/{} ficheiros",
+        'import_urls': "Importar ligações",
+        'queue_url': "Ligação",
+        'queue_formats': "Formatos",
+        'queue_priority': "Prioridade",
+        'queue_state': "Estado",
+        'pause': "Pausar",
+        'resume': "Retomar",
+        'cancel': "Cancelar",
+        'priority_up': "Prioridade +",
+        'priority_down': "Prioridade -",
+        'duplicate_urls': "{} ligação(ões) já na fila foram ignoradas.",
+        'queue_summary': "Concluídos: {} - Falhados: {} - Cancelados: {}",
+        'summary_title': "Fila concluída",
+        'state_queued': "Na fila",
+        'state_running': "Em curso",
+        'state_paused': "Em pausa",
+        'state_completed': "Concluído",
+        'state_failed': "Falhou",
+        'state_cancelled': "Cancelado",
+        'state_ffmpeg_missing': "FFmpeg em falta",
+        'speed_limit': "Limite de velocidade (KiB/s, 0 = ilimitado):",
         'processing': "A Processar: {}",
+        'retrying': "A tentar novamente em {:.0f}s (tentativa {})",
+        'preparing': "A preparar o downloader, aguarde...",
+        'dependency_error': "Não foi possível instalar o yt-dlp: {}",
         'version_label': "Versão: 1.1.1",
         'about_menu': "Sobre",
         'about_title': "Sobre",
@@ -350,6 +612,7 @@ translations = {
         'mp3_button': "MP3",
         'wav_button': "WAV",
         'flac_button': "FLAC",
+        'download_selected': "Descargar Seleccionados",
         'language_menu': "Idioma",
         'mode_menu': "Modo",
         'dark_mode': "Modo Oscuro",
@@ -364,8 +627,34 @@ translations = {
         'warning_title': "Error de Entrada",
         'enter_url': "Por favor, introduce la URL de un video.",
         'choose_folder': "Por favor, elige una carpeta de destino.",
+        'choose_format': "Por favor, elige al menos un formato.",
         'download_count': "Descargado {}/{} videos",
+        'conversion_count': "Convertido {}/{} archivos",
+        'import_urls': "Importar enlaces",
+        'queue_url': "Enlace",
+        'queue_formats': "Formatos",
+        'queue_priority': "Prioridad",
+        'queue_state': "Estado",
+        'pause': "Pausar",
+        'resume': "Reanudar",
+        'cancel': "Cancelar",
+        'priority_up': "Prioridad +",
+        'priority_down': "Prioridad -",
+        'duplicate_urls': "{} enlace(s) ya en la cola se omitieron.",
+        'queue_summary': "Completadas: {} - Fallidas: {} - Canceladas: {}",
+        'summary_title': "Cola terminada",
+        'state_queued': "En cola",
+        'state_running': "En curso",
+        'state_paused': "En pausa",
+        'state_completed': "Completada",
+        'state_failed': "Fallida",
+        'state_cancelled': "Cancelada",
+        'state_ffmpeg_missing': "Falta FFmpeg",
+        'speed_limit': "Límite de velocidad (KiB/s, 0 = sin límite):",
         'processing': "Procesando: {}",
+        'retrying': "Reintentando en {:.0f}s (intento {})",
+        'preparing': "Preparando el descargador, espera...",
+        'dependency_error': "No se pudo instalar yt-dlp: {}",
         'version_label': "Versión: 1.1.1",
         'about_menu': "Acerca de",
         'about_title': "Acerca de",
@@ -382,6 +671,7 @@ translations = {
         'mp3_button': "MP3",
         'wav_button': "WAV",
         'flac_button': "FLAC",
+        'download_selected': "Télécharger la sélection",
         'language_menu': "Langue",
         'mode_menu': "Mode",
         'dark_mode': "Mode Sombre",
@@ -396,8 +686,34 @@ translations = {
         'warning_title': "Erreur d'Entrée",
         'enter_url': "Veuillez entrer l'URL d'une vidéo.",
         'choose_folder': "Veuillez choisir un dossier de destination.",
+        'choose_format': "Veuillez choisir au moins un format.",
         'download_count': "Téléchargé {}/{} vidéos",
+        'conversion_count': "Converti {}/{} fichiers",
+        'import_urls': "Importer des liens",
+        'queue_url': "Lien",
+        'queue_formats': "Formats",
+        'queue_priority': "Priorité",
+        'queue_state': "Statut",
+        'pause': "Pause",
+        'resume': "Reprendre",
+        'cancel': "Annuler",
+        'priority_up': "Priorité +",
+        'priority_down': "Priorité -",
+        'duplicate_urls': "{} lien(s) déjà dans la file ont été ignorés.",
+        'queue_summary': "Terminés : {} - Échoués : {} - Annulés : {}",
+        'summary_title': "File terminée",
+        'state_queued': "En attente",
+        'state_running': "En cours",
+        'state_paused': "En pause",
+        'state_completed': "Terminé",
+        'state_failed': "Échoué",
+        'state_cancelled': "Annulé",
+        'state_ffmpeg_missing': "FFmpeg manquant",
+        'speed_limit': "Limite de vitesse (Kio/s, 0 = illimitée) :",
         'processing': "Traitement : {}",
+        'retrying': "Nouvel essai dans {:.0f}s (tentative {})",
+        'preparing': "Préparation du téléchargeur, veuillez patienter...",
+        'dependency_error': "Impossible d'installer yt-dlp : {}",
         'version_label': "Version : 1.1.1",
         'about_menu': "À Propos",
         'about_title': "À Propos",
@@ -414,6 +730,7 @@ translations = {
         'mp3_button': "MP3",
         'wav_button': "WAV",
         'flac_button': "FLAC",
+        'download_selected': "Auswahl herunterladen",
         'language_menu': "Sprache",
         'mode_menu': "Modus",
         'dark_mode': "Dunkler Modus",
@@ -428,8 +745,34 @@ translations = {
         'warning_title': "Eingabefehler",
         'enter_url': "Bitte geben Sie die URL eines Videos ein.",
         'choose_folder': "Bitte wählen Sie einen Zielordner.",
+        'choose_format': "Bitte wählen Sie mindestens ein Format.",
         'download_count': "Heruntergeladen {}/{} Videos",
+        'conversion_count': "Konvertiert {}/{} Dateien",
+        'import_urls': "Links importieren",
+        'queue_url': "Link",
+        'queue_formats': "Formate",
+        'queue_priority': "Priorität",
+        'queue_state': "Status",
+        'pause': "Pausieren",
+        'resume': "Fortsetzen",
+        'cancel': "Abbrechen",
+        'priority_up': "Priorität +",
+        'priority_down': "Priorität -",
+        'duplicate_urls': "{} Link(s) bereits in der Warteschlange wurden übersprungen.",
+        'queue_summary': "Abgeschlossen: {} - Fehlgeschlagen: {} - Abgebrochen: {}",
+        'summary_title': "Warteschlange beendet",
+        'state_queued': "Wartend",
+        'state_running': "Läuft",
+        'state_paused': "Pausiert",
+        'state_completed': "Abgeschlossen",
+        'state_failed': "Fehlgeschlagen",
+        'state_cancelled': "Abgebrochen",
+        'state_ffmpeg_missing': "FFmpeg fehlt",
+        'speed_limit': "Geschwindigkeitslimit (KiB/s, 0 = unbegrenzt):",
         'processing': "Verarbeitung: {}",
+        'retrying': "Neuer Versuch in {:.0f}s (Versuch {})",
+        'preparing': "Downloader wird vorbereitet, bitte warten...",
+        'dependency_error': "yt-dlp konnte nicht installiert werden: {}",
         'version_label': "Version: 1.1.1",
         'about_menu': "Über",
         'about_title': "Über",
@@ -446,6 +789,7 @@ translations = {
         'mp3_button': "MP3",
         'wav_button': "WAV",
         'flac_button': "FLAC",
+        'download_selected': "Scarica Selezionati",
         'language_menu': "Lingua",
         'mode_menu': "Modalità",
         'dark_mode': "Modalità Scura",
@@ -460,8 +804,34 @@ translations = {
         'warning_title': "Errore di Inserimento",
         'enter_url': "Per favore, inserisci l'URL di un video.",
         'choose_folder': "Per favore, scegli una cartella di destinazione.",
+        'choose_format': "Per favore, scegli almeno un formato.",
         'download_count': "Scaricato {}/{} video",
+        'conversion_count': "Convertito {}/{} file",
+        'import_urls': "Importa link",
+        'queue_url': "Link",
+        'queue_formats': "Formati",
+        'queue_priority': "Priorità",
+        'queue_state': "Stato",
+        'pause': "Pausa",
+        'resume': "Riprendi",
+        'cancel': "Annulla",
+        'priority_up': "Priorità +",
+        'priority_down': "Priorità -",
+        'duplicate_urls': "{} link già in coda sono stati saltati.",
+        'queue_summary': "Completati: {} - Falliti: {} - Annullati: {}",
+        'summary_title': "Coda terminata",
+        'state_queued': "In coda",
+        'state_running': "In corso",
+        'state_paused': "In pausa",
+        'state_completed': "Completato",
+        'state_failed': "Fallito",
+        'state_cancelled': "Annullato",
+        'state_ffmpeg_missing': "FFmpeg mancante",
+        'speed_limit': "Limite di velocità (KiB/s, 0 = illimitato):",
         'processing': "Elaborazione: {}",
+        'retrying': "Nuovo tentativo tra {:.0f}s (tentativo {})",
+        'preparing': "Preparazione del downloader, attendere...",
+        'dependency_error': "Impossibile installare yt-dlp: {}",
         'version_label': "Versione: 1.1.1",
         'about_menu': "Informazioni",
         'about_title': "Informazioni",
@@ -478,6 +848,7 @@ translations = {
         'mp3_button': "MP3",
         'wav_button': "WAV",
         'flac_button': "FLAC",
+        'download_selected': "הורד את הנבחרים",
         'language_menu': "שפה",
         'mode_menu': "מצב",
         'dark_mode': "עיצוב חשוך",
@@ -492,8 +863,34 @@ translations = {
         'warning_title': "שגיאה בקלט",
         'enter_url': "אנא הזן קישור תקין של סרטון.",
         'choose_folder': "אנא בחר תיקיית יעד.",
+        'choose_format': "אנא בחר לפחות פורמט אחד.",
         'download_count': "הורדו {}/{} סרטונים",
+        'conversion_count': "הומרו {}/{} קבצים",
+        'import_urls': "ייבוא קישורים",
+        'queue_url': "קישור",
+        'queue_formats': "פורמטים",
+        'queue_priority': "עדיפות",
+        'queue_state': "מצב",
+        'pause': "השהה",
+        'resume': "המשך",
+        'cancel': "ביטול",
+        'priority_up': "עדיפות +",
+        'priority_down': "עדיפות -",
+        'duplicate_urls': "{} קישורים שכבר נמצאים בתור דולגו.",
+        'queue_summary': "הושלמו: {} - נכשלו: {} - בוטלו: {}",
+        'summary_title': "התור הסתיים",
+        'state_queued': "בתור",
+        'state_running': "פועל",
+        'state_paused': "מושהה",
+        'state_completed': "הושלם",
+        'state_failed': "נכשל",
+        'state_cancelled': "בוטל",
+        'state_ffmpeg_missing': "FFmpeg חסר",
+        'speed_limit': "הגבלת מהירות (KiB/s, 0 = ללא הגבלה):",
         'processing': "מעבד: {}",
+        'retrying': "ניסיון חוזר בעוד {:.0f} שניות (ניסיון {})",
+        'preparing': "מכין את המוריד, אנא המתן...",
+        'dependency_error': "לא ניתן להתקין את yt-dlp: {}",
         'version_label': "גרסה: 1.1.1",
         'about_menu': "אודות",
         'about_title': "אודות",
@@ -507,16 +904,24 @@ translations = {
 }
 
 
-dest_folder, current_language, dark_mode, audio_format = load_config()
+dest_folder, current_language, dark_mode, audio_format, max_workers = load_config()
+settings = load_settings()
+if settings['metrics_port']:
+    get_metrics().serve(settings['metrics_port'])
 
 root = tk.Tk()
-root.geometry("800x365")
+root.geometry("800x680")
 icon_path = os.path.join(os.path.dirname(__file__), 'ico', 'icon.ico')
 root.iconbitmap(icon_path)
 root.title(translations[current_language]['window_title'])
 
 destination_folder_var = tk.StringVar(value=dest_folder)
 progress_var = tk.DoubleVar()
+progress_channel = SimpleQueue()
+environment_ready = False
+active_jobs = {}
+finished_jobs = []
+job_queue = None
 
 style = Style()
 frame = Frame(root, padding=10)
@@ -535,8 +940,14 @@ destination_label.pack(anchor=tk.W)
 destination_entry = tk.Entry(frame, textvariable=destination_folder_var, width=50)
 destination_entry.pack(fill=tk.X, pady=5)
 
-select_button = tk.Button(frame, text=translations[current_language]['choose_export_folder'], command=select_destination_folder)
-select_button.pack(pady=5)
+folder_button_frame = Frame(frame)
+folder_button_frame.pack(pady=5)
+
+select_button = tk.Button(folder_button_frame, text=translations[current_language]['choose_export_folder'], command=select_destination_folder)
+select_button.pack(side=tk.LEFT, padx=5)
+
+import_button = tk.Button(folder_button_frame, text=translations[current_language]['import_urls'], command=import_urls)
+import_button.pack(side=tk.LEFT, padx=5)
 
 progress_bar = Progressbar(frame, variable=progress_var, maximum=100)
 progress_bar.pack(fill=tk.X, pady=10)
@@ -550,15 +961,59 @@ download_count_label.pack()
 button_frame = Frame(frame)
 button_frame.pack(pady=10)
 
-mp3_button = tk.Button(button_frame, text=translations[current_language]['mp3_button'], command=lambda: start_download('mp3'))
+mp3_button = tk.Button(button_frame, text=translations[current_language]['mp3_button'], command=lambda: start_download(['mp3']))
 mp3_button.pack(side=tk.LEFT, padx=5)
 
-wav_button = tk.Button(button_frame, text=translations[current_language]['wav_button'], command=lambda: start_download('wav'))
+wav_button = tk.Button(button_frame, text=translations[current_language]['wav_button'], command=lambda: start_download(['wav']))
 wav_button.pack(side=tk.LEFT, padx=5)
 
-flac_button = tk.Button(button_frame, text=translations[current_language]['flac_button'], command=lambda: start_download('flac'))
+flac_button = tk.Button(button_frame, text=translations[current_language]['flac_button'], command=lambda: start_download(['flac']))
 flac_button.pack(side=tk.LEFT, padx=5)
 
+selection_frame = Frame(frame)
+selection_frame.pack(pady=5)
+
+format_vars = {audio_format: tk.BooleanVar(value=False) for audio_format in ('mp3', 'wav', 'flac')}
+format_checkbuttons = []
+for format_name, selected in format_vars.items():
+    format_checkbutton = tk.Checkbutton(selection_frame, text=format_name.upper(), variable=selected)
+    format_checkbutton.pack(side=tk.LEFT, padx=5)
+    format_checkbuttons.append(format_checkbutton)
+
+selected_button = tk.Button(selection_frame, text=translations[current_language]['download_selected'], command=lambda: start_download(selected_formats()))
+selected_button.pack(side=tk.LEFT, padx=5)
+
+queue_columns = ('url', 'formats', 'priority', 'state')
+queue_view = Treeview(frame, columns=queue_columns, show='headings', height=5)
+for column in queue_columns:
+    queue_view.heading(column, text=translations[current_language]['queue_' + column])
+    queue_view.column(column, width=420 if column == 'url' else 100, stretch=column == 'url')
+queue_view.pack(fill=tk.BOTH, expand=True, pady=5)
+
+queue_button_frame = Frame(frame)
+queue_button_frame.pack(pady=5)
+
+queue_buttons = {
+    'pause': tk.Button(queue_button_frame, text=translations[current_language]['pause'], command=pause_selected),
+    'resume': tk.Button(queue_button_frame, text=translations[current_language]['resume'], command=resume_selected),
+    'cancel': tk.Button(queue_button_frame, text=translations[current_language]['cancel'], command=cancel_selected),
+    'priority_up': tk.Button(queue_button_frame, text=translations[current_language]['priority_up'], command=lambda: change_priority(1)),
+    'priority_down': tk.Button(queue_button_frame, text=translations[current_language]['priority_down'], command=lambda: change_priority(-1))
+}
+for queue_button in queue_buttons.values():
+    queue_button.pack(side=tk.LEFT, padx=5)
+
+limit_frame = Frame(frame)
+limit_frame.pack(pady=5)
+
+speed_limit_label = Label(limit_frame, text=translations[current_language]['speed_limit'])
+speed_limit_label.pack(side=tk.LEFT, padx=5)
+speed_limit_var = tk.StringVar(value=str(settings['rate_limit'] // 1024))
+speed_limit_spinbox = tk.Spinbox(limit_frame, from_=0, to=1024 * 1024, increment=256, width=10, textvariable=speed_limit_var, command=apply_speed_limit)
+speed_limit_spinbox.pack(side=tk.LEFT, padx=5)
+speed_limit_spinbox.bind('<Return>', apply_speed_limit)
+speed_limit_spinbox.bind('<FocusOut>', apply_speed_limit)
+
 menu_bar = tk.Menu(root)
 root.config(menu=menu_bar)
 
@@ -583,6 +1038,7 @@ menu_bar.add_command(label=translations[current_language]['about_menu'], command
 version_label = Label(frame, text=translations[current_language]['version_label'])
 version_label.pack(pady=10)
 
-update_mode()
 update_language()
+root.after(PROGRESS_FRAME_MS, drain_progress)
+root.after_idle(lambda: Thread(target=prepare_environment, daemon=True).start())
 root.mainloop()
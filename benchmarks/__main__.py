@@ -0,0 +1,134 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import yt_dlp
+
+from yad import get_ffmpeg_path
+from yad.config import DEFAULT_SETTINGS
+from .server import playlist_url, start_server
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def int_list(value):
+    return [int(item) for item in value.split(',') if item.strip()]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmark download_audio offline against a local media server.')
+    parser.add_argument('--sizes', type=int_list, default=[1, 8, 32], help='comma-separated playlist sizes')
+    parser.add_argument('--workers', type=int_list, default=[1, 4], help='comma-separated max_workers values')
+    parser.add_argument('--duration', type=int, default=30, help='length of every synthetic track in seconds')
+    parser.add_argument('--rate', type=int, default=0, help='bytes per second per connection, 0 for unlimited')
+    parser.add_argument('--throttle-concurrency', type=int, default=0, help='answer media requests beyond this many at once with HTTP 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of media requests answered with HTTP 503')
+    parser.add_argument('--formats', default='mp3', help='comma-separated target formats')
+    parser.add_argument('--stream', action='store_true', help='benchmark the streaming download mode')
+    parser.add_argument('--segments', type=int, default=DEFAULT_SETTINGS['download_segments'], help='parallel range requests per source file of 16 MiB or more')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case; the median is compared')
+    parser.add_argument('-o', '--output', help='write the results to this JSON file instead of stdout')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed tracks per minute slowdown against the baseline')
+    return parser.parse_args(argv)
+
+def run_case(url, size, workers, args):
+    work_dir = tempfile.mkdtemp(prefix='yad-bench-')
+    env = dict(os.environ, XDG_CACHE_HOME=os.path.join(work_dir, 'cache'), LOCALAPPDATA=os.path.join(work_dir, 'cache'))
+    command = [sys.executable, '-m', 'benchmarks.case', url, os.path.join(work_dir, 'output'),
+               '--formats', args.formats, '--workers', str(workers), '--segments', str(args.segments)]
+    if args.stream:
+        command.append('--stream')
+    try:
+        completed = subprocess.run(command, cwd=ROOT_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    except subprocess.CalledProcessError as e:
+        raise SystemExit('benchmark case {}x{} failed:\n{}'.format(size, workers, e.stderr.decode(errors='replace')))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return json.loads(completed.stdout.decode().strip().splitlines()[-1])
+
+def case_key(case):
+    return case['tracks'], case['workers'], case['formats'], case['stream']
+
+def compare(results, baseline, tolerance):
+    previous = {case_key(case): case for case in baseline['cases']}
+    regressions = 0
+    for case in results['cases']:
+        old = previous.get(case_key(case))
+        if old is None or not old['tracks_per_minute']:
+            continue
+        ratio = case['tracks_per_minute'] / old['tracks_per_minute']
+        regressed = ratio < 1 - tolerance
+        regressions += regressed
+        sys.stderr.write('{:>4} tracks x {:>2} workers: {:8.2f} -> {:8.2f} tracks/min ({:+.1%}){}\n'.format(
+            case['tracks'], case['workers'], old['tracks_per_minute'], case['tracks_per_minute'], ratio - 1,
+            '  REGRESSION' if regressed else ''))
+    return regressions
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not get_ffmpeg_path():
+        raise SystemExit('ffmpeg executable not found')
+
+    server = start_server(args.duration, args.rate, args.throttle_concurrency, args.error_rate)
+    results = {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'yt_dlp': yt_dlp.version.__version__,
+            'duration': args.duration,
+            'rate': args.rate,
+            'throttle_concurrency': args.throttle_concurrency,
+            'error_rate': args.error_rate,
+            'repeat': args.repeat
+        },
+        'cases': []
+    }
+
+    try:
+        for size in args.sizes:
+            for workers in args.workers:
+                runs = [run_case(playlist_url(server, size), size, workers, args) for _ in range(args.repeat)]
+                failed = [run for run in runs if run['status'] != 'completed']
+                if failed:
+                    raise SystemExit('benchmark case {}x{} did not complete: {}'.format(size, workers, failed[0]['error'] or failed[0]['status']))
+                results['cases'].append({
+                    'tracks': size,
+                    'workers': workers,
+                    'formats': args.formats,
+                    'stream': args.stream,
+                    'segments': args.segments,
+                    'tracks_per_minute': statistics.median(run['tracks_per_minute'] for run in runs),
+                    'first_track_seconds': statistics.median(run['first_track_seconds'] or 0 for run in runs),
+                    'peak_rss_kib': max(run['peak_rss_kib'] or 0 for run in runs) or None,
+                    'rejected': dict(server.rejected),
+                    'runs': runs
+                })
+                sys.stderr.write('{:>4} tracks x {:>2} workers: {:8.2f} tracks/min, first track after {:.2f} s\n'.format(
+                    size, workers, results['cases'][-1]['tracks_per_minute'], results['cases'][-1]['first_track_seconds']))
+                server.rejected = {429: 0, 503: 0}
+    finally:
+        server.shutdown()
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    if args.baseline:
+        with open(args.baseline, 'r') as baseline_file:
+            if compare(results, json.load(baseline_file), args.tolerance):
+                return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+import sys
+import time
+from queue import SimpleQueue
+from threading import Thread
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from yad import core, get_adaptive_concurrency
+
+STAGES = ('expand', 'resolve', 'download', 'convert')
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled', 'ffmpeg_missing')
+
+def timed(stage, function, samples):
+    def wrapper(*args, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            samples[stage].append(time.perf_counter() - started_at)
+    return wrapper
+
+def latency(values):
+    if not values:
+        return None
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'mean': round(sum(values) / len(values), 4),
+        'p50': round(values[len(values) // 2], 4),
+        'p95': round(values[min(len(values) - 1, int(len(values) * 0.95))], 4),
+        'max': round(values[-1], 4)
+    }
+
+def peak_rss_kib(children=False):
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def run_case(url, destination_folder, audio_formats, workers, stream, segments):
+    samples = {stage: [] for stage in STAGES}
+    core.resolve_entry = timed('resolve', core.resolve_entry, samples)
+    core.convert_audio = timed('convert', core.convert_audio, samples)
+    core.stream_audio = timed('convert', core.stream_audio, samples)
+
+    channel = SimpleQueue()
+    started_at = time.perf_counter()
+    download = Thread(target=core.download_audio, args=(url, destination_folder, audio_formats, 1, channel, workers),
+                      kwargs={'use_archive': False, 'use_info_cache': False, 'use_source_cache': False, 'stream': stream, 'segments': segments})
+    download.start()
+
+    events = 0
+    consumer_seconds = 0.0
+    download_started = {}
+    result = {'total': 0, 'converted': 0, 'retries': 0, 'status': None, 'error': None}
+    while result['status'] is None:
+        _, status, index, data = channel.get()
+        handled_at = time.perf_counter()
+        events += 1
+        if status == 'started':
+            result['total'] = data['total']
+            samples['expand'].append(handled_at - started_at)
+        elif status == 'expanded':
+            result['total'] = data['total']
+        elif status == 'downloading':
+            download_started.setdefault(index, handled_at)
+        elif status == 'downloaded' and index in download_started:
+            samples['download'].append(handled_at - download_started[index])
+        elif status == 'retrying':
+            result['retries'] += 1
+        elif status == 'converted':
+            result['converted'] += 1
+            result['first_track'] = result.get('first_track') or handled_at - started_at
+        elif status in TERMINAL_STATUSES:
+            result['status'] = status
+            result['error'] = data if status == 'failed' else None
+        consumer_seconds += time.perf_counter() - handled_at
+    download.join()
+    elapsed = time.perf_counter() - started_at
+
+    return {
+        'status': result['status'],
+        'error': result['error'],
+        'tracks': result['total'],
+        'converted': result['converted'],
+        'retries': result['retries'],
+        'adaptive': get_adaptive_concurrency().stats(),
+        'elapsed': round(elapsed, 4),
+        'first_track_seconds': round(result['first_track'], 4) if result.get('first_track') else None,
+        'tracks_per_minute': round(result['converted'] / elapsed * 60, 2),
+        'stages': {stage: latency(values) for stage, values in samples.items()},
+        'events': events,
+        'events_per_track': round(events / max(1, result['total']), 2),
+        'events_per_second': round(events / elapsed, 2),
+        'consumer_seconds': round(consumer_seconds, 6),
+        'peak_rss_kib': peak_rss_kib(),
+        'peak_child_rss_kib': peak_rss_kib(children=True)
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.case', description='Run one benchmark case and print its measurements as JSON.')
+    parser.add_argument('url')
+    parser.add_argument('destination_folder')
+    parser.add_argument('--formats', default='mp3')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--segments', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    print(json.dumps(run_case(args.url, args.destination_folder, args.formats.split(','), args.workers, args.stream, args.segments)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from yad import get_ffmpeg_path
+from yad.workqueue import open_work_queue
+from .server import start_server
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def int_list(value):
+    return [int(item) for item in value.split(',') if item.strip()]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.distributed', description='Benchmark worker nodes sharing one work queue, all started on this machine.')
+    parser.add_argument('--nodes', type=int_list, default=[1, 2, 4], help='comma-separated numbers of worker nodes')
+    parser.add_argument('--jobs', type=int, default=1, help='jobs every node runs at once')
+    parser.add_argument('--tracks', type=int, default=8, help='single-track URLs put on the queue')
+    parser.add_argument('--duration', type=int, default=30, help='length of every synthetic track in seconds')
+    parser.add_argument('--rate', type=int, default=1024 * 1024, help='bytes per second per connection, 0 for unlimited')
+    parser.add_argument('--formats', default='mp3', help='comma-separated target formats')
+    parser.add_argument('--lease', type=float, default=5.0, help='lease of the worker nodes in seconds')
+    parser.add_argument('--kill-after', type=float, default=0.0, help='kill the first node this many seconds into every run, to measure how its jobs are taken over')
+    parser.add_argument('-o', '--output', help='write the results to this JSON file instead of stdout')
+    return parser.parse_args(argv)
+
+def node_command(queue_path, args):
+    return [sys.executable, '-m', 'yad', '--queue', queue_path, '--work', '--drain', '--jobs', str(args.jobs), '--lease', str(args.lease),
+            '--segments', '1', '--no-info-cache', '--no-source-cache', '--no-journal']
+
+def run_nodes(server, nodes, args):
+    work_dir = tempfile.mkdtemp(prefix='yad-distributed-')
+    queue_path = os.path.join(work_dir, 'queue.sqlite3')
+    output_dir = os.path.join(work_dir, 'output')
+    try:
+        work_queue = open_work_queue(queue_path)
+        for track in range(args.tracks):
+            work_queue.submit('http://{}:{}/yad-bench/track/{}'.format(*server.server_address, track), output_dir, args.formats.split(','), max_workers=1)
+        work_queue.close()
+
+        started_at = time.perf_counter()
+        processes = []
+        for node in range(nodes):
+            # separate caches, as on separate machines; the plugin directory makes the benchmark extractor visible
+            cache_dir = os.path.join(work_dir, 'cache-{}'.format(node))
+            env = dict(os.environ, XDG_CACHE_HOME=cache_dir, LOCALAPPDATA=cache_dir,
+                       PYTHONPATH=os.pathsep.join([ROOT_DIR, BENCHMARK_DIR, os.environ.get('PYTHONPATH', '')]))
+            processes.append(subprocess.Popen(node_command(queue_path, args), cwd=ROOT_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL))
+        killed = None
+        if args.kill_after:
+            try:
+                processes[0].wait(args.kill_after)
+            except subprocess.TimeoutExpired:
+                processes[0].send_signal(getattr(signal, 'SIGKILL', signal.SIGTERM))
+                killed = 0
+        results = []
+        for process in processes:
+            stdout, _ = process.communicate()
+            results.extend(json.loads(line) for line in stdout.decode().splitlines() if line.strip())
+        elapsed = time.perf_counter() - started_at
+
+        work_queue = open_work_queue(queue_path)
+        counts = work_queue.counts()
+        work_queue.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    completed = counts.get('completed', 0)
+    per_node = {}
+    for result in results:
+        if result['type'] == 'result' and result['status'] == 'completed':
+            per_node[result['worker']] = per_node.get(result['worker'], 0) + 1
+    sys.stderr.write('{:>2} nodes: {:6.2f} s, {:7.2f} tracks/min, {} of {} completed{}\n'.format(
+        nodes, elapsed, completed / elapsed * 60, completed, args.tracks, ', node 1 killed' if killed is not None else ''))
+    return {
+        'nodes': nodes,
+        'seconds': round(elapsed, 4),
+        'tracks_per_minute': round(completed / elapsed * 60, 3),
+        'queue': counts,
+        'completed_per_node': sorted(per_node.values(), reverse=True),
+        'killed': killed
+    }
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not get_ffmpeg_path():
+        raise SystemExit('ffmpeg executable not found')
+
+    server = start_server(args.duration, args.rate)
+    try:
+        runs = [run_nodes(server, nodes, args) for nodes in args.nodes]
+    finally:
+        server.shutdown()
+
+    results = {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'tracks': args.tracks,
+            'jobs_per_node': args.jobs,
+            'duration': args.duration,
+            'rate': args.rate,
+            'formats': args.formats,
+            'lease': args.lease,
+            'kill_after': args.kill_after
+        },
+        'runs': runs,
+        'scaling': {str(run['nodes']): round(run['tracks_per_minute'] / runs[0]['tracks_per_minute'], 3) if runs[0]['tracks_per_minute'] else None
+                    for run in runs}
+    }
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    incomplete = [run for run in runs if run['queue'].get('completed', 0) != args.tracks]
+    if incomplete:
+        sys.stderr.write('{} run(s) left jobs unfinished\n'.format(len(incomplete)))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
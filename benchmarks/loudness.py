@@ -0,0 +1,155 @@
+import argparse
+import json
+import math
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+from yad import get_ffmpeg_path
+from yad.ffmpeg import conversion_command, convert_audio, format_list, output_paths, run_ffmpeg, tag_outputs, temp_outputs, commit_outputs
+from yad.loudness import ANALYSIS_OPTIONS, ANALYSIS_RATE, LoudnessMeter, analyse_stream, loudness_tags, normalization_gain
+
+SUMMARY = re.compile(r'Integrated loudness:\s*I:\s*(-?[\d.]+) LUFS.*?Sample peak:\s*Peak:\s*(-?[\d.]+|-inf) dBFS', re.S)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.loudness', description='Benchmark loudness analysis inside the conversion run against a separate ffmpeg pass.')
+    parser.add_argument('--duration', type=int, default=600, help='length of the synthetic recording in seconds')
+    parser.add_argument('--formats', default='mp3', help='comma-separated target formats')
+    parser.add_argument('--mode', choices=('tag', 'normalize'), default='tag', help='write ReplayGain tags or normalize the converted files')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per approach; the median is reported')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed difference in LU from the ebur128 filter of ffmpeg')
+    parser.add_argument('-o', '--output', help='write the results to this JSON file instead of stdout')
+    return parser.parse_args(argv)
+
+def synthetic_recording(path, duration):
+    import numpy as np
+    # noise and a tone under a slow swell, so the gates have quiet and loud passages to tell apart
+    generator = np.random.default_rng(0)
+    with wave.open(path, 'wb') as recording:
+        recording.setnchannels(2)
+        recording.setsampwidth(2)
+        recording.setframerate(ANALYSIS_RATE)
+        for second in range(duration):
+            t = second + np.arange(ANALYSIS_RATE) / ANALYSIS_RATE
+            envelope = 0.02 + 0.5 * np.abs(np.sin(t / 20))
+            mono = envelope * (0.5 * np.sin(2 * np.pi * 220 * t) + 0.15 * generator.standard_normal(ANALYSIS_RATE))
+            samples = np.clip(np.stack((mono, mono * 0.8), axis=1), -1, 1)
+            recording.writeframes((samples * 32767).astype('<i2').tobytes())
+
+def ffmpeg_loudness(ffmpeg_path, path):
+    completed = subprocess.run([ffmpeg_path, '-hide_banner', '-nostats', '-i', path, '-map', '0:a:0', '-af', 'ebur128=peak=sample:framelog=quiet', '-f', 'null', '-'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+    integrated, peak = SUMMARY.search(completed.stderr.decode(errors='replace')).groups()
+    return {'integrated': float(integrated), 'peak': 0.0 if peak == '-inf' else 10 ** (float(peak) / 20)}
+
+def numpy_loudness(ffmpeg_path, path):
+    process = subprocess.Popen([ffmpeg_path, '-loglevel', 'error', '-i', path] + ANALYSIS_OPTIONS + ['pipe:1'], stdout=subprocess.PIPE)
+    try:
+        return analyse_stream(process.stdout, LoudnessMeter())
+    finally:
+        process.stdout.close()
+        process.wait()
+
+def single_pass(ffmpeg_path, source_path, audio_formats, mode):
+    convert_audio(source_path, audio_formats, ffmpeg_path, loudness=mode)
+
+def two_pass(ffmpeg_path, source_path, audio_formats, mode):
+    # what a library tool does after the fact: convert, then decode every file again to measure it
+    paths = output_paths(os.path.splitext(source_path)[0], audio_formats)
+    if mode == 'tag':
+        convert_audio(source_path, audio_formats, ffmpeg_path)
+        for audio_format, path in paths.items():
+            tag_outputs(ffmpeg_path, [(audio_format, path, True)], ffmpeg_loudness(ffmpeg_path, path))
+        return
+    analysis = ffmpeg_loudness(ffmpeg_path, source_path)
+    gain = normalization_gain(analysis)
+    outputs = temp_outputs(paths, ())
+    tags = {audio_format: loudness_tags(analysis, audio_format, gain) for audio_format in audio_formats}
+    run_ffmpeg(conversion_command(ffmpeg_path, source_path, outputs, audio_filter='volume={:.2f}dB'.format(gain), tags=tags), outputs)
+    commit_outputs(paths)
+
+def measure(name, function, ffmpeg_path, recording_path, audio_formats, mode, repeat):
+    runs = []
+    for _ in range(repeat):
+        work_dir = tempfile.mkdtemp(prefix='yad-loudness-')
+        try:
+            # conversion removes its source, so every run gets a fresh copy
+            source_path = os.path.join(work_dir, 'recording.wav')
+            shutil.copyfile(recording_path, source_path)
+            started_at = time.perf_counter()
+            function(ffmpeg_path, source_path, audio_formats, mode)
+            runs.append(time.perf_counter() - started_at)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    seconds = statistics.median(runs)
+    sys.stderr.write('{:>11}: {:7.2f} s\n'.format(name, seconds))
+    return {'name': name, 'seconds': round(seconds, 4), 'runs': [round(run, 4) for run in runs]}
+
+def main(argv=None):
+    args = parse_args(argv)
+    ffmpeg_path = get_ffmpeg_path()
+    if not ffmpeg_path:
+        raise SystemExit('ffmpeg executable not found')
+    audio_formats = format_list(args.formats.split(','))
+
+    work_dir = tempfile.mkdtemp(prefix='yad-loudness-')
+    try:
+        recording_path = os.path.join(work_dir, 'recording.wav')
+        synthetic_recording(recording_path, args.duration)
+        reference = ffmpeg_loudness(ffmpeg_path, recording_path)
+        measured = numpy_loudness(ffmpeg_path, recording_path)
+        approaches = [
+            measure('single pass', single_pass, ffmpeg_path, recording_path, audio_formats, args.mode, args.repeat),
+            measure('two pass', two_pass, ffmpeg_path, recording_path, audio_formats, args.mode, args.repeat)
+        ]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    difference = abs(measured['integrated'] - reference['integrated'])
+    results = {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'duration': args.duration,
+            'formats': audio_formats,
+            'mode': args.mode,
+            'repeat': args.repeat
+        },
+        'loudness': {
+            'numpy': round(measured['integrated'], 3),
+            'ffmpeg': reference['integrated'],
+            'difference': round(difference, 3),
+            'numpy_peak': round(measured['peak'], 6),
+            'ffmpeg_peak': round(reference['peak'], 6)
+        },
+        'approaches': approaches,
+        'speedup': round(approaches[1]['seconds'] / approaches[0]['seconds'], 3),
+        'realtime_factor': round(args.duration / approaches[0]['seconds'], 1)
+    }
+    sys.stderr.write('loudness: {:.2f} LUFS (ffmpeg {:.1f}), single pass {:.2f}x faster\n'.format(
+        measured['integrated'], reference['integrated'], results['speedup']))
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    # ffmpeg prints one decimal, so allow for its rounding on top of the tolerance
+    if math.isnan(difference) or difference > args.tolerance + 0.05:
+        sys.stderr.write('loudness differs from ffmpeg by {:.2f} LU\n'.format(difference))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
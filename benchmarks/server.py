@@ -0,0 +1,132 @@
+import json
+import math
+import random
+import re
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+SAMPLE_WIDTH = 2
+TONE_HZ = 441
+CHUNK_SIZE = 64 * 1024
+
+def synthetic_wav(duration):
+    period = SAMPLE_RATE // TONE_HZ
+    frame = b''.join(
+        struct.pack('<hh', sample, sample)
+        for sample in (int(math.sin(2 * math.pi * i / period) * 12000) for i in range(period)))
+    data = frame * (SAMPLE_RATE * duration // period)
+    header = struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + len(data), b'WAVE', b'fmt ', 16, 1, CHANNELS, SAMPLE_RATE,
+        SAMPLE_RATE * CHANNELS * SAMPLE_WIDTH, CHANNELS * SAMPLE_WIDTH, SAMPLE_WIDTH * 8, b'data', len(data))
+    return header + data
+
+class MediaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        track = re.match(r'^/api/track/(\d+)$', self.path)
+        media = re.match(r'^/media/(\d+)\.wav$', self.path)
+        if track:
+            self.send_track(track.group(1))
+        elif media:
+            self.send_media()
+        else:
+            self.send_error(404)
+
+    def send_track(self, track_id):
+        body = json.dumps({
+            'title': 'Benchmark track {}'.format(track_id),
+            'duration': self.server.duration,
+            'formats': [{
+                'format_id': 'wav',
+                'url': 'http://{}:{}/media/{}.wav'.format(*self.server.server_address, track_id),
+                'ext': 'wav',
+                'acodec': 'pcm_s16le',
+                'vcodec': 'none',
+                'abr': SAMPLE_RATE * CHANNELS * SAMPLE_WIDTH * 8 // 1000,
+                'filesize': len(self.server.media)
+            }]
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_media(self):
+        with self.server.lock:
+            throttled = bool(self.server.max_concurrent and self.server.active >= self.server.max_concurrent)
+            failed = self.server.random.random() < self.server.error_rate
+            if throttled or failed:
+                self.server.rejected[429 if throttled else 503] += 1
+            else:
+                self.server.active += 1
+        if throttled or failed:
+            self.send_response(429 if throttled else 503)
+            self.send_header('Retry-After', '1')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        try:
+            self.stream_media()
+        finally:
+            with self.server.lock:
+                self.server.active -= 1
+
+    def stream_media(self):
+        media = self.server.media
+        start, end = 0, len(media) - 1
+        requested = re.match(r'^bytes=(\d+)-(\d*)$', self.headers.get('Range') or '')
+        if requested and int(requested.group(1)) < len(media):
+            start = int(requested.group(1))
+            end = min(end, int(requested.group(2) or end))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end, len(media)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'audio/wav')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end + 1 - start))
+        self.end_headers()
+
+        rate = self.server.rate
+        started_at = time.monotonic()
+        sent = 0
+        for offset in range(start, end + 1, CHUNK_SIZE):
+            chunk = media[offset:min(offset + CHUNK_SIZE, end + 1)]
+            try:
+                self.wfile.write(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            sent += len(chunk)
+            if rate:
+                delay = sent / rate - (time.monotonic() - started_at)
+                if delay > 0:
+                    time.sleep(delay)
+
+def start_server(duration, rate=0, max_concurrent=0, error_rate=0.0, seed=0):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MediaHandler)
+    server.daemon_threads = True
+    server.duration = duration
+    server.rate = rate
+    server.media = synthetic_wav(duration)
+    server.max_concurrent = max_concurrent
+    server.error_rate = error_rate
+    server.random = random.Random(seed)
+    server.lock = threading.Lock()
+    server.active = 0
+    server.rejected = {429: 0, 503: 0}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def playlist_url(server, size):
+    return 'http://{}:{}/yad-bench/playlist/{}'.format(*server.server_address, size)
@@ -0,0 +1,129 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('yt_dlp', 'http.server', 'urllib.request', 'cProfile', 'pstats', 'numpy')
+
+IMPORT_PROBE = '''
+import json, sys, time
+started_at = time.perf_counter()
+import yad
+print(json.dumps({
+    'seconds': time.perf_counter() - started_at,
+    'heavy_modules': [name for name in %r if name in sys.modules]
+}))
+''' % (HEAVY_MODULES,)
+
+WINDOW_PROBE = '''
+import json, runpy, sys, time
+import tkinter as tk
+started_at = time.perf_counter()
+
+def first_frame(self, n=0):
+    # look before update(): the idle callbacks it runs start the background environment check on purpose
+    heavy_modules = [name for name in %r if name in sys.modules]
+    self.update()
+    print(json.dumps({'seconds': time.perf_counter() - started_at, 'heavy_modules': heavy_modules}))
+    sys.stdout.flush()
+    self.destroy()
+
+tk.Tk.mainloop = first_frame
+try:
+    runpy.run_path(%r, run_name='__main__')
+except tk.TclError as e:
+    print(json.dumps({'skipped': str(e)}))
+''' % (HEAVY_MODULES, os.path.join(ROOT_DIR, 'app.py'))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.startup', description='Benchmark cold start of the yad package and the GUI window.')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per probe; the median is compared')
+    parser.add_argument('-o', '--output', help='write the results to this JSON file instead of stdout')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed startup slowdown against the baseline')
+    return parser.parse_args(argv)
+
+def run_probe(code):
+    work_dir = tempfile.mkdtemp(prefix='yad-startup-')
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR, XDG_CACHE_HOME=os.path.join(work_dir, 'cache'), LOCALAPPDATA=os.path.join(work_dir, 'cache'))
+    started_at = time.perf_counter()
+    try:
+        # run from an empty directory so no config.json of the developer leaks into the measurement
+        completed = subprocess.run([sys.executable, '-c', code], cwd=work_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    except subprocess.CalledProcessError as e:
+        raise SystemExit('startup probe failed:\n{}'.format(e.stderr.decode(errors='replace')))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    result = json.loads(completed.stdout.decode().strip().splitlines()[-1])
+    result['process_seconds'] = time.perf_counter() - started_at
+    return result
+
+def measure(name, code, repeat):
+    runs = [run_probe(code) for _ in range(repeat)]
+    if 'skipped' in runs[0]:
+        sys.stderr.write('{:>7}: skipped ({})\n'.format(name, runs[0]['skipped']))
+        return {'name': name, 'skipped': runs[0]['skipped']}
+    probe = {
+        'name': name,
+        'seconds': statistics.median(run['seconds'] for run in runs),
+        'process_seconds': statistics.median(run['process_seconds'] for run in runs),
+        'heavy_modules': sorted(set(module for run in runs for module in run['heavy_modules'])),
+        'runs': runs
+    }
+    sys.stderr.write('{:>7}: {:7.1f} ms ({:7.1f} ms with interpreter start){}\n'.format(
+        name, probe['seconds'] * 1000, probe['process_seconds'] * 1000,
+        '  eager: ' + ', '.join(probe['heavy_modules']) if probe['heavy_modules'] else ''))
+    return probe
+
+def compare(results, baseline, tolerance):
+    previous = {probe['name']: probe for probe in baseline['probes']}
+    regressions = 0
+    for probe in results['probes']:
+        old = previous.get(probe['name'])
+        if 'skipped' in probe or old is None or 'skipped' in old:
+            continue
+        ratio = probe['seconds'] / old['seconds']
+        regressed = ratio > 1 + tolerance
+        regressions += regressed
+        sys.stderr.write('{:>7}: {:7.1f} -> {:7.1f} ms ({:+.1%}){}\n'.format(
+            probe['name'], old['seconds'] * 1000, probe['seconds'] * 1000, ratio - 1, '  REGRESSION' if regressed else ''))
+    return regressions
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat
+        },
+        'probes': [measure('import', IMPORT_PROBE, args.repeat), measure('window', WINDOW_PROBE, args.repeat)]
+    }
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    eager = [probe for probe in results['probes'] if probe.get('heavy_modules')]
+    if eager:
+        sys.stderr.write('heavy modules are imported before they are needed\n')
+        return 1
+    if args.baseline:
+        with open(args.baseline, 'r') as baseline_file:
+            if compare(results, json.load(baseline_file), args.tolerance):
+                return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
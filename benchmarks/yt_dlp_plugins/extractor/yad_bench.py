@@ -0,0 +1,34 @@
+import functools
+
+from yt_dlp.extractor.common import InfoExtractor
+from yt_dlp.utils import OnDemandPagedList
+
+PAGE_SIZE = 50
+
+class YadBenchPlaylistIE(InfoExtractor):
+    IE_NAME = 'yadbench:playlist'
+    _VALID_URL = r'https?://127\.0\.0\.1:(?P<port>\d+)/yad-bench/playlist/(?P<id>\d+)'
+
+    def _real_extract(self, url):
+        size, port = self._match_valid_url(url).group('id', 'port')
+        # paged like the big sites, so the lazy expansion path is what gets measured
+        entries = OnDemandPagedList(functools.partial(self._fetch_page, port, int(size)), PAGE_SIZE)
+        return self.playlist_result(entries, 'playlist-' + size, 'Benchmark playlist ' + size, playlist_count=int(size))
+
+    def _fetch_page(self, port, size, page):
+        for index in range(page * PAGE_SIZE, min(size, (page + 1) * PAGE_SIZE)):
+            yield self.url_result('http://127.0.0.1:{}/yad-bench/track/{}'.format(port, index), YadBenchTrackIE.ie_key(), str(index))
+
+class YadBenchTrackIE(InfoExtractor):
+    IE_NAME = 'yadbench:track'
+    _VALID_URL = r'https?://127\.0\.0\.1:(?P<port>\d+)/yad-bench/track/(?P<id>\d+)'
+
+    def _real_extract(self, url):
+        track_id, port = self._match_valid_url(url).group('id', 'port')
+        track = self._download_json('http://127.0.0.1:{}/api/track/{}'.format(port, track_id), track_id)
+        return {
+            'id': track_id,
+            'title': track['title'],
+            'duration': track['duration'],
+            'formats': track['formats']
+        }
@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the benchmark directory holds the yt-dlp plugin that resolves the local media server's URLs
+for path in (ROOT_DIR, os.path.join(ROOT_DIR, 'benchmarks')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
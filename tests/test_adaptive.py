@@ -0,0 +1,134 @@
+import time
+import urllib.error
+import urllib.request
+from queue import Queue, SimpleQueue
+from threading import Thread
+
+import pytest
+
+from benchmarks.server import start_server
+from yad import core
+from yad.adaptive import RETRY_ATTEMPTS, AdaptiveConcurrency
+from yad.bandwidth import BandwidthScheduler
+from yad.metrics import JobMetrics, Metrics
+
+@pytest.fixture
+def media_server():
+    servers = []
+
+    def start(**options):
+        server = start_server(1, **options)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def media_url(server, track=0):
+    return 'http://{}:{}/media/{}.wav'.format(*server.server_address, track)
+
+def fetch(controller, url):
+    try:
+        with controller.slot(url):
+            with urllib.request.urlopen(url) as response:
+                response.read()
+    except urllib.error.HTTPError as e:
+        return e.code
+    return 200
+
+def host_stats(controller):
+    return next(iter(controller.stats().values()))
+
+def test_limit_is_cut_on_429_and_raised_again(media_server):
+    # one request at a time, slow enough that the others arrive while it is still running
+    server = media_server(max_concurrent=1, rate=64 * 1024)
+    controller = AdaptiveConcurrency(initial=4, maximum=8)
+    results = []
+    threads = [Thread(target=lambda: results.append(fetch(controller, media_url(server)))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert 429 in results and 200 in results
+    stats = host_stats(controller)
+    assert stats['throttled'] >= 1
+    assert stats['limit'] < 4
+    cut = stats['limit']
+
+    server.rate = 0
+    while server.active:
+        time.sleep(0.01)
+    for _ in range(6):
+        assert fetch(controller, media_url(server)) == 200
+    assert host_stats(controller)['limit'] > cut
+
+def test_limit_is_cut_on_503(media_server):
+    server = media_server(error_rate=1.0)
+    controller = AdaptiveConcurrency(initial=4, maximum=8)
+    assert fetch(controller, media_url(server)) == 503
+    stats = host_stats(controller)
+    assert stats['throttled'] == 1
+    assert stats['limit'] == 2
+
+def make_job(tmp_path):
+    return {
+        'id': 1,
+        'channel': SimpleQueue(),
+        'control': None,
+        'audio_formats': ['mp3'],
+        'stream': False,
+        'segments': 1,
+        'archive': None,
+        'info_cache': None,
+        'source_cache': None,
+        'journal': None,
+        'journal_key': None,
+        'metrics': JobMetrics(Metrics(), 1),
+        'scheduler': BandwidthScheduler(),
+        'adaptive': AdaptiveConcurrency(),
+        'conversion_queue': Queue(),
+        'outtmpl': str(tmp_path / '%(title)s.%(ext)s')
+    }
+
+def make_entry(server):
+    return {'index': 0, 'url': 'http://{}:{}/yad-bench/track/0'.format(*server.server_address), 'archive_id': 'yadbench 0', 'formats': ['mp3']}
+
+def events(job, status):
+    found = []
+    while not job['channel'].empty():
+        event = job['channel'].get()
+        if event[1] == status:
+            found.append(event)
+    return found
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    entry_options = core.entry_options
+    # yt-dlp's own retries would hide the server's errors from download_worker
+    monkeypatch.setattr(core, 'entry_options', lambda entry, job: dict(entry_options(entry, job), retries=0))
+    monkeypatch.setattr(core, 'backoff_delay', lambda attempt, error=None: 0)
+
+def test_download_worker_retries_transient_errors(media_server, tmp_path, no_backoff):
+    # with this seed the server fails the first two media requests and answers the third
+    server = media_server(error_rate=0.5, seed=7)
+    job = make_job(tmp_path)
+    core.download_worker(make_entry(server), job)
+
+    assert server.rejected[503] == 2
+    assert len(events(job, 'retrying')) == 2
+    entry = job['conversion_queue'].get_nowait()
+    assert entry['source_path'].endswith('.wav')
+
+def test_download_worker_gives_up_after_retry_attempts(media_server, tmp_path, no_backoff):
+    server = media_server(error_rate=1.0)
+    job = make_job(tmp_path)
+    with pytest.raises(Exception) as raised:
+        core.download_worker(make_entry(server), job)
+
+    assert '503' in str(raised.value)
+    assert server.rejected[503] == RETRY_ATTEMPTS
+    assert len(events(job, 'retrying')) == RETRY_ATTEMPTS - 1
+    assert job['conversion_queue'].empty()
@@ -0,0 +1,21 @@
+from .config import DEFAULT_MAX_WORKERS, save_config, load_config, load_settings, save_settings
+from .ffmpeg import CONVERSION_OPTIONS, get_ffmpeg_path, get_ffprobe_path, convert_audio
+from .archive import DownloadArchive, open_archive
+from .cache import InfoCache, get_info_cache
+from .sources import SourceCache, get_source_cache
+from .core import JobCancelled, download_audio, progress_hook
+from .playlist import PlaylistExpansion, expand_playlist
+from .segments import SegmentedDownload, download_segments
+from .loudness import LoudnessMeter
+from .fingerprint import FingerprintIndex
+from .jobs import JobControl, JobQueue
+from .journal import JobJournal, get_journal
+from .planner import plan_conversion
+from .metrics import Metrics, JobMetrics, get_metrics
+from .profiling import JobProfiler
+from .bandwidth import BandwidthScheduler, get_bandwidth_scheduler, parse_rate
+from .adaptive import AdaptiveConcurrency, get_adaptive_concurrency
+from .pool import YoutubeDLPool, get_youtubedl_pool
+from .daemon import EventLog, start_service
+from .workqueue import SqliteWorkQueue, WorkerNode, open_work_queue
+from .client import DaemonClient, DaemonError, connect_daemon
@@ -0,0 +1,8 @@
+import sys
+
+if sys.version_info < (3, 9):
+    sys.exit('YAD needs Python 3.9 or newer')
+
+from .cli import main
+
+sys.exit(main())
@@ -0,0 +1,173 @@
+import random
+import re
+import time
+from contextlib import contextmanager
+from threading import Condition, Lock
+
+from .bandwidth import url_host
+from .config import load_settings
+
+# 403 is left out: on signed media URLs it means the URL expired, which a fresh resolve fixes and waiting does not
+THROTTLE_STATUSES = (429, 503)
+EXPIRED_STATUSES = (403, 410)
+RETRY_STATUSES = THROTTLE_STATUSES + (408, 500, 502, 504)
+INITIAL_LIMIT = 2
+MAX_LIMIT = 16
+DECREASE_FACTOR = 0.5
+DECREASE_COOLDOWN = 2.0
+SLOW_THROUGHPUT_RATIO = 0.25
+MIN_THROUGHPUT_SAMPLE_BYTES = 1024 * 1024
+THROUGHPUT_SMOOTHING = 0.2
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+# yt-dlp's retry manager reports the final HTTP error as text only, without the exception behind it
+HTTP_ERROR_MESSAGE = re.compile(r'HTTP Error (\d{3})\b')
+
+def error_chain(error):
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        exc_info = getattr(error, 'exc_info', None)
+        error = (getattr(error, 'cause', None) or error.__cause__ or error.__context__
+                 or (exc_info[1] if isinstance(exc_info, tuple) and len(exc_info) > 1 else None))
+
+def http_status(error):
+    for link in error_chain(error):
+        status = getattr(link, 'status', None) or getattr(link, 'code', None)
+        if isinstance(status, int):
+            return status
+    for link in error_chain(error):
+        match = HTTP_ERROR_MESSAGE.search(str(link))
+        if match:
+            return int(match.group(1))
+    return None
+
+def retry_after(error):
+    for link in error_chain(error):
+        headers = getattr(getattr(link, 'response', None), 'headers', None) or getattr(link, 'headers', None)
+        value = headers.get('Retry-After') if headers is not None else None
+        if value and str(value).strip().isdigit():
+            return float(value)
+    return None
+
+def is_throttled(error):
+    return http_status(error) in THROTTLE_STATUSES
+
+def is_expired(error):
+    return http_status(error) in EXPIRED_STATUSES
+
+def is_transient(error):
+    status = http_status(error)
+    if status is not None:
+        return status in RETRY_STATUSES
+    import yt_dlp
+    return any(isinstance(link, (yt_dlp.networking.exceptions.TransportError, TimeoutError, ConnectionError))
+               for link in error_chain(error))
+
+def backoff_delay(attempt, error=None):
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    requested = retry_after(error) if error is not None else None
+    if requested is not None:
+        delay = max(delay, min(RETRY_MAX_DELAY, requested))
+    return delay
+
+class AdaptiveConcurrency:
+    def __init__(self, initial=INITIAL_LIMIT, maximum=MAX_LIMIT):
+        self.condition = Condition(Lock())
+        self.initial = initial
+        self.maximum = maximum
+        self.hosts = {}
+
+    def set_maximum(self, maximum):
+        with self.condition:
+            self.maximum = maximum or MAX_LIMIT
+            for state in self.hosts.values():
+                state['limit'] = min(state['limit'], self.maximum)
+            self.condition.notify_all()
+
+    def host_state(self, host):
+        return self.hosts.setdefault(host, {
+            'limit': float(min(self.initial, self.maximum)),
+            'in_flight': 0,
+            'throughput': None,
+            'decreased_at': 0.0,
+            'successes': 0,
+            'errors': 0,
+            'throttled': 0
+        })
+
+    @contextmanager
+    def slot(self, url):
+        host = url_host(url)
+        with self.condition:
+            state = self.host_state(host)
+            while state['in_flight'] >= int(state['limit']):
+                self.condition.wait()
+            state['in_flight'] += 1
+
+        started_at = time.monotonic()
+        transfer = {'bytes': 0}
+        try:
+            yield transfer
+        except BaseException as e:
+            self.finish(host, started_at, transfer['bytes'], e)
+            raise
+        self.finish(host, started_at, transfer['bytes'], None)
+
+    def finish(self, host, started_at, transferred, error):
+        elapsed = time.monotonic() - started_at
+        with self.condition:
+            state = self.host_state(host)
+            state['in_flight'] -= 1
+            if error is None:
+                state['successes'] += 1
+                if self.is_slow(state, transferred, elapsed):
+                    self.decrease(state)
+                else:
+                    state['limit'] = min(self.maximum, state['limit'] + 1 / state['limit'])
+            elif is_throttled(error) or is_transient(error):
+                state['errors'] += 1
+                state['throttled'] += is_throttled(error)
+                self.decrease(state)
+            self.condition.notify_all()
+
+    def is_slow(self, state, transferred, elapsed):
+        if transferred < MIN_THROUGHPUT_SAMPLE_BYTES or elapsed <= 0:
+            return False
+        throughput = transferred / elapsed
+        average = state['throughput']
+        state['throughput'] = throughput if average is None else average + THROUGHPUT_SMOOTHING * (throughput - average)
+        return average is not None and throughput < average * SLOW_THROUGHPUT_RATIO
+
+    def decrease(self, state):
+        now = time.monotonic()
+        if now - state['decreased_at'] < DECREASE_COOLDOWN:
+            return
+        state['limit'] = max(1.0, state['limit'] * DECREASE_FACTOR)
+        state['decreased_at'] = now
+
+    def stats(self):
+        with self.condition:
+            return {
+                host: {
+                    'limit': round(state['limit'], 2),
+                    'in_flight': state['in_flight'],
+                    'successes': state['successes'],
+                    'errors': state['errors'],
+                    'throttled': state['throttled'],
+                    'throughput': round(state['throughput']) if state['throughput'] is not None else None
+                }
+                for host, state in self.hosts.items()
+            }
+
+default_controller = None
+default_controller_lock = Lock()
+
+def get_adaptive_concurrency():
+    global default_controller
+    with default_controller_lock:
+        if default_controller is None:
+            default_controller = AdaptiveConcurrency(maximum=load_settings()['host_connections'] or MAX_LIMIT)
+        return default_controller
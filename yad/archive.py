@@ -0,0 +1,104 @@
+import os
+import sqlite3
+import subprocess
+import time
+from threading import Lock
+
+from .ffmpeg import CONVERSION_OPTIONS, conversion_quality
+
+ARCHIVE_FILENAME = '.yad-archive.sqlite3'
+COPY_QUALITY = 'copy'
+
+def archive_id(extractor_key, video_id):
+    if not extractor_key or not video_id:
+        return None
+    return '{} {}'.format(extractor_key.lower(), video_id)
+
+class DownloadArchive:
+    def __init__(self, destination_folder):
+        self.root = os.path.abspath(destination_folder)
+        self.path = os.path.join(self.root, ARCHIVE_FILENAME)
+        self.lock = Lock()
+
+        os.makedirs(self.root, exist_ok=True)
+        self.created = not os.path.exists(self.path)
+        self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS downloads ('
+                'archive_id TEXT NOT NULL, '
+                'format TEXT NOT NULL, '
+                'quality TEXT NOT NULL, '
+                'path TEXT NOT NULL, '
+                'completed_at REAL NOT NULL, '
+                'PRIMARY KEY (archive_id, format, quality))')
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def contains(self, archive_id, audio_format):
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT path FROM downloads WHERE archive_id = ? AND format = ? AND quality IN (?, ?)',
+                (archive_id, audio_format, conversion_quality(audio_format), COPY_QUALITY)).fetchall()
+        return any(os.path.isfile(os.path.join(self.root, row[0])) for row in rows)
+
+    def outputs(self, archive_id):
+        with self.lock:
+            rows = self.connection.execute('SELECT format, path FROM downloads WHERE archive_id = ?', (archive_id,)).fetchall()
+        paths = {audio_format: os.path.join(self.root, path) for audio_format, path in rows}
+        return {audio_format: path for audio_format, path in paths.items() if os.path.isfile(path)}
+
+    def add(self, archive_id, audio_format, path, copied=False):
+        relative_path = os.path.relpath(os.path.abspath(path), self.root)
+        quality = COPY_QUALITY if copied else conversion_quality(audio_format)
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO downloads (archive_id, format, quality, path, completed_at) VALUES (?, ?, ?, ?, ?)',
+                (archive_id, audio_format, quality, relative_path, time.time()))
+
+    def rebuild(self, ffprobe_path):
+        found = []
+        for folder, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                audio_format = os.path.splitext(filename)[1][1:].lower()
+                if audio_format not in CONVERSION_OPTIONS or '.temp.' in filename:
+                    continue
+                path = os.path.join(folder, filename)
+                tagged_id = read_archive_tag(path, ffprobe_path)
+                if tagged_id:
+                    relative_path = os.path.relpath(path, self.root)
+                    found.append((tagged_id, audio_format, conversion_quality(audio_format), relative_path, os.path.getmtime(path)))
+
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM downloads')
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO downloads (archive_id, format, quality, path, completed_at) VALUES (?, ?, ?, ?, ?)',
+                found)
+        return len(found)
+
+def read_archive_tag(path, ffprobe_path):
+    command = [ffprobe_path, '-v', 'error', '-show_entries', 'format_tags=comment', '-of', 'default=noprint_wrappers=1:nokey=1', path]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+    if result.returncode != 0:
+        return None
+    comment = result.stdout.decode('utf-8', 'replace').strip()
+    parts = comment.split(' ', 1)
+    if len(parts) != 2 or not all(parts):
+        return None
+    return comment
+
+def open_archive(destination_folder, ffprobe_path=None, rebuild=False):
+    archive = DownloadArchive(destination_folder)
+    if (rebuild or archive.created) and ffprobe_path:
+        archive.rebuild(ffprobe_path)
+    return archive
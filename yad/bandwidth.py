@@ -0,0 +1,131 @@
+import time
+from contextlib import contextmanager
+from threading import Condition, Lock
+from urllib.parse import urlparse
+
+from .config import load_settings
+
+BURST_SECONDS = 0.25
+MIN_BURST_BYTES = 64 * 1024
+MAX_WAIT_SECONDS = 0.5
+RATE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+def parse_rate(value):
+    value = str(value).strip().upper().rstrip('B').rstrip('I')
+    unit = value[-1:] if value[-1:] in RATE_UNITS else ''
+    return int(float(value[:len(value) - len(unit)] or 0) * RATE_UNITS[unit])
+
+def url_host(url):
+    return urlparse(url or '').hostname or ''
+
+class BandwidthScheduler:
+    def __init__(self, rate=0, host_connections=0):
+        self.condition = Condition(Lock())
+        self.rate = rate
+        self.host_connections = host_connections
+        self.tokens = 0.0
+        self.updated_at = time.monotonic()
+        self.served = {}
+        self.waiting = {}
+        self.connections = {}
+        self.transferred = 0
+        self.throttled_seconds = 0.0
+
+    def set_limits(self, rate=None, host_connections=None):
+        with self.condition:
+            if rate is not None:
+                self.refill()
+                self.rate = max(0, int(rate))
+                self.tokens = min(self.tokens, self.burst())
+            if host_connections is not None:
+                self.host_connections = max(0, int(host_connections))
+            self.condition.notify_all()
+
+    def limits(self):
+        with self.condition:
+            return {'rate': self.rate, 'host_connections': self.host_connections}
+
+    def burst(self):
+        return max(self.rate * BURST_SECONDS, MIN_BURST_BYTES)
+
+    def refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(self.burst(), self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def add_job(self, job_id):
+        with self.condition:
+            # start level with the least served job so a newcomer neither starves nor gets starved
+            self.served.setdefault(job_id, min(self.served.values(), default=0))
+
+    def remove_job(self, job_id):
+        with self.condition:
+            self.served.pop(job_id, None)
+            self.condition.notify_all()
+
+    def has_turn(self, job_id):
+        return self.served.get(job_id, 0) <= min(self.served.get(waiting_id, 0) for waiting_id in self.waiting)
+
+    def consume(self, job_id, amount):
+        if amount <= 0:
+            return
+        with self.condition:
+            self.transferred += amount
+            if not self.rate:
+                return
+
+            started_at = time.monotonic()
+            self.waiting[job_id] = self.waiting.get(job_id, 0) + 1
+            try:
+                while self.rate:
+                    self.refill()
+                    if self.tokens > 0 and self.has_turn(job_id):
+                        self.tokens -= amount
+                        self.served[job_id] = self.served.get(job_id, 0) + amount
+                        break
+                    timeout = -self.tokens / self.rate if self.tokens <= 0 else MAX_WAIT_SECONDS
+                    self.condition.wait(min(MAX_WAIT_SECONDS, max(0.001, timeout)))
+            finally:
+                self.waiting[job_id] -= 1
+                if not self.waiting[job_id]:
+                    del self.waiting[job_id]
+                self.throttled_seconds += time.monotonic() - started_at
+                self.condition.notify_all()
+
+    @contextmanager
+    def connection(self, url):
+        host = url_host(url)
+        with self.condition:
+            while self.host_connections and self.connections.get(host, 0) >= self.host_connections:
+                self.condition.wait()
+            self.connections[host] = self.connections.get(host, 0) + 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.connections[host] -= 1
+                if not self.connections[host]:
+                    del self.connections[host]
+                self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {
+                'rate': self.rate,
+                'host_connections': self.host_connections,
+                'transferred': self.transferred,
+                'throttled_seconds': round(self.throttled_seconds, 3),
+                'open_connections': dict(self.connections)
+            }
+
+default_scheduler = None
+default_scheduler_lock = Lock()
+
+def get_bandwidth_scheduler():
+    global default_scheduler
+    with default_scheduler_lock:
+        if default_scheduler is None:
+            settings = load_settings()
+            default_scheduler = BandwidthScheduler(settings['rate_limit'], settings['host_connections'])
+        return default_scheduler
@@ -0,0 +1,102 @@
+import json
+import os
+import sqlite3
+import time
+from threading import Lock
+
+from .config import get_cache_dir, load_settings
+
+INFO_CACHE_FILENAME = 'info-cache.sqlite3'
+
+class InfoCache:
+    def __init__(self, path, ttl, max_bytes):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS info ('
+                'key TEXT PRIMARY KEY, '
+                'value TEXT NOT NULL, '
+                'size INTEGER NOT NULL, '
+                'created_at REAL NOT NULL, '
+                'accessed_at REAL NOT NULL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS info_accessed_at ON info (accessed_at)')
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.connection.execute('SELECT value, created_at FROM info WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if now - row[1] > self.ttl:
+                self.connection.execute('DELETE FROM info WHERE key = ?', (key,))
+                self.expired += 1
+                self.misses += 1
+                return None
+            self.connection.execute('UPDATE info SET accessed_at = ? WHERE key = ?', (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, info):
+        value = json.dumps(info)
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO info (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                (key, value, len(value), now, now))
+            self.evict()
+
+    def delete(self, key):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM info WHERE key = ?', (key,))
+
+    def evict(self):
+        self.connection.execute('DELETE FROM info WHERE created_at < ?', (time.time() - self.ttl,))
+        total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM info').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.connection.execute('SELECT key, size FROM info ORDER BY accessed_at').fetchall():
+            self.connection.execute('DELETE FROM info WHERE key = ?', (key,))
+            self.evictions += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM info').fetchone()
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'evictions': self.evictions,
+                'entries': entries,
+                'bytes': size
+            }
+
+default_info_cache = None
+default_info_cache_lock = Lock()
+
+def get_info_cache():
+    global default_info_cache
+    with default_info_cache_lock:
+        if default_info_cache is None:
+            settings = load_settings()
+            default_info_cache = InfoCache(os.path.join(get_cache_dir(), INFO_CACHE_FILENAME),
+                                           settings['info_cache_ttl'], settings['info_cache_max_bytes'])
+        return default_info_cache
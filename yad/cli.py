@@ -0,0 +1,346 @@
+import argparse
+import json
+import os
+import signal
+import sqlite3
+import sys
+import time
+from queue import Empty, SimpleQueue
+from threading import Event
+
+from .archive import open_archive
+from .bandwidth import get_bandwidth_scheduler, parse_rate
+from .cache import get_info_cache
+from .client import DaemonClient, DaemonError
+from .config import DEFAULT_MAX_WORKERS, DEFAULT_SETTINGS, load_config, load_settings
+from .daemon import EventLog, start_service
+from .jobs import DEFAULT_MAX_JOBS, JobQueue
+from .journal import get_journal
+from .fingerprint import DEDUPE_MODES
+from .loudness import LOUDNESS_MODES
+from .metrics import get_metrics
+from .pool import get_youtubedl_pool
+from .sources import get_source_cache
+from .workqueue import LEASE_SECONDS, WorkerNode, open_work_queue
+from .ffmpeg import CONVERSION_OPTIONS, get_ffmpeg_path, get_ffprobe_path
+
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled', 'ffmpeg_missing')
+# a duplicate skipped with --dedupe skip leaves no file of its own, so it is not counted as an output
+OUTPUT_COUNTERS = {'copy': 'copied', 'transcode': 'transcoded', 'link': 'linked'}
+
+def read_urls(source):
+    for number, line in enumerate(source, 1):
+        fields = line.split()
+        if not fields or fields[0].startswith('#'):
+            continue
+        try:
+            priority = int(fields[1]) if len(fields) > 1 else 0
+        except ValueError:
+            raise SystemExit('{}, line {}: priority must be an integer, not {!r}'.format(getattr(source, 'name', 'input'), number, fields[1]))
+        yield fields[0], priority
+
+def audio_formats_arg(value):
+    audio_formats = [audio_format.strip().lower() for audio_format in value.split(',') if audio_format.strip()]
+    unknown = [audio_format for audio_format in audio_formats if audio_format not in CONVERSION_OPTIONS]
+    if not audio_formats or unknown:
+        raise argparse.ArgumentTypeError('unsupported format {!r}; choose from {}'.format(
+            ','.join(unknown) or value, ', '.join(sorted(CONVERSION_OPTIONS))))
+    return list(dict.fromkeys(audio_formats))
+
+def parse_args(argv=None):
+    destination_folder, _, _, audio_format, max_workers = load_config()
+    settings = load_settings()
+    parser = argparse.ArgumentParser(prog='python -m yad', description='Download YouTube audio without the GUI and report results as JSON lines.')
+    parser.add_argument('input', nargs='?', help="file with one URL per line, optionally followed by a priority, or '-' to read from stdin (the default unless --resume is given)")
+    parser.add_argument('-o', '--output', default=destination_folder or os.getcwd(), help='destination folder')
+    parser.add_argument('-f', '--format', dest='formats', type=audio_formats_arg, default=[audio_format],
+                        help='comma-separated target formats ({}); every source is fetched and decoded once'.format(', '.join(sorted(CONVERSION_OPTIONS))))
+    parser.add_argument('-j', '--jobs', type=int, default=settings['max_jobs'], help='number of URLs processed at the same time')
+    parser.add_argument('-w', '--workers', type=int, default=max_workers, help='playlist entries downloaded at the same time per URL')
+    parser.add_argument('--progress', action='store_true', help='also emit a line for every progress event')
+    parser.add_argument('--stream', action='store_true', default=settings['download_mode'] == 'stream', help='pipe downloads straight into ffmpeg instead of writing the source file first')
+    parser.add_argument('--segments', type=int, default=settings['download_segments'], help='parallel range requests per large source file (1 to download over a single connection)')
+    parser.add_argument('--loudness', choices=LOUDNESS_MODES, default=settings['loudness'], help='measure EBU R128 loudness while converting and write ReplayGain tags or normalize to -18 LUFS')
+    parser.add_argument('--dedupe', choices=DEDUPE_MODES, default=settings['dedupe'], help='fingerprint downloaded audio and link or skip tracks already in the archive under another upload')
+    parser.add_argument('--no-archive', dest='use_archive', action='store_false', help='do not skip entries already recorded in the download archive')
+    parser.add_argument('--no-info-cache', dest='use_info_cache', action='store_false', help='always resolve playlists and videos again instead of using cached metadata')
+    parser.add_argument('--no-source-cache', dest='use_source_cache', action='store_false', help='do not reuse or keep local copies of downloaded source audio')
+    parser.add_argument('--resume', action='store_true', help='first pick up the jobs left unfinished by an interrupted run')
+    parser.add_argument('--no-journal', dest='use_journal', action='store_false', help='do not record jobs in the on-disk journal')
+    parser.add_argument('--limit-rate', type=parse_rate, default=settings['rate_limit'], help='total download rate shared by all jobs, e.g. 500K or 2M (0 for unlimited)')
+    parser.add_argument('--host-connections', type=int, default=settings['host_connections'], help='open downloads allowed per host (0 for unlimited)')
+    parser.add_argument('--metrics-log', default=settings['metrics_log'] or None, help='append per-stage timings and job summaries to this JSON lines file')
+    parser.add_argument('--metrics-port', type=int, default=settings['metrics_port'], help='serve Prometheus metrics on http://127.0.0.1:PORT/metrics while running')
+    parser.add_argument('--profile', metavar='DIR', help='profile every job with cProfile and tracemalloc and write the reports to DIR')
+    parser.add_argument('--rebuild-archive', action='store_true', help='rebuild the download archive by scanning the output folder first')
+    parser.add_argument('--serve', action='store_true', help='run as a resident download service with a local HTTP/JSON API instead of reading URLs')
+    parser.add_argument('--connect', action='store_true', help='hand the URLs to a running download service instead of downloading in this process')
+    parser.add_argument('--port', type=int, default=settings['daemon_port'], help='port of the download service on 127.0.0.1')
+    parser.add_argument('--queue', default=settings['work_queue'] or None, help='shared work queue (a SQLite file or sqlite://PATH); URLs are added to it instead of downloaded here')
+    parser.add_argument('--work', action='store_true', help='run as a worker node that takes jobs from --queue; --jobs caps the jobs this node runs at once')
+    parser.add_argument('--drain', action='store_true', help='with --work, exit once the queue has no queued or leased jobs left')
+    parser.add_argument('--lease', type=float, default=LEASE_SECONDS, help='seconds a worker node holds a job without a heartbeat before another node may take it over')
+    return parser.parse_args(argv)
+
+def emit(record, output):
+    output.write(json.dumps(record) + '\n')
+    output.flush()
+
+def job_record(url, audio_formats):
+    return {
+        'url': url,
+        'audio_formats': audio_formats,
+        'started_at': None,
+        'total': 0,
+        'downloaded': 0,
+        'from_cache': 0,
+        'converted': 0,
+        'skipped': 0,
+        'duplicates': 0,
+        'metrics': None,
+        'outputs': {audio_format: {'transcoded': 0, 'copied': 0, 'linked': 0} for audio_format in audio_formats}
+    }
+
+def download_options(args):
+    return {'use_archive': args.use_archive, 'use_info_cache': args.use_info_cache, 'stream': args.stream, 'use_source_cache': args.use_source_cache, 'profile_dir': args.profile, 'segments': args.segments, 'loudness': args.loudness, 'dedupe': args.dedupe}
+
+def run(urls, destination_folder, audio_formats, jobs=DEFAULT_MAX_JOBS, max_workers=DEFAULT_MAX_WORKERS, output=sys.stdout, progress=False, use_archive=True, rebuild_archive=False, use_info_cache=True, stream=False, use_source_cache=True, use_journal=True, resume=False, profile_dir=None, connect=None, segments=DEFAULT_SETTINGS['download_segments'], loudness=DEFAULT_SETTINGS['loudness'], dedupe=DEFAULT_SETTINGS['dedupe']):
+    if use_archive and rebuild_archive:
+        with open_archive(destination_folder, get_ffprobe_path(), rebuild=True):
+            pass
+
+    options = {'use_archive': use_archive, 'use_info_cache': use_info_cache, 'stream': stream, 'use_source_cache': use_source_cache, 'profile_dir': profile_dir, 'segments': segments, 'loudness': loudness, 'dedupe': dedupe}
+    channel = SimpleQueue()
+    if connect:
+        job_queue = DaemonClient('http://127.0.0.1:{}'.format(connect), channel)
+    else:
+        job_queue = JobQueue(channel, jobs, options, get_journal() if use_journal else None)
+    pending = {}
+    failed = 0
+
+    if resume:
+        restored = job_queue.restore()
+        for job in job_queue.snapshot():
+            if job['id'] in restored:
+                pending[job['id']] = job_record(job['url'], job['audio_formats'])
+
+    for url, priority in urls:
+        job_id = job_queue.submit(url, destination_folder, audio_formats, priority, max_workers)
+        if job_id is None:
+            emit({'type': 'result', 'job': None, 'url': url, 'status': 'duplicate'}, output)
+            continue
+        pending[job_id] = job_record(url, audio_formats)
+
+    while pending:
+        job_id, status, index, data = channel.get()
+        job = pending[job_id]
+        if job['started_at'] is None:
+            job['started_at'] = time.monotonic()
+
+        if status in ('started', 'expanded'):
+            job['total'] = data['total']
+        elif status == 'downloaded':
+            job['downloaded'] += 1
+            if data and data.get('source') == 'cache':
+                job['from_cache'] += 1
+        elif status == 'converted':
+            job['converted'] += 1
+            if data.get('duplicate_of'):
+                job['duplicates'] += 1
+            for audio_format, method in data['methods'].items():
+                if method in OUTPUT_COUNTERS:
+                    job['outputs'][audio_format][OUTPUT_COUNTERS[method]] += 1
+        elif status == 'skipped':
+            job['skipped'] += 1
+        elif status == 'completed':
+            job['metrics'] = data['metrics']
+
+        if status in TERMINAL_STATUSES:
+            del pending[job_id]
+            error = None
+            if status == 'failed':
+                error = data
+            elif status == 'ffmpeg_missing':
+                error = 'ffmpeg executable not found'
+            if error is not None:
+                failed += 1
+            emit({
+                'type': 'result',
+                'job': job_id,
+                'url': job['url'],
+                'status': 'failed' if error is not None else status,
+                'formats': job['audio_formats'],
+                'entries': job['total'],
+                'downloaded': job['downloaded'],
+                'from_cache': job['from_cache'],
+                'converted': job['converted'],
+                'skipped': job['skipped'],
+                'duplicates': job['duplicates'],
+                'outputs': job['outputs'],
+                'elapsed': round(time.monotonic() - job['started_at'], 3),
+                'metrics': job['metrics'],
+                'error': error
+            }, output)
+        elif progress:
+            record = {'type': 'progress', 'job': job_id, 'url': job['url'], 'event': status, 'index': index}
+            if isinstance(data, dict):
+                record.update(data)
+            emit(record, output)
+
+    job_queue.wait()
+    job_queue.shutdown()
+
+    summary = {'type': 'summary'}
+    if connect:
+        summary.update(job_queue.stats())
+        emit(summary, output)
+        return failed
+    if use_info_cache:
+        summary['info_cache'] = get_info_cache().stats()
+    if use_source_cache:
+        summary['source_cache'] = get_source_cache().stats()
+    summary['bandwidth'] = get_bandwidth_scheduler().stats()
+    emit(summary, output)
+    return failed
+
+def reload_limits(scheduler):
+    settings = load_settings()
+    scheduler.set_limits(settings['rate_limit'], settings['host_connections'])
+
+def serve_forever(args, output=sys.stdout):
+    events = EventLog()
+    job_queue = JobQueue(events, args.jobs, download_options(args), get_journal() if args.use_journal else None)
+    try:
+        server = start_service(job_queue, events, args.port)
+    except OSError as e:
+        raise SystemExit('cannot listen on 127.0.0.1:{}: {}'.format(args.port, e))
+    job_queue.restore()
+    # pay for the yt-dlp import, extractor setup and ffmpeg lookup now instead of on the first request
+    get_youtubedl_pool().warm()
+    get_ffmpeg_path()
+    emit({'type': 'listening', 'url': 'http://127.0.0.1:{}'.format(server.server_address[1]), 'pid': os.getpid()}, output)
+
+    stopped = Event()
+    for name in ('SIGINT', 'SIGTERM'):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), lambda signum, frame: stopped.set())
+    while not stopped.wait(1):
+        pass
+
+    server.shutdown()
+    server.server_close()
+    job_queue.shutdown()
+    get_youtubedl_pool().close()
+    return 0
+
+def submit_to_queue(urls, args, output=sys.stdout):
+    work_queue = connect_work_queue(args.queue)
+    try:
+        for url, priority in urls:
+            job_key = work_queue.submit(url, args.output, args.formats, priority, args.workers)
+            emit({'type': 'queued', 'job': job_key, 'url': url, 'status': 'queued' if job_key is not None else 'duplicate'}, output)
+        emit(dict({'type': 'summary'}, queue=work_queue.counts()), output)
+    finally:
+        work_queue.close()
+    return 0
+
+def connect_work_queue(location):
+    try:
+        return open_work_queue(location)
+    except (ValueError, OSError, sqlite3.Error) as e:
+        raise SystemExit('cannot open work queue {}: {}'.format(location, e))
+
+def work(args, output=sys.stdout):
+    # a node that cannot convert would claim every job only to fail it
+    if not get_ffmpeg_path():
+        raise SystemExit('ffmpeg executable not found')
+    work_queue = connect_work_queue(args.queue)
+    channel = SimpleQueue()
+    node = WorkerNode(work_queue, channel, args.jobs, download_options(args), lease_seconds=args.lease, drain=args.drain)
+    stopped = Event()
+    for name in ('SIGINT', 'SIGTERM'):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), lambda signum, frame: stopped.set())
+    node.start()
+    emit({'type': 'worker', 'worker': node.worker_id, 'queue': args.queue, 'jobs': args.jobs, 'pid': os.getpid()}, output)
+
+    urls = {}
+    failed = 0
+    while node.alive() or not channel.empty():
+        if stopped.is_set() and not node.stopping.is_set():
+            # running jobs are handed back to the queue, so another node picks them up without waiting for the lease to run out
+            node.stop()
+        try:
+            job_key, status, index, data = channel.get(timeout=1)
+        except Empty:
+            continue
+        if status == 'started':
+            job = node.running_job(job_key)
+            urls[job_key] = job['url'] if job is not None else None
+        if status in TERMINAL_STATUSES:
+            error = data if status == 'failed' else 'ffmpeg executable not found' if status == 'ffmpeg_missing' else None
+            failed += error is not None
+            emit({
+                'type': 'result',
+                'job': job_key,
+                'url': urls.pop(job_key, None) or (node.running_job(job_key) or {}).get('url'),
+                'worker': node.worker_id,
+                'status': 'failed' if error is not None else status,
+                'metrics': data['metrics'] if status == 'completed' else None,
+                'error': error
+            }, output)
+        elif args.progress:
+            record = {'type': 'progress', 'job': job_key, 'url': urls.get(job_key), 'event': status, 'index': index}
+            if isinstance(data, dict):
+                record.update(data)
+            emit(record, output)
+
+    node.wait()
+    emit({'type': 'summary', 'worker': node.worker_id, 'queue': work_queue.counts(), 'bandwidth': get_bandwidth_scheduler().stats()}, output)
+    work_queue.close()
+    get_youtubedl_pool().close()
+    return 1 if failed else 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    scheduler = get_bandwidth_scheduler()
+    scheduler.set_limits(args.limit_rate, args.host_connections)
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda signum, frame: reload_limits(scheduler))
+    metrics = get_metrics()
+    if args.metrics_log:
+        metrics.open_log(args.metrics_log)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    if args.serve:
+        status = serve_forever(args)
+        metrics.close()
+        return status
+    if args.work:
+        if not args.queue:
+            raise SystemExit('--work needs a shared queue: pass --queue or set work_queue in config.json')
+        status = work(args)
+        metrics.close()
+        return status
+    if args.input is None and args.resume:
+        urls = []
+    elif args.input in (None, '-'):
+        urls = list(read_urls(sys.stdin))
+    else:
+        with open(args.input, 'r', encoding='utf-8') as url_file:
+            urls = list(read_urls(url_file))
+
+    if args.queue:
+        status = submit_to_queue(urls, args)
+        metrics.close()
+        return status
+
+    try:
+        failed = run(urls, args.output, args.formats, args.jobs, args.workers, progress=args.progress,
+                     use_archive=args.use_archive, rebuild_archive=args.rebuild_archive, use_info_cache=args.use_info_cache, stream=args.stream,
+                     use_source_cache=args.use_source_cache, use_journal=args.use_journal, resume=args.resume,
+                     profile_dir=args.profile, connect=args.port if args.connect else None, segments=args.segments, loudness=args.loudness, dedupe=args.dedupe)
+    except DaemonError as e:
+        raise SystemExit(str(e))
+    metrics.close()
+    return 1 if failed else 0
@@ -0,0 +1,161 @@
+import json
+import os
+from collections import OrderedDict, deque
+from threading import Condition, Lock, Thread
+
+from .config import DEFAULT_MAX_WORKERS
+from .ffmpeg import format_list
+
+REQUEST_TIMEOUT = 10
+CONNECT_TIMEOUT = 1
+# longer than the service heartbeat, so only a dead service trips it
+EVENT_TIMEOUT = 60
+BUFFERED_JOBS = 256
+BUFFERED_EVENTS_PER_JOB = 1000
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled', 'ffmpeg_missing')
+UNFINISHED_STATES = ('queued', 'running', 'paused')
+
+class DaemonError(Exception):
+    pass
+
+class DaemonClient:
+    def __init__(self, base_url, channel, timeout=REQUEST_TIMEOUT):
+        import urllib.request
+        self.base_url = base_url.rstrip('/')
+        self.channel = channel
+        self.timeout = timeout
+        # the service only listens on localhost, so a configured HTTP proxy must never be used
+        self.opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+        self.condition = Condition(Lock())
+        self.own = set()
+        self.finished = set()
+        self.buffered = OrderedDict()
+        self.stopping = False
+        self.health = self.request('GET', '/health', timeout=CONNECT_TIMEOUT)
+        self.reader = Thread(target=self.read_events, daemon=True)
+        self.reader.start()
+
+    def request(self, method, path, body=None, timeout=None):
+        import urllib.error
+        import urllib.request
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method, headers={'Content-Type': 'application/json'})
+        try:
+            with self.opener.open(request, timeout=timeout or self.timeout) as response:
+                return json.loads(response.read() or b'null')
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read())['error']
+            except (ValueError, KeyError, TypeError):
+                message = str(e)
+            if e.code == 404 and message == 'no such job':
+                raise KeyError(path)
+            raise DaemonError(message)
+        except (urllib.error.URLError, OSError) as e:
+            raise DaemonError('download service at {} is not reachable: {}'.format(self.base_url, e))
+
+    def read_events(self):
+        error = None
+        try:
+            # replay from the start: events of a job can arrive before submit() has returned its id
+            response = self.opener.open(self.base_url + '/events?since=0', timeout=EVENT_TIMEOUT)
+            for line in response:
+                if line.strip():
+                    self.dispatch(json.loads(line))
+        except (OSError, ValueError) as e:
+            error = e
+        with self.condition:
+            if self.stopping:
+                return
+            for job_id in sorted(self.own - self.finished):
+                self.forward({'job': job_id, 'status': 'failed', 'index': None,
+                              'data': 'lost connection to the download service: {}'.format(error or 'closed')})
+            self.condition.notify_all()
+
+    def dispatch(self, event):
+        with self.condition:
+            if event['job'] in self.own:
+                self.forward(event)
+                return
+            events = self.buffered.pop(event['job'], None) or deque(maxlen=BUFFERED_EVENTS_PER_JOB)
+            events.append(event)
+            self.buffered[event['job']] = events
+            while len(self.buffered) > BUFFERED_JOBS:
+                self.buffered.popitem(last=False)
+
+    def forward(self, event):
+        # called with the condition held, which keeps replayed and live events of a job in order
+        self.channel.put((event['job'], event['status'], event['index'], event['data']))
+        if event['status'] in FINISHED_STATUSES:
+            self.finished.add(event['job'])
+            self.condition.notify_all()
+
+    def adopt(self, job_id):
+        with self.condition:
+            self.own.add(job_id)
+            for event in self.buffered.pop(job_id, ()):
+                self.forward(event)
+
+    def submit(self, url, destination_folder, audio_formats, priority=0, max_workers=DEFAULT_MAX_WORKERS):
+        job = self.request('POST', '/jobs', {
+            'url': url,
+            'destination_folder': os.path.abspath(destination_folder),
+            'formats': format_list(audio_formats),
+            'priority': priority,
+            'max_workers': max_workers
+        })['jobs'][0]
+        if job['id'] is not None:
+            self.adopt(job['id'])
+        return job['id']
+
+    def restore(self):
+        # the service restores its own journal at startup; a client picks up whatever is still unfinished there
+        job_ids = [job['id'] for job in self.snapshot() if job['state'] in UNFINISHED_STATES]
+        for job_id in job_ids:
+            self.adopt(job_id)
+        return job_ids
+
+    def snapshot(self):
+        return self.request('GET', '/jobs')['jobs']
+
+    def state(self, job_id):
+        return self.request('GET', '/jobs/{}'.format(job_id))['state']
+
+    def pause(self, job_id):
+        self.request('POST', '/jobs/{}/pause'.format(job_id), {})
+
+    def resume(self, job_id):
+        self.request('POST', '/jobs/{}/resume'.format(job_id), {})
+
+    def cancel(self, job_id):
+        self.request('POST', '/jobs/{}/cancel'.format(job_id), {})
+
+    def set_priority(self, job_id, priority):
+        self.request('POST', '/jobs/{}/priority'.format(job_id), {'priority': priority})
+
+    def set_limits(self, rate=None, host_connections=None):
+        return self.request('POST', '/limits', {'rate': rate, 'host_connections': host_connections})
+
+    def stats(self):
+        return self.request('GET', '/stats')
+
+    def wait(self):
+        with self.condition:
+            while not self.own <= self.finished and self.reader.is_alive():
+                self.condition.wait(1)
+
+    def shutdown(self, cancel=False):
+        if cancel:
+            for job_id in self.own - self.finished:
+                self.cancel(job_id)
+        # the event reader is a daemon thread; closing its response here would block until the next heartbeat
+        with self.condition:
+            self.stopping = True
+
+def connect_daemon(port, channel):
+    if not port:
+        return None
+    try:
+        return DaemonClient('http://127.0.0.1:{}'.format(port), channel)
+    except DaemonError:
+        return None
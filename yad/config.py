@@ -0,0 +1,66 @@
+import os
+import json
+
+DEFAULT_MAX_WORKERS = 4
+
+DEFAULT_SETTINGS = {
+    'max_jobs': 2,
+    'info_cache_ttl': 3600,
+    'info_cache_max_bytes': 64 * 1024 * 1024,
+    'download_mode': 'file',
+    'download_segments': 4,
+    'loudness': 'off',
+    'dedupe': 'off',
+    'source_cache_max_bytes': 2 * 1024 * 1024 * 1024,
+    'metrics_log': '',
+    'metrics_port': 0,
+    'rate_limit': 0,
+    'host_connections': 6,
+    'daemon_port': 8750,
+    'work_queue': ''
+}
+
+def read_config_file():
+    if os.path.exists('config.json'):
+        with open('config.json', 'r') as config_file:
+            return json.load(config_file)
+    return {}
+
+def write_config_file(values):
+    config = read_config_file()
+    config.update(values)
+    with open('config.json', 'w') as config_file:
+        json.dump(config, config_file)
+
+def save_config(destination_folder, language, dark_mode, audio_format, max_workers=DEFAULT_MAX_WORKERS):
+    write_config_file({
+        'destination_folder': destination_folder,
+        'language': language,
+        'dark_mode': dark_mode,
+        'format': audio_format,
+        'max_workers': max_workers
+    })
+
+def save_settings(**values):
+    write_config_file({key: value for key, value in values.items() if key in DEFAULT_SETTINGS})
+
+def load_config():
+    if os.path.exists('config.json'):
+        with open('config.json', 'r') as config_file:
+            config = json.load(config_file)
+            return (config.get('destination_folder', ''), 
+                    config.get('language', 'ENG'), 
+                    config.get('dark_mode', False), 
+                    config.get('format', 'wav'),
+                    config.get('max_workers', DEFAULT_MAX_WORKERS))
+    return ('', 'ENG', False, 'wav', DEFAULT_MAX_WORKERS)
+
+def load_settings():
+    settings = dict(DEFAULT_SETTINGS)
+    config = read_config_file()
+    settings.update((key, config[key]) for key in DEFAULT_SETTINGS if key in config)
+    return settings
+
+def get_cache_dir():
+    base_dir = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base_dir, 'yad')
@@ -0,0 +1,475 @@
+import os
+import time
+from threading import Thread, Lock
+from queue import Queue
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait as wait_for_futures
+from itertools import islice
+
+from .adaptive import RETRY_ATTEMPTS, backoff_delay, get_adaptive_concurrency, is_expired, is_throttled, is_transient
+from .archive import archive_id, open_archive
+from .bandwidth import get_bandwidth_scheduler
+from .cache import get_info_cache
+from .config import DEFAULT_MAX_WORKERS, DEFAULT_SETTINGS
+from .ffmpeg import format_list, get_ffmpeg_path, get_ffprobe_path, convert_audio, output_paths, stream_audio, temp_output_path
+from .fingerprint import DEDUPE_MODES, FingerprintIndex, fingerprint_file
+from .journal import entry_key
+from .loudness import LOUDNESS_MODES, numpy_available
+from .metrics import JobMetrics, get_metrics
+from .planner import TRANSCODE_FORMAT, conversion_methods, plan_conversion
+from .playlist import PlaylistExpansion, video_cache_key
+from .pool import get_youtubedl_pool
+from .profiling import JobProfiler
+from .segments import download_segments, segment_count
+from .sources import get_source_cache, link_or_copy, source_key, tee_to_cache
+from .streaming import STREAM_FORMAT, StreamError, is_streamable, stream_to
+
+CONVERSION_QUEUE_SIZE = 8
+EXPANSION_BATCH_SIZE = 50
+# entries handed to the download pool ahead of the workers, per worker
+IN_FLIGHT_PER_WORKER = 2
+
+class JobCancelled(Exception):
+    pass
+
+def url_archive_id(url):
+    import yt_dlp
+    for ie in yt_dlp.extractor.gen_extractor_classes():
+        if ie.ie_key() != 'Generic' and ie.suitable(url):
+            return archive_id(ie.ie_key(), ie.get_temp_id(url))
+    return None
+
+def playlist_outtmpl(destination_folder, playlist_title):
+    if playlist_title is None:
+        return os.path.join(destination_folder, '%(playlist)s/%(title)s.%(ext)s')
+    import yt_dlp
+    playlist_folder = yt_dlp.utils.sanitize_filename(playlist_title).replace('%', '%%')
+    return os.path.join(destination_folder, playlist_folder, '%(title)s.%(ext)s')
+
+def report(job, status, index=None, data=None):
+    job['channel'].put((job['id'], status, index, data))
+
+def record(job, entry, state, error=None):
+    if job['journal'] is not None:
+        job['journal'].set_entry_state(job['journal_key'], entry, state, error)
+
+def checkpoint(job):
+    if job['control'] is not None:
+        job['control'].checkpoint()
+
+def downloaded_path(ydl, info):
+    requested = info.get('requested_downloads') or [{}]
+    return requested[0].get('filepath') or ydl.prepare_filename(info)
+
+def entry_options(entry, job):
+    return {
+        'format': TRANSCODE_FORMAT,
+        'outtmpl': job['outtmpl'],
+        'progress_hooks': [progress_hook(entry['index'], job['id'], job['channel'], job['control'], job['metrics'], job['scheduler'])],
+        'logtostderr': True,
+        'continuedl': True,
+        'noplaylist': True,
+        'concurrent_fragment_downloads': max(1, job['segments'])
+    }
+
+def resolve_entry(ydl, entry, job, refresh=False):
+    info_cache = job['info_cache']
+    key = video_cache_key(entry['url'], entry['archive_id'])
+    if info_cache is not None and not refresh:
+        info = info_cache.get(key)
+        if info is not None:
+            return info, True
+
+    with job['adaptive'].slot(entry['url']), job['metrics'].stage('resolve', entry['index']):
+        info = ydl.sanitize_info(ydl.extract_info(entry['url'], download=False), remove_private_keys=True)
+    if info_cache is not None:
+        info_cache.put(key, info)
+    return info, False
+
+def entry_metadata(entry):
+    return {'comment': entry['archive_id']} if entry['archive_id'] else None
+
+def stream_entry(ydl, info, entry, job, key):
+    base_path = os.path.splitext(ydl.prepare_filename(info))[0]
+    os.makedirs(os.path.dirname(os.path.abspath(base_path)), exist_ok=True)
+    hook = ydl.params['progress_hooks'][0]
+
+    def convert(chunks):
+        if key is not None:
+            chunks = tee_to_cache(chunks, job['source_cache'].writer(key, info.get('ext') or ''))
+        usage = {}
+        output_paths = stream_audio(chunks, base_path, entry['formats'], job['ffmpeg_path'], entry_metadata(entry), entry['plan']['copy'], usage, job['loudness'])
+        record_usage(job, entry, usage)
+        return output_paths
+
+    report(job, 'processing', entry['index'])
+    with job['adaptive'].slot(info.get('url')), job['scheduler'].connection(info.get('url')), job['metrics'].stage('stream', entry['index']):
+        return stream_to(convert, ydl, info, hook)
+
+def record_usage(job, entry, usage):
+    if 'cpu_seconds' in usage:
+        job['metrics'].add_ffmpeg_cpu(usage['cpu_seconds'])
+    if 'move_seconds' in usage:
+        job['metrics'].add_stage('move', usage['move_seconds'], entry['index'])
+    if 'analysis_seconds' in usage:
+        job['metrics'].add_stage('loudness', usage['analysis_seconds'], entry['index'])
+
+def process_entry(ydl, info, entry, job):
+    entry['plan'] = plan = plan_conversion(info, entry['formats'])
+    ydl.format_selector = ydl.build_format_selector(plan['format'] if plan['copy'] or not job['stream'] else STREAM_FORMAT)
+    selected = ydl.process_ie_result(dict(info), download=False)
+    key = source_key(entry['archive_id'], selected.get('format_id')) if job['source_cache'] is not None else None
+
+    if key is not None:
+        source_path = ydl.prepare_filename(selected)
+        with job['metrics'].stage('cache', entry['index']):
+            fetched = job['source_cache'].fetch(key, source_path)
+        if fetched:
+            entry['source_path'] = source_path
+            report(job, 'downloaded', entry['index'], {'source': 'cache'})
+            record(job, entry, 'converting')
+            job['conversion_queue'].put(entry)
+            return
+
+    if job['stream'] and is_streamable(selected):
+        finish_entry(entry, job, stream_entry(ydl, selected, entry, job, key))
+        return
+
+    download_url = selected.get('url') or entry['url']
+    entry['source_path'] = download_segmented(ydl, selected, entry, job)
+    if entry['source_path'] is None:
+        with job['adaptive'].slot(download_url) as transfer, job['scheduler'].connection(download_url), job['metrics'].stage('download', entry['index']):
+            entry['source_path'] = downloaded_path(ydl, ydl.process_ie_result(info, download=True))
+            transfer['bytes'] = os.path.getsize(entry['source_path']) if os.path.exists(entry['source_path']) else 0
+    if key is not None:
+        try:
+            with job['metrics'].stage('cache', entry['index']):
+                job['source_cache'].store(key, entry['source_path'], selected.get('ext') or '')
+        except OSError:
+            pass
+    record(job, entry, 'converting')
+    job['conversion_queue'].put(entry)
+
+def download_segmented(ydl, info, entry, job):
+    count = segment_count(info, job['segments'])
+    if count < 2:
+        return None
+    # the file counts as one download for the adaptive limit, but every segment takes its own connection under the host cap
+    with job['adaptive'].slot(info['url']) as transfer, job['metrics'].stage('download', entry['index']):
+        path = download_segments(ydl, info, ydl.prepare_filename(info), count, ydl.params['progress_hooks'][0], job['scheduler'].connection)
+        transfer['bytes'] = os.path.getsize(path) if path is not None else 0
+    return path
+
+def download_entry(entry, job):
+    import yt_dlp
+    with get_youtubedl_pool().lease(entry_options(entry, job)) as ydl:
+        info, cached = resolve_entry(ydl, entry, job)
+        try:
+            process_entry(ydl, info, entry, job)
+        except (yt_dlp.utils.DownloadError, yt_dlp.networking.exceptions.HTTPError, StreamError) as e:
+            # cached info may hold media URLs that have expired since; anything but throttling is worth one fresh resolve
+            if not (cached or is_expired(e)) or is_throttled(e):
+                raise
+            job['metrics'].add_retry('stale_info', entry['index'])
+            info, _ = resolve_entry(ydl, entry, job, refresh=True)
+            process_entry(ydl, info, entry, job)
+
+def download_worker(entry, job):
+    attempt = 0
+    while True:
+        checkpoint(job)
+        record(job, entry, 'downloading')
+        try:
+            download_entry(entry, job)
+            return
+        except JobCancelled:
+            raise
+        except Exception as e:
+            attempt += 1
+            if attempt >= RETRY_ATTEMPTS or not (is_throttled(e) or is_transient(e)):
+                raise
+            delay = backoff_delay(attempt - 1, e)
+            job['metrics'].add_retry('throttled' if is_throttled(e) else 'transient', entry['index'])
+            report(job, 'retrying', entry['index'], {'attempt': attempt, 'delay': round(delay, 1), 'error': str(e)})
+            wait(job, delay)
+
+def wait(job, seconds):
+    if job['control'] is not None:
+        job['control'].cancel_event.wait(seconds)
+    else:
+        time.sleep(seconds)
+
+def finish_entry(entry, job, output_paths):
+    methods = conversion_methods(entry['plan'], entry['formats'])
+    if job['archive'] is not None and entry['archive_id']:
+        for audio_format, output_path in output_paths.items():
+            job['archive'].add(entry['archive_id'], audio_format, output_path, methods[audio_format] == 'copy')
+    record(job, entry, 'done')
+    job['metrics'].add_entry('converted')
+    report(job, 'converted', entry['index'], {'methods': methods})
+
+def conversion_worker(job):
+    while True:
+        entry = job['conversion_queue'].get()
+        if entry is None:
+            return
+        if job['control'] is not None and job['control'].cancelled:
+            continue
+        report(job, 'processing', entry['index'])
+        try:
+            fingerprint = None
+            if job['fingerprints'] is not None and entry['archive_id']:
+                fingerprint = deduplicate(entry, job)
+                if fingerprint is None:
+                    continue
+            usage = {}
+            started_at = time.monotonic()
+            converted_paths = convert_audio(entry['source_path'], entry['formats'], job['ffmpeg_path'], entry_metadata(entry), entry['plan']['copy'], usage, job['loudness'])
+            job['metrics'].add_stage('convert', time.monotonic() - started_at - usage.get('move_seconds', 0), entry['index'])
+            record_usage(job, entry, usage)
+            finish_entry(entry, job, converted_paths)
+            if fingerprint is not None:
+                job['fingerprints'].add(entry['archive_id'], fingerprint)
+        except Exception as e:
+            record(job, entry, 'failed', str(e))
+            job['metrics'].add_entry('failed')
+            add_error(job, e)
+
+def deduplicate(entry, job):
+    # returns the fingerprint to index once the entry is converted, or None when the entry was a duplicate and is done
+    with job['metrics'].stage('fingerprint', entry['index']):
+        fingerprint = fingerprint_file(entry['source_path'], job['ffmpeg_path'])
+        match = job['fingerprints'].find(fingerprint, exclude=entry['archive_id'])
+    originals = job['archive'].outputs(match['archive_id']) if match is not None else {}
+    if not all(audio_format in originals for audio_format in entry['formats']):
+        return fingerprint
+
+    if job['dedupe'] == 'link':
+        paths = output_paths(os.path.splitext(entry['source_path'])[0], entry['formats'])
+        for audio_format, path in paths.items():
+            if os.path.abspath(path) != os.path.abspath(originals[audio_format]):
+                link_or_copy(originals[audio_format], temp_output_path(path))
+                os.replace(temp_output_path(path), path)
+    else:
+        paths = {audio_format: originals[audio_format] for audio_format in entry['formats']}
+    kept = {os.path.abspath(path) for path in list(paths.values()) + list(originals.values())}
+    if os.path.abspath(entry['source_path']) not in kept:
+        os.remove(entry['source_path'])
+
+    for audio_format, path in paths.items():
+        job['archive'].add(entry['archive_id'], audio_format, path)
+    record(job, entry, 'done')
+    job['metrics'].add_entry('duplicate')
+    report(job, 'converted', entry['index'], {
+        'methods': {audio_format: job['dedupe'] for audio_format in entry['formats']},
+        'duplicate_of': match['archive_id'],
+        'bit_error_rate': match['bit_error_rate']
+    })
+    return None
+
+def download_audio(url, destination_folder, audio_format, job_id, channel, max_workers=DEFAULT_MAX_WORKERS, use_archive=True, rebuild_archive=False, use_info_cache=True, stream=False, use_source_cache=True, control=None, claim_entry=None, journal=None, journal_key=None, profile_dir=None, segments=DEFAULT_SETTINGS['download_segments'], loudness=DEFAULT_SETTINGS['loudness'], dedupe=DEFAULT_SETTINGS['dedupe']):
+    job = {
+        'id': job_id,
+        'channel': channel,
+        'control': control,
+        'audio_formats': format_list(audio_format),
+        'stream': stream,
+        'segments': segments,
+        'loudness': loudness if loudness in LOUDNESS_MODES and loudness != 'off' else None,
+        'dedupe': dedupe if dedupe in DEDUPE_MODES and dedupe != 'off' and use_archive else None,
+        'fingerprints': None,
+        'ffmpeg_path': get_ffmpeg_path(),
+        'archive': None,
+        'info_cache': get_info_cache() if use_info_cache else None,
+        'source_cache': get_source_cache() if use_source_cache else None,
+        'journal': journal if journal_key is not None else None,
+        'journal_key': journal_key,
+        'metrics': JobMetrics(get_metrics(), job_id),
+        'scheduler': get_bandwidth_scheduler(),
+        'adaptive': get_adaptive_concurrency(),
+        'profiler': JobProfiler(job_id, profile_dir) if profile_dir else None,
+        'errors': [],
+        'errors_lock': Lock(),
+        'conversion_queue': Queue(maxsize=CONVERSION_QUEUE_SIZE)
+    }
+    if not job['ffmpeg_path']:
+        return finish_job(job, 'ffmpeg_missing')
+    if job['loudness'] and not numpy_available():
+        return finish_job(job, 'failed', 'loudness analysis needs NumPy (pip install numpy)')
+    if job['dedupe'] and not numpy_available():
+        return finish_job(job, 'failed', 'duplicate detection needs NumPy (pip install numpy)')
+
+    job['scheduler'].add_job(job_id)
+    expansion = PlaylistExpansion(url, job['info_cache'])
+    entries = iter(expansion)
+    try:
+        if use_archive:
+            job['archive'] = open_archive(destination_folder, get_ffprobe_path(), rebuild_archive)
+            if job['dedupe']:
+                job['fingerprints'] = FingerprintIndex(job['archive'])
+
+        profiled(job, run_entries)(job, destination_folder, expansion, entries, max_workers, claim_entry)
+
+        if control is not None and control.cancelled:
+            return finish_job(job, 'cancelled')
+        if job['errors']:
+            raise job['errors'][0]
+        return finish_job(job, 'completed')
+    except Exception as e:
+        return finish_job(job, 'failed', str(e))
+    finally:
+        # a cancelled or failed job leaves the expansion half read; closing it hands its yt-dlp instance back
+        entries.close()
+        job['scheduler'].remove_job(job_id)
+        if job['archive'] is not None:
+            job['archive'].close()
+
+def run_entries(job, destination_folder, expansion, entries, max_workers, claim_entry):
+    # the first entry is handed out alone so it starts downloading while the rest of the playlist is still being listed
+    batch = next_batch(job, entries, 1)
+    job['outtmpl'] = playlist_outtmpl(destination_folder, expansion.title)
+    total = max(expansion.count or 0, len(batch))
+    report(job, 'started', data={'total': total, 'audio_formats': job['audio_formats']})
+
+    converters = []
+    add_converters(job, converters, total)
+
+    index = 0
+    futures = {}
+    in_flight = max(1, int(max_workers)) * IN_FLIGHT_PER_WORKER
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as executor:
+            while batch:
+                for entry in batch:
+                    entry['index'] = index
+                    index += 1
+                for entry in pending_entries(job, batch, claim_entry):
+                    while len(futures) >= in_flight:
+                        collect_futures(job, futures, FIRST_COMPLETED)
+                    futures[executor.submit(profiled(job, download_worker), entry, job)] = entry
+                if job['control'] is not None and job['control'].cancelled:
+                    break
+                try:
+                    batch = next_batch(job, entries, EXPANSION_BATCH_SIZE)
+                except Exception as e:
+                    # entries already listed still get downloaded; the job fails once they are done
+                    add_error(job, e)
+                    break
+                if index + len(batch) > total:
+                    total = index + len(batch)
+                    report(job, 'expanded', data={'total': total})
+                    add_converters(job, converters, total)
+            if index != total and not job['errors'] and not (job['control'] is not None and job['control'].cancelled):
+                total = index
+                report(job, 'expanded', data={'total': total})
+            collect_futures(job, futures, ALL_COMPLETED)
+    finally:
+        for _ in converters:
+            job['conversion_queue'].put(None)
+        for converter in converters:
+            converter.join()
+
+def add_converters(job, converters, total):
+    # a lazily listed playlist starts with a total of one, so the pool grows with the listing up to one converter per CPU
+    while len(converters) < min(os.cpu_count() or 1, max(1, total)):
+        converter = Thread(target=profiled(job, conversion_worker), args=(job,))
+        converter.start()
+        converters.append(converter)
+
+def next_batch(job, entries, size):
+    with job['metrics'].stage('expand'):
+        return list(islice(entries, size))
+
+def pending_entries(job, entries, claim_entry):
+    entry_states = {}
+    if job['journal'] is not None:
+        job['journal'].add_entries(job['journal_key'], entries)
+        entry_states = job['journal'].entry_states(job['journal_key'], [entry_key(entry) for entry in entries])
+
+    pending = []
+    for entry in entries:
+        entry['formats'] = job['audio_formats']
+        if entry_states.get(entry_key(entry)) == 'done':
+            entry['formats'] = []
+        if job['archive'] is not None and entry['archive_id']:
+            entry['formats'] = [audio_format for audio_format in entry['formats']
+                                if not job['archive'].contains(entry['archive_id'], audio_format)]
+        if claim_entry is not None and entry['archive_id'] and entry['formats']:
+            # the same track written to another folder is another file, so the claim covers the folder too
+            entry['formats'] = claim_entry(entry['archive_id'], entry['formats'], os.path.abspath(os.path.dirname(job['outtmpl'])))
+        if entry['formats']:
+            pending.append(entry)
+        else:
+            record(job, entry, 'done')
+            job['metrics'].add_entry('skipped')
+            report(job, 'skipped', entry['index'])
+    return pending
+
+def collect_futures(job, futures, return_when):
+    done, _ = wait_for_futures(futures, return_when=return_when)
+    for future in done:
+        entry = futures.pop(future)
+        try:
+            future.result()
+        except JobCancelled:
+            pass
+        except Exception as e:
+            record(job, entry, 'failed', str(e))
+            job['metrics'].add_entry('failed')
+            add_error(job, e)
+
+def add_error(job, error):
+    with job['errors_lock']:
+        # only the first error is raised; keeping the rest would pin their tracebacks and info dicts in memory
+        if not job['errors']:
+            job['errors'].append(error)
+
+def finish_job(job, status, error=None):
+    summary = job['metrics'].finish(status)
+    if job['profiler'] is not None:
+        summary['profile'] = job['profiler'].dump()
+    if status == 'completed':
+        report(job, status, data={'metrics': summary})
+    else:
+        report(job, status, data=error)
+    return status
+
+def profiled(job, function):
+    if job['profiler'] is None:
+        return function
+    return job['profiler'].wrap(function)
+
+def progress_hook(index, job_id, channel, control=None, metrics=None, scheduler=None):
+    last_percent = [None]
+    last_bytes = [None]
+
+    def hook(d):
+        if control is not None:
+            control.checkpoint()
+
+        if scheduler is not None and d['status'] == 'downloading':
+            downloaded_bytes = d.get('downloaded_bytes', 0)
+            # the first report of a resumed download already counts the bytes on disk
+            if last_bytes[0] is not None:
+                scheduler.consume(job_id, downloaded_bytes - last_bytes[0])
+            last_bytes[0] = downloaded_bytes
+
+        if d['status'] == 'finished' and metrics is not None:
+            metrics.add_bytes(d.get('downloaded_bytes') or d.get('total_bytes') or 0)
+
+        if d['status'] == 'downloading':
+            total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+            downloaded_bytes = d.get('downloaded_bytes', 0)
+            percent = int(downloaded_bytes / total_bytes * 100) if total_bytes > 0 else 0
+            if percent == last_percent[0]:
+                return
+            last_percent[0] = percent
+            channel.put((job_id, 'downloading', index, {
+                'percent': percent,
+                'speed': d.get('speed', 0) or 0,
+                'total_bytes': total_bytes
+            }))
+
+        elif d['status'] == 'finished':
+            channel.put((job_id, 'downloaded', index, None))
+
+    return hook
@@ -0,0 +1,207 @@
+import json
+import os
+import re
+from collections import deque
+from threading import Condition, Lock, Thread
+from urllib.parse import parse_qs, urlparse
+
+from .adaptive import get_adaptive_concurrency
+from .bandwidth import get_bandwidth_scheduler
+from .cache import get_info_cache
+from .config import DEFAULT_MAX_WORKERS
+from .ffmpeg import CONVERSION_OPTIONS, format_list
+from .metrics import get_metrics
+from .pool import get_youtubedl_pool
+from .sources import get_source_cache
+
+EVENT_LOG_SIZE = 10000
+HEARTBEAT_SECONDS = 15
+MAX_REQUEST_BYTES = 1024 * 1024
+JOB_ACTIONS = ('pause', 'resume', 'cancel')
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class EventLog:
+    def __init__(self, channel=None, size=EVENT_LOG_SIZE):
+        self.condition = Condition(Lock())
+        self.channel = channel
+        self.events = deque(maxlen=size)
+        self.sequence = 0
+
+    def put(self, event):
+        job_id, status, index, data = event
+        with self.condition:
+            self.sequence += 1
+            self.events.append({'seq': self.sequence, 'job': job_id, 'status': status, 'index': index, 'data': data})
+            self.condition.notify_all()
+        if self.channel is not None:
+            self.channel.put(event)
+
+    def read(self, since, job_id=None, timeout=None):
+        with self.condition:
+            if timeout:
+                self.condition.wait_for(lambda: self.sequence > since, timeout)
+            return [event for event in self.events if event['seq'] > since and (job_id is None or event['job'] == job_id)], self.sequence
+
+    def last(self):
+        with self.condition:
+            return self.sequence
+
+class ServiceHandler:
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def dispatch(self, method):
+        request = urlparse(self.path)
+        path = request.path.rstrip('/') or '/'
+        query = {key: values[-1] for key, values in parse_qs(request.query).items()}
+        try:
+            # browsers always send Origin on cross-site requests; nothing but local scripts may drive the service
+            if self.headers.get('Origin'):
+                raise RequestError(403, 'cross-origin requests are not allowed')
+            if method == 'GET' and path == '/events':
+                return self.stream_events(query)
+            if method == 'GET' and path == '/metrics':
+                return self.send_body(200, 'text/plain; version=0.0.4', get_metrics().prometheus_text().encode())
+            body = self.read_json() if method == 'POST' else None
+            self.send_json(200, self.route(method, path, body))
+        except RequestError as e:
+            self.send_json(e.status, {'error': str(e)})
+        except KeyError:
+            self.send_json(404, {'error': 'no such job'})
+        except (TypeError, ValueError) as e:
+            self.send_json(400, {'error': str(e)})
+
+    def route(self, method, path, body):
+        service = self.server.service
+        job_path = re.match(r'^/jobs/(\d+)(?:/(\w+))?$', path)
+        if method == 'GET' and path == '/health':
+            return {'status': 'ok', 'pid': os.getpid(), 'sequence': service['events'].last()}
+        if method == 'GET' and path == '/stats':
+            return service_stats()
+        if method == 'GET' and path == '/jobs':
+            return {'jobs': [public_job(job) for job in service['job_queue'].snapshot()]}
+        if method == 'POST' and path == '/jobs':
+            return {'jobs': submit_jobs(service['job_queue'], body)}
+        if method == 'POST' and path == '/limits':
+            get_bandwidth_scheduler().set_limits(body.get('rate'), body.get('host_connections'))
+            return get_bandwidth_scheduler().limits()
+        if job_path:
+            job_id, action = int(job_path.group(1)), job_path.group(2)
+            job_queue = service['job_queue']
+            if method == 'GET' and action is None:
+                for job in job_queue.snapshot():
+                    if job['id'] == job_id:
+                        return public_job(job)
+                raise KeyError(job_id)
+            if method == 'POST' and action in JOB_ACTIONS:
+                getattr(job_queue, action)(job_id)
+                return {'id': job_id, 'state': job_queue.state(job_id)}
+            if method == 'POST' and action == 'priority':
+                job_queue.set_priority(job_id, int(body.get('priority', 0)))
+                return {'id': job_id, 'state': job_queue.state(job_id)}
+        raise RequestError(404, 'unknown endpoint')
+
+    def read_json(self):
+        if (self.headers.get('Content-Type') or '').split(';')[0].strip() != 'application/json':
+            raise RequestError(415, 'requests must be sent as application/json')
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_REQUEST_BYTES:
+            raise RequestError(413, 'request body is too large')
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            raise RequestError(400, 'request body is not valid JSON')
+        if not isinstance(body, dict):
+            raise RequestError(400, 'request body must be a JSON object')
+        return body
+
+    def send_body(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status, value):
+        self.send_body(status, 'application/json', json.dumps(value, default=str).encode())
+
+    def stream_events(self, query):
+        events = self.server.service['events']
+        since = int(query.get('since') or 0)
+        job_id = int(query['job']) if query.get('job') else None
+        follow = query.get('follow', '1') != '0'
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            while True:
+                batch, since = events.read(since, job_id, HEARTBEAT_SECONDS if follow else None)
+                # a bare newline doubles as heartbeat, so a vanished client is noticed even while nothing happens
+                self.wfile.write(b''.join(json.dumps(event, default=str).encode() + b'\n' for event in batch) or b'\n')
+                self.wfile.flush()
+                if not follow:
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+def public_job(job):
+    return {
+        'id': job['id'],
+        'url': job['url'],
+        'destination_folder': job['destination_folder'],
+        'audio_formats': job['audio_formats'],
+        'max_workers': job['max_workers'],
+        'priority': job['priority'],
+        'state': job['state']
+    }
+
+def submit_jobs(job_queue, body):
+    urls = body.get('urls') or ([body['url']] if body.get('url') else [])
+    destination_folder = body.get('destination_folder')
+    audio_formats = format_list(body.get('formats') or body.get('format') or [])
+    if not urls or not all(isinstance(url, str) for url in urls):
+        raise RequestError(400, "'url' or 'urls' is required")
+    if not destination_folder or not os.path.isabs(destination_folder):
+        raise RequestError(400, "'destination_folder' must be an absolute path")
+    if not audio_formats or any(audio_format not in CONVERSION_OPTIONS for audio_format in audio_formats):
+        raise RequestError(400, "'formats' must be a list of {}".format(', '.join(sorted(CONVERSION_OPTIONS))))
+
+    submitted = []
+    for url in urls:
+        job_id = job_queue.submit(url, destination_folder, audio_formats, int(body.get('priority') or 0),
+                                  int(body.get('max_workers') or DEFAULT_MAX_WORKERS))
+        submitted.append({'url': url, 'id': job_id, 'duplicate': job_id is None})
+    return submitted
+
+def service_stats():
+    return {
+        'info_cache': get_info_cache().stats(),
+        'source_cache': get_source_cache().stats(),
+        'bandwidth': get_bandwidth_scheduler().stats(),
+        'adaptive': get_adaptive_concurrency().stats(),
+        'youtubedl_pool': get_youtubedl_pool().stats()
+    }
+
+def start_service(job_queue, events, port, host='127.0.0.1'):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    server = ThreadingHTTPServer((host, port), type('ServiceRequestHandler', (ServiceHandler, BaseHTTPRequestHandler), {}))
+    server.daemon_threads = True
+    server.service = {'job_queue': job_queue, 'events': events}
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,219 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from threading import Thread
+
+from .loudness import ANALYSIS_OPTIONS, loudness_tags, normalization_gain
+
+CONVERSION_OPTIONS = {
+    'mp3': ['-acodec', 'libmp3lame', '-b:a', '192k'],
+    'wav': ['-acodec', 'pcm_s16le'],
+    'flac': ['-acodec', 'flac'],
+    'm4a': ['-acodec', 'aac', '-b:a', '192k'],
+    'opus': ['-acodec', 'libopus', '-b:a', '192k']
+}
+
+COPY_OPTIONS = ['-acodec', 'copy']
+
+tool_paths = {}
+
+def find_ffmpeg_tool(name):
+    if name in tool_paths:
+        return tool_paths[name]
+
+    if getattr(sys, 'frozen', False):
+        bundle_dir = sys._MEIPASS
+    else:
+        bundle_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    for executable in (name + '.exe', name):
+        tool_path = os.path.join(bundle_dir, 'ffmpeg', executable)
+        if os.path.isfile(tool_path):
+            break
+    else:
+        tool_path = shutil.which(name)
+    if tool_path:
+        # only remember hits so an ffmpeg installed while the app runs is still picked up
+        tool_paths[name] = tool_path
+    return tool_path
+
+def get_ffmpeg_path():
+    return find_ffmpeg_tool('ffmpeg')
+
+def get_ffprobe_path():
+    return find_ffmpeg_tool('ffprobe')
+
+def conversion_quality(audio_format):
+    return ' '.join(CONVERSION_OPTIONS[audio_format])
+
+def format_list(audio_format):
+    if isinstance(audio_format, str):
+        return [audio_format]
+    return list(audio_format)
+
+def metadata_options(audio_format, metadata, tags=None):
+    options = []
+    for key, value in dict(metadata or {}, **(tags or {})).items():
+        options += ['-metadata', '{}={}'.format(key, value)]
+    if audio_format == 'm4a' and tags:
+        # MP4 drops keys it has no atom for unless they are written as freeform tags
+        options += ['-movflags', '+use_metadata_tags']
+    return options
+
+def conversion_command(ffmpeg_path, input_path, outputs, metadata=None, analyse=False, audio_filter=None, tags=None):
+    command = [ffmpeg_path, '-y', '-loglevel', 'error', '-i', input_path]
+    for audio_format, output_path, copy in outputs:
+        command += ['-map', '0:a:0', '-vn'] + (COPY_OPTIONS if copy else CONVERSION_OPTIONS[audio_format])
+        if audio_filter and not copy:
+            command += ['-af', audio_filter]
+        command += metadata_options(audio_format, metadata, (tags or {}).get(audio_format))
+        command.append(output_path)
+    if analyse:
+        # the same decode also feeds the loudness meter, so analysis costs no second pass over the source
+        command += ANALYSIS_OPTIONS + ['pipe:1']
+    return command
+
+def tag_command(ffmpeg_path, input_path, output_path, audio_format, tags):
+    return [ffmpeg_path, '-y', '-loglevel', 'error', '-i', input_path, '-map', '0', '-c', 'copy'] + metadata_options(audio_format, None, tags) + [output_path]
+
+def temp_output_path(output_path):
+    base_path, extension = os.path.splitext(output_path)
+    return base_path + '.temp' + extension
+
+def output_paths(base_path, audio_formats):
+    return {audio_format: base_path + '.' + audio_format for audio_format in audio_formats}
+
+def temp_outputs(paths, copy_formats):
+    return [(audio_format, temp_output_path(path), audio_format in copy_formats) for audio_format, path in paths.items()]
+
+def remove_temp_outputs(outputs):
+    for _, temp_path, _ in outputs:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def commit_outputs(paths):
+    for path in paths.values():
+        os.replace(temp_output_path(path), path)
+    return paths
+
+def ffmpeg_error(stderr, returncode):
+    return RuntimeError(stderr.decode('utf-8', 'replace').strip() or 'ffmpeg exited with code {}'.format(returncode))
+
+def wait_process(process, usage):
+    if usage is None or not hasattr(os, 'wait4'):
+        return process.wait()
+    _, status, resources = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    usage['cpu_seconds'] = usage.get('cpu_seconds', 0) + resources.ru_utime + resources.ru_stime
+    return process.returncode
+
+def start_analysis(process, usage):
+    from .loudness import READ_SIZE, LoudnessMeter, analyse_stream
+    result = {}
+
+    def analyse():
+        started_at = time.thread_time()
+        try:
+            result['analysis'] = analyse_stream(process.stdout, LoudnessMeter())
+        except Exception as e:
+            result['error'] = e
+            # keep draining, or ffmpeg blocks on a full pipe and never exits
+            while process.stdout.read(READ_SIZE):
+                pass
+        if usage is not None:
+            usage['analysis_seconds'] = usage.get('analysis_seconds', 0) + time.thread_time() - started_at
+
+    reader = Thread(target=analyse, daemon=True)
+    reader.start()
+    return reader, result
+
+def run_ffmpeg(command, outputs, usage=None, chunks=None, analyse=False):
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE if chunks is not None else None,
+                                   stdout=subprocess.PIPE if analyse else subprocess.DEVNULL, stderr=stderr,
+                                   creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+        reader, result = start_analysis(process, usage) if analyse else (None, {})
+        if chunks is not None:
+            try:
+                for chunk in chunks:
+                    process.stdin.write(chunk)
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+            except BaseException:
+                process.kill()
+                process.wait()
+                if reader is not None:
+                    reader.join()
+                remove_temp_outputs(outputs)
+                raise
+
+        returncode = wait_process(process, usage)
+        if reader is not None:
+            reader.join()
+        if returncode != 0:
+            remove_temp_outputs(outputs)
+            stderr.seek(0)
+            raise ffmpeg_error(stderr.read(), returncode)
+        if 'error' in result:
+            remove_temp_outputs(outputs)
+            raise result['error']
+    return result.get('analysis')
+
+def tag_outputs(ffmpeg_path, outputs, analysis, usage=None):
+    for audio_format, temp_path, _ in outputs:
+        tags = loudness_tags(analysis, audio_format)
+        if not tags:
+            continue
+        # a stream copy only rewrites the container, nothing is decoded again
+        tagged_path = os.path.splitext(temp_path)[0] + '.tagged' + os.path.splitext(temp_path)[1]
+        run_ffmpeg(tag_command(ffmpeg_path, temp_path, tagged_path, audio_format, tags), [(audio_format, tagged_path, True)], usage)
+        os.replace(tagged_path, temp_path)
+
+def loudness_outputs(ffmpeg_path, input_path, outputs, metadata, analysis, usage=None):
+    # normalized formats are encoded only now that the gain is known; copies cannot change, so they are tagged instead
+    gain = normalization_gain(analysis)
+    tags = {audio_format: loudness_tags(analysis, audio_format, gain) for audio_format, _, _ in outputs}
+    run_ffmpeg(conversion_command(ffmpeg_path, input_path, outputs, metadata, audio_filter='volume={:.2f}dB'.format(gain), tags=tags), outputs, usage)
+
+def commit_timed(paths, usage, source_path=None):
+    started_at = time.monotonic()
+    commit_outputs(paths)
+    if source_path is not None and os.path.abspath(source_path) not in (os.path.abspath(path) for path in paths.values()):
+        os.remove(source_path)
+    if usage is not None:
+        usage['move_seconds'] = time.monotonic() - started_at
+    return paths
+
+def convert_audio(source_path, audio_format, ffmpeg_path, metadata=None, copy_formats=(), usage=None, loudness=None):
+    paths = output_paths(os.path.splitext(source_path)[0], format_list(audio_format))
+    outputs = temp_outputs(paths, copy_formats)
+    deferred = [output for output in outputs if loudness == 'normalize' and not output[2]]
+    immediate = [output for output in outputs if output not in deferred]
+
+    analysis = run_ffmpeg(conversion_command(ffmpeg_path, source_path, immediate, metadata, analyse=bool(loudness)), outputs, usage, analyse=bool(loudness))
+    if loudness:
+        try:
+            if deferred:
+                loudness_outputs(ffmpeg_path, source_path, deferred, metadata, analysis, usage)
+            tag_outputs(ffmpeg_path, immediate, analysis, usage)
+        except BaseException:
+            remove_temp_outputs(outputs)
+            raise
+    return commit_timed(paths, usage, source_path)
+
+def stream_audio(chunks, base_path, audio_format, ffmpeg_path, metadata=None, copy_formats=(), usage=None, loudness=None):
+    # a piped source cannot be read a second time, so streamed downloads are tagged even when normalization is asked for
+    paths = output_paths(base_path, format_list(audio_format))
+    outputs = temp_outputs(paths, copy_formats)
+    analysis = run_ffmpeg(conversion_command(ffmpeg_path, 'pipe:0', outputs, metadata, analyse=bool(loudness)), outputs, usage, chunks, analyse=bool(loudness))
+    if loudness:
+        try:
+            tag_outputs(ffmpeg_path, outputs, analysis, usage)
+        except BaseException:
+            remove_temp_outputs(outputs)
+            raise
+    return commit_timed(paths, usage)
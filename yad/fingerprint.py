@@ -0,0 +1,135 @@
+import subprocess
+import time
+from collections import Counter
+
+DEDUPE_MODES = ('off', 'link', 'skip')
+FINGERPRINT_SECONDS = 30
+FINGERPRINT_RATE = 5512
+FRAME_SIZE = 2048
+# about 12 ms, so two uploads that start a few frames apart still line up on some frames
+FRAME_HOP = 64
+FRAME_BATCH = 256
+BAND_EDGES_HZ = (300, 2000)
+BANDS = 33
+# every word of a query is looked up, but only every INDEX_STRIDE-th word of a stored track is indexed
+INDEX_STRIDE = 8
+# words of silence and full-scale noise are shared by unrelated tracks
+IGNORED_WORDS = (0, 0xFFFFFFFF)
+QUERY_CHUNK = 500
+MIN_VOTES = 3
+MAX_CANDIDATES = 5
+MIN_OVERLAP_FRAMES = 256
+MAX_BIT_ERROR_RATE = 0.3
+
+band_matrix = None
+
+def band_weights():
+    global band_matrix
+    if band_matrix is None:
+        import numpy as np
+        frequencies = np.fft.rfftfreq(FRAME_SIZE, 1 / FINGERPRINT_RATE)
+        edges = np.geomspace(BAND_EDGES_HZ[0], BAND_EDGES_HZ[1], BANDS + 1)
+        band_matrix = ((frequencies[:, None] >= edges[None, :-1]) & (frequencies[:, None] < edges[None, 1:])).astype(np.float32)
+    return band_matrix
+
+def decode_start(source_path, ffmpeg_path, seconds=FINGERPRINT_SECONDS):
+    import numpy as np
+    command = [ffmpeg_path, '-loglevel', 'error', '-t', str(seconds), '-i', source_path, '-map', '0:a:0', '-vn',
+               '-ac', '1', '-ar', str(FINGERPRINT_RATE), '-acodec', 'pcm_f32le', '-f', 'f32le', 'pipe:1']
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode('utf-8', 'replace').strip() or 'ffmpeg exited with code {}'.format(result.returncode))
+    return np.frombuffer(result.stdout[:len(result.stdout) // 4 * 4], dtype=np.float32)
+
+def compute_fingerprint(samples):
+    import numpy as np
+    if len(samples) < FRAME_SIZE + FRAME_HOP:
+        return np.zeros(0, dtype=np.uint32)
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME_SIZE)[::FRAME_HOP]
+    window = np.hanning(FRAME_SIZE).astype(np.float32)
+    weights = band_weights()
+    energies = np.empty((len(frames), BANDS), dtype=np.float32)
+    # a batch of frames at a time, so a long excerpt never needs all spectra in memory at once
+    for start in range(0, len(frames), FRAME_BATCH):
+        spectrum = np.fft.rfft(frames[start:start + FRAME_BATCH] * window, axis=1)
+        energies[start:start + FRAME_BATCH] = (spectrum.real ** 2 + spectrum.imag ** 2) @ weights
+    # one bit per band pair: did the energy difference between neighbouring bands grow since the last frame
+    slopes = energies[:, :-1] - energies[:, 1:]
+    bits = (slopes[1:] - slopes[:-1]) > 0
+    return np.packbits(bits, axis=1, bitorder='little').view('<u4').ravel().astype(np.uint32)
+
+def fingerprint_file(source_path, ffmpeg_path):
+    return compute_fingerprint(decode_start(source_path, ffmpeg_path))
+
+def bit_error_rate(query, stored, offset):
+    import numpy as np
+    start = max(0, -offset)
+    end = min(len(query), len(stored) - offset)
+    if end - start < MIN_OVERLAP_FRAMES:
+        return None
+    differences = np.bitwise_xor(query[start:end], stored[start + offset:end + offset])
+    return float(np.unpackbits(differences.view(np.uint8)).sum()) / ((end - start) * 32)
+
+class FingerprintIndex:
+    def __init__(self, archive):
+        self.connection = archive.connection
+        self.lock = archive.lock
+        with self.lock, self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS fingerprints ('
+                'archive_id TEXT PRIMARY KEY, '
+                'fingerprint BLOB NOT NULL, '
+                'added_at REAL NOT NULL)')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS fingerprint_words ('
+                'word INTEGER NOT NULL, '
+                'archive_id TEXT NOT NULL, '
+                'position INTEGER NOT NULL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS fingerprint_words_word ON fingerprint_words (word)')
+
+    def add(self, archive_id, fingerprint):
+        words = [(int(word), archive_id, position) for position, word in enumerate(fingerprint.tolist())
+                 if position % INDEX_STRIDE == 0 and word not in IGNORED_WORDS]
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM fingerprint_words WHERE archive_id = ?', (archive_id,))
+            self.connection.execute('INSERT OR REPLACE INTO fingerprints (archive_id, fingerprint, added_at) VALUES (?, ?, ?)',
+                                    (archive_id, fingerprint.astype('<u4').tobytes(), time.time()))
+            self.connection.executemany('INSERT INTO fingerprint_words (word, archive_id, position) VALUES (?, ?, ?)', words)
+
+    def fingerprint(self, archive_id):
+        import numpy as np
+        with self.lock:
+            row = self.connection.execute('SELECT fingerprint FROM fingerprints WHERE archive_id = ?', (archive_id,)).fetchone()
+        return np.frombuffer(row[0], dtype='<u4').astype(np.uint32) if row else None
+
+    def candidates(self, fingerprint, exclude=None):
+        positions = {}
+        for position, word in enumerate(fingerprint.tolist()):
+            if word not in IGNORED_WORDS:
+                positions.setdefault(word, []).append(position)
+        # a true duplicate hits many words at one time offset; chance hits scatter over many offsets
+        votes = Counter()
+        words = list(positions)
+        for start in range(0, len(words), QUERY_CHUNK):
+            chunk = words[start:start + QUERY_CHUNK]
+            with self.lock:
+                rows = self.connection.execute(
+                    'SELECT word, archive_id, position FROM fingerprint_words WHERE word IN ({})'.format(', '.join('?' * len(chunk))),
+                    chunk).fetchall()
+            for word, archive_id, stored_position in rows:
+                if archive_id != exclude:
+                    for position in positions[word]:
+                        votes[archive_id, stored_position - position] += 1
+        return [candidate for candidate, count in votes.most_common(MAX_CANDIDATES) if count >= MIN_VOTES]
+
+    def find(self, fingerprint, exclude=None):
+        if not len(fingerprint):
+            return None
+        best = None
+        for archive_id, offset in self.candidates(fingerprint, exclude):
+            stored = self.fingerprint(archive_id)
+            error_rate = bit_error_rate(fingerprint, stored, offset) if stored is not None else None
+            if error_rate is not None and error_rate <= MAX_BIT_ERROR_RATE and (best is None or error_rate < best['bit_error_rate']):
+                best = {'archive_id': archive_id, 'offset': offset * FRAME_HOP / FINGERPRINT_RATE, 'bit_error_rate': round(error_rate, 4)}
+        return best
@@ -0,0 +1,233 @@
+import heapq
+import time
+from itertools import count
+from threading import Condition, Event, Lock, Thread
+
+from .config import DEFAULT_MAX_WORKERS, DEFAULT_SETTINGS
+from .core import JobCancelled, download_audio, url_archive_id
+from .ffmpeg import format_list
+
+DEFAULT_MAX_JOBS = DEFAULT_SETTINGS['max_jobs']
+FINISHED_STATES = ('completed', 'failed', 'cancelled', 'ffmpeg_missing')
+JOURNAL_RETENTION = 7 * 24 * 60 * 60
+
+class JobControl:
+    def __init__(self):
+        self.running = Event()
+        self.running.set()
+        self.cancel_event = Event()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def paused(self):
+        return not self.running.is_set()
+
+    def pause(self):
+        self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    def cancel(self):
+        self.cancel_event.set()
+        self.running.set()
+
+    def checkpoint(self):
+        self.running.wait()
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+class JobQueue:
+    def __init__(self, channel, max_jobs=DEFAULT_MAX_JOBS, download_options=None, journal=None):
+        self.channel = channel
+        self.download_options = download_options or {}
+        self.journal = journal
+        self.condition = Condition(Lock())
+        self.heap = []
+        self.jobs = {}
+        self.claims = {}
+        self.job_ids = count(1)
+        self.sequence = count()
+        self.stopping = False
+        self.workers = [Thread(target=self.worker, daemon=True) for _ in range(max(1, max_jobs))]
+        for worker in self.workers:
+            worker.start()
+
+    def dedupe_key(self, url):
+        return url_archive_id(url) or url.strip()
+
+    def submit(self, url, destination_folder, audio_formats, priority=0, max_workers=DEFAULT_MAX_WORKERS, journal_key=None):
+        key = self.dedupe_key(url)
+        audio_formats = format_list(audio_formats)
+        with self.condition:
+            for job in self.jobs.values():
+                if job['key'] == key and job['state'] not in FINISHED_STATES:
+                    return None
+
+            if self.journal is not None and journal_key is None:
+                journal_key = self.journal.add_job(url, destination_folder, audio_formats, priority, max_workers)
+
+            job_id = next(self.job_ids)
+            self.jobs[job_id] = {
+                'id': job_id,
+                'key': key,
+                'url': url,
+                'destination_folder': destination_folder,
+                'audio_formats': audio_formats,
+                'max_workers': max_workers,
+                'priority': priority,
+                'state': 'queued',
+                'journal_key': journal_key,
+                'control': JobControl()
+            }
+            self.push(job_id)
+            return job_id
+
+    def restore(self):
+        if self.journal is None:
+            return []
+        self.journal.prune(time.time() - JOURNAL_RETENTION)
+
+        job_ids = []
+        for saved in self.journal.unfinished_jobs():
+            job_id = self.submit(saved['url'], saved['destination_folder'], saved['audio_formats'], saved['priority'],
+                                 saved['max_workers'], saved['job_key'])
+            if job_id is None:
+                self.journal.set_job_state(saved['job_key'], 'cancelled')
+                continue
+            if saved['state'] == 'paused':
+                self.pause(job_id)
+            job_ids.append(job_id)
+        return job_ids
+
+    def set_state(self, job, state):
+        job['state'] = state
+        if self.journal is not None:
+            self.journal.set_job_state(job['journal_key'], state)
+
+    def push(self, job_id):
+        heapq.heappush(self.heap, (-self.jobs[job_id]['priority'], next(self.sequence), job_id))
+        self.condition.notify_all()
+
+    def set_priority(self, job_id, priority):
+        with self.condition:
+            job = self.jobs[job_id]
+            job['priority'] = priority
+            if self.journal is not None:
+                self.journal.set_job_priority(job['journal_key'], priority)
+            if job['state'] in ('queued', 'paused') and not job['control'].cancelled:
+                self.push(job_id)
+
+    def pause(self, job_id):
+        with self.condition:
+            job = self.jobs[job_id]
+            if job['state'] == 'queued':
+                self.set_state(job, 'paused')
+            elif job['state'] == 'running':
+                job['control'].pause()
+                if self.journal is not None:
+                    self.journal.set_job_state(job['journal_key'], 'paused')
+
+    def resume(self, job_id):
+        with self.condition:
+            job = self.jobs[job_id]
+            job['control'].resume()
+            if job['state'] == 'running' and self.journal is not None:
+                self.journal.set_job_state(job['journal_key'], 'running')
+            if job['state'] == 'paused':
+                self.set_state(job, 'queued')
+                self.push(job_id)
+
+    def cancel(self, job_id):
+        with self.condition:
+            self.cancel_job(self.jobs[job_id])
+
+    def cancel_job(self, job):
+        job['control'].cancel()
+        if job['state'] in ('queued', 'paused'):
+            self.set_state(job, 'cancelled')
+            self.channel.put((job['id'], 'cancelled', None, None))
+            self.condition.notify_all()
+
+    def claim(self, job_id, entry_archive_id, audio_formats, output_folder):
+        with self.condition:
+            claimed = []
+            for audio_format in audio_formats:
+                owner = self.claims.setdefault((entry_archive_id, audio_format, output_folder), job_id)
+                if owner == job_id:
+                    claimed.append(audio_format)
+            return claimed
+
+    def release_claims(self, job_id):
+        for key in [key for key, owner in self.claims.items() if owner == job_id]:
+            del self.claims[key]
+
+    def job_state(self, job):
+        if job['state'] == 'running' and job['control'].paused:
+            return 'paused'
+        return job['state']
+
+    def snapshot(self):
+        with self.condition:
+            return [
+                dict({key: value for key, value in job.items() if key != 'control'}, state=self.job_state(job))
+                for job in sorted(self.jobs.values(), key=lambda job: job['id'])
+            ]
+
+    def state(self, job_id):
+        with self.condition:
+            return self.job_state(self.jobs[job_id])
+
+    def next_job(self):
+        while self.heap:
+            priority, _, job_id = heapq.heappop(self.heap)
+            job = self.jobs[job_id]
+            if job['state'] == 'queued' and -priority == job['priority']:
+                return job
+        return None
+
+    def worker(self):
+        while True:
+            with self.condition:
+                job = self.next_job()
+                while job is None and not self.stopping:
+                    self.condition.wait()
+                    job = self.next_job()
+                if job is None:
+                    return
+                self.set_state(job, 'running')
+
+            try:
+                state = download_audio(job['url'], job['destination_folder'], job['audio_formats'], job['id'], self.channel,
+                                       job['max_workers'], control=job['control'],
+                                       claim_entry=lambda entry_archive_id, audio_formats, output_folder, job_id=job['id']: self.claim(job_id, entry_archive_id, audio_formats, output_folder),
+                                       journal=self.journal, journal_key=job['journal_key'],
+                                       **self.download_options)
+            except Exception as e:
+                # a failure before the job set itself up (cache, archive, journal) must not take the worker thread with it
+                state = 'failed'
+                self.channel.put((job['id'], 'failed', None, str(e)))
+
+            with self.condition:
+                self.set_state(job, state)
+                self.release_claims(job['id'])
+                self.condition.notify_all()
+
+    def idle(self):
+        return all(job['state'] in FINISHED_STATES for job in self.jobs.values())
+
+    def wait(self):
+        with self.condition:
+            while not self.idle():
+                self.condition.wait()
+
+    def shutdown(self, cancel=False):
+        with self.condition:
+            self.stopping = True
+            if cancel:
+                for job in self.jobs.values():
+                    self.cancel_job(job)
+            self.condition.notify_all()
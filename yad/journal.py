@@ -0,0 +1,123 @@
+import json
+import os
+import sqlite3
+import time
+from threading import Lock
+
+from .config import get_cache_dir
+
+JOURNAL_FILENAME = 'journal.sqlite3'
+RESUMABLE_JOB_STATES = ('queued', 'paused', 'running')
+
+class JobJournal:
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=FULL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'job_key INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'url TEXT NOT NULL, '
+                'destination_folder TEXT NOT NULL, '
+                'formats TEXT NOT NULL, '
+                'priority INTEGER NOT NULL, '
+                'max_workers INTEGER NOT NULL, '
+                'state TEXT NOT NULL, '
+                'created_at REAL NOT NULL, '
+                'updated_at REAL NOT NULL)')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'job_key INTEGER NOT NULL, '
+                'entry_key TEXT NOT NULL, '
+                'entry_index INTEGER NOT NULL, '
+                'state TEXT NOT NULL, '
+                'error TEXT, '
+                'updated_at REAL NOT NULL, '
+                'PRIMARY KEY (job_key, entry_key))')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)')
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def add_job(self, url, destination_folder, audio_formats, priority, max_workers):
+        now = time.time()
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO jobs (url, destination_folder, formats, priority, max_workers, state, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, destination_folder, json.dumps(audio_formats), priority, max_workers, 'queued', now, now))
+            return cursor.lastrowid
+
+    def set_job_state(self, job_key, state):
+        with self.lock, self.connection:
+            self.connection.execute('UPDATE jobs SET state = ?, updated_at = ? WHERE job_key = ?', (state, time.time(), job_key))
+
+    def set_job_priority(self, job_key, priority):
+        with self.lock, self.connection:
+            self.connection.execute('UPDATE jobs SET priority = ?, updated_at = ? WHERE job_key = ?', (priority, time.time(), job_key))
+
+    def unfinished_jobs(self):
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT job_key, url, destination_folder, formats, priority, max_workers, state FROM jobs '
+                'WHERE state IN ({}) ORDER BY job_key'.format(', '.join('?' * len(RESUMABLE_JOB_STATES))),
+                RESUMABLE_JOB_STATES).fetchall()
+        return [{
+            'job_key': job_key,
+            'url': url,
+            'destination_folder': destination_folder,
+            'audio_formats': json.loads(formats),
+            'priority': priority,
+            'max_workers': max_workers,
+            'state': state
+        } for job_key, url, destination_folder, formats, priority, max_workers, state in rows]
+
+    def add_entries(self, job_key, entries):
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO entries (job_key, entry_key, entry_index, state, updated_at) VALUES (?, ?, ?, ?, ?)',
+                [(job_key, entry_key(entry), entry['index'], 'pending', now) for entry in entries])
+
+    def entry_states(self, job_key, entry_keys=None):
+        with self.lock:
+            if entry_keys is None:
+                return dict(self.connection.execute('SELECT entry_key, state FROM entries WHERE job_key = ?', (job_key,)).fetchall())
+            return dict(self.connection.execute(
+                'SELECT entry_key, state FROM entries WHERE job_key = ? AND entry_key IN ({})'.format(', '.join('?' * len(entry_keys))),
+                (job_key,) + tuple(entry_keys)).fetchall())
+
+    def set_entry_state(self, job_key, entry, state, error=None):
+        with self.lock, self.connection:
+            self.connection.execute(
+                'UPDATE entries SET state = ?, error = ?, updated_at = ? WHERE job_key = ? AND entry_key = ?',
+                (state, error, time.time(), job_key, entry_key(entry)))
+
+    def prune(self, older_than):
+        with self.lock, self.connection:
+            self.connection.execute(
+                'DELETE FROM entries WHERE job_key IN (SELECT job_key FROM jobs WHERE state NOT IN ({}) AND updated_at < ?)'.format(
+                    ', '.join('?' * len(RESUMABLE_JOB_STATES))),
+                RESUMABLE_JOB_STATES + (older_than,))
+            self.connection.execute(
+                'DELETE FROM jobs WHERE state NOT IN ({}) AND updated_at < ?'.format(', '.join('?' * len(RESUMABLE_JOB_STATES))),
+                RESUMABLE_JOB_STATES + (older_than,))
+
+def entry_key(entry):
+    return entry['archive_id'] or entry['url']
+
+default_journal = None
+default_journal_lock = Lock()
+
+def get_journal():
+    global default_journal
+    with default_journal_lock:
+        if default_journal is None:
+            default_journal = JobJournal(os.path.join(get_cache_dir(), JOURNAL_FILENAME))
+        return default_journal
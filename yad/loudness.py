@@ -0,0 +1,209 @@
+import math
+import struct
+
+LOUDNESS_MODES = ('off', 'tag', 'normalize')
+REPLAYGAIN_REFERENCE = -18.0
+R128_REFERENCE = -23.0
+ANALYSIS_RATE = 48000
+# mono stays mono: upmixed to two equal channels it would count twice and read 3 LU too loud
+ANALYSIS_LAYOUTS = 'mono|stereo'
+# WAV rather than raw samples, so the meter learns from the header how many channels ffmpeg kept
+ANALYSIS_OPTIONS = ['-map', '0:a:0', '-vn', '-af', 'aformat=channel_layouts=' + ANALYSIS_LAYOUTS, '-ar', str(ANALYSIS_RATE),
+                    '-acodec', 'pcm_f32le', '-bitexact', '-f', 'wav']
+READ_SIZE = 256 * 1024
+
+# ITU-R BS.1770 K-weighting at 48 kHz: high shelf, then high pass
+K_WEIGHTING = (
+    ((1.53512485958697, -2.69169618940638, 1.19839281085285), (-1.69065929318241, 0.73248077421585)),
+    ((1.0, -2.0, 1.0), (-1.99004745483398, 0.99007225036621))
+)
+# the slowest pole has a radius of 0.995, so its response is below 1e-9 after this many samples
+FILTER_TAPS = 4096
+FFT_SIZE = 65536
+SUBBLOCK = ANALYSIS_RATE // 10
+SUBBLOCKS_PER_BLOCK = 4
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+# block loudness is kept as a histogram so memory does not grow with the length of the recording
+HISTOGRAM_STEP = 0.01
+HISTOGRAM_MAX = 10.0
+HISTOGRAM_BINS = int((HISTOGRAM_MAX - ABSOLUTE_GATE) / HISTOGRAM_STEP)
+
+kernel_spectrum = None
+
+def numpy_available():
+    try:
+        import numpy
+    except ImportError:
+        return False
+    return True
+
+def k_weighting_spectrum():
+    global kernel_spectrum
+    if kernel_spectrum is None:
+        import numpy as np
+        response = np.zeros(FILTER_TAPS)
+        response[0] = 1.0
+        for (b0, b1, b2), (a1, a2) in K_WEIGHTING:
+            filtered = np.zeros(FILTER_TAPS)
+            x1 = x2 = y1 = y2 = 0.0
+            for n, x in enumerate(response.tolist()):
+                y = b0 * x + b1 * x1 + b2 * x2 - a1 * y1 - a2 * y2
+                filtered[n] = y
+                x1, x2, y1, y2 = x, x1, y, y1
+            response = filtered
+        kernel_spectrum = np.fft.rfft(response, FFT_SIZE)[:, None]
+    return kernel_spectrum
+
+def wav_header(data):
+    # returns the channel count and where the samples start, or None while the header is still incomplete
+    if len(data) < 12:
+        return None
+    if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        raise ValueError('analysis stream is not WAV')
+    offset = 12
+    channels = None
+    while len(data) >= offset + 8:
+        chunk, size = struct.unpack('<4sI', data[offset:offset + 8])
+        offset += 8
+        if chunk == b'data':
+            if channels is None:
+                raise ValueError('WAV data before its format chunk')
+            return channels, offset
+        if len(data) < offset + size:
+            return None
+        if chunk == b'fmt ':
+            channels = struct.unpack('<H', data[offset + 2:offset + 4])[0]
+        offset += size + size % 2
+    return None
+
+def block_loudness(energy):
+    return -0.691 + 10 * math.log10(energy)
+
+class LoudnessMeter:
+    def __init__(self, channels=None):
+        import numpy as np
+        self.np = np
+        self.spectrum = k_weighting_spectrum()
+        # without a channel count the stream is read as WAV and the count comes from its header
+        self.channels = channels
+        self.history = np.zeros((FILTER_TAPS - 1, channels)) if channels else None
+        self.pending = []
+        self.pending_frames = 0
+        self.remainder = b''
+        self.squares = np.zeros(0)
+        self.subblocks = np.zeros(0)
+        self.counts = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+        self.energies = np.zeros(HISTOGRAM_BINS)
+        self.peak = 0.0
+        self.frames = 0
+
+    def feed(self, data):
+        np = self.np
+        data = self.remainder + data
+        if self.channels is None:
+            header = wav_header(data)
+            if header is None:
+                self.remainder = data
+                return
+            self.channels, start = header
+            self.history = np.zeros((FILTER_TAPS - 1, self.channels))
+            data = data[start:]
+        usable = len(data) - len(data) % (4 * self.channels)
+        self.remainder = data[usable:]
+        if not usable:
+            return
+        frames = np.frombuffer(data[:usable], dtype=np.float32).reshape(-1, self.channels)
+        self.peak = max(self.peak, float(frames.max()), -float(frames.min()))
+        self.frames += len(frames)
+        self.pending.append(frames)
+        self.pending_frames += len(frames)
+        step = FFT_SIZE - FILTER_TAPS + 1
+        if self.pending_frames >= step:
+            pending = np.concatenate(self.pending)
+            full = len(pending) - len(pending) % step
+            for start in range(0, full, step):
+                self.filter(pending[start:start + step])
+            self.pending = [pending[full:]]
+            self.pending_frames = len(pending) - full
+
+    def filter(self, frames):
+        # overlap-save with the truncated impulse response: the IIR filter run as one FFT per block
+        np = self.np
+        signal = np.concatenate((self.history, frames))
+        self.history = signal[len(signal) - FILTER_TAPS + 1:]
+        weighted = np.fft.irfft(np.fft.rfft(signal, FFT_SIZE, axis=0) * self.spectrum, FFT_SIZE, axis=0)[FILTER_TAPS - 1:len(signal)]
+        self.gate(np.einsum('ij,ij->i', weighted, weighted))
+
+    def gate(self, squares):
+        np = self.np
+        squares = np.concatenate((self.squares, squares))
+        count = len(squares) // SUBBLOCK
+        self.squares = squares[count * SUBBLOCK:]
+        if not count:
+            return
+        subblocks = np.concatenate((self.subblocks, squares[:count * SUBBLOCK].reshape(count, SUBBLOCK).mean(axis=1)))
+        # 400 ms gating blocks overlapping by 75%, built from 100 ms sub-blocks
+        window = np.lib.stride_tricks.sliding_window_view(subblocks, SUBBLOCKS_PER_BLOCK) if len(subblocks) >= SUBBLOCKS_PER_BLOCK else np.zeros((0, SUBBLOCKS_PER_BLOCK))
+        self.subblocks = subblocks[max(0, len(subblocks) - SUBBLOCKS_PER_BLOCK + 1):]
+        energies = window.mean(axis=1)
+        energies = energies[energies > 0]
+        loudness = -0.691 + 10 * np.log10(energies)
+        kept = loudness >= ABSOLUTE_GATE
+        bins = np.minimum(((loudness[kept] - ABSOLUTE_GATE) / HISTOGRAM_STEP).astype(np.int64), HISTOGRAM_BINS - 1)
+        self.counts += np.bincount(bins, minlength=HISTOGRAM_BINS)
+        self.energies += np.bincount(bins, weights=energies[kept], minlength=HISTOGRAM_BINS)
+
+    def finish(self):
+        np = self.np
+        if self.channels is None:
+            return {'integrated': None, 'peak': self.peak, 'duration': 0.0}
+        if self.pending_frames:
+            self.filter(np.concatenate(self.pending))
+            self.pending = []
+            self.pending_frames = 0
+        return self.result()
+
+    def result(self):
+        count = int(self.counts.sum())
+        if not count:
+            return {'integrated': None, 'peak': self.peak, 'duration': self.frames / ANALYSIS_RATE}
+        threshold = block_loudness(float(self.energies.sum()) / count) + RELATIVE_GATE
+        first = max(0, int(math.ceil((threshold - ABSOLUTE_GATE) / HISTOGRAM_STEP)))
+        count = int(self.counts[first:].sum())
+        integrated = block_loudness(float(self.energies[first:].sum()) / count) if count else None
+        return {'integrated': integrated, 'peak': self.peak, 'duration': self.frames / ANALYSIS_RATE}
+
+def analyse_stream(stream, meter):
+    while True:
+        data = stream.read(READ_SIZE)
+        if not data:
+            return meter.finish()
+        meter.feed(data)
+
+def track_gain(analysis, reference=REPLAYGAIN_REFERENCE):
+    if analysis is None or analysis['integrated'] is None:
+        return None
+    return reference - analysis['integrated']
+
+def normalization_gain(analysis):
+    gain = track_gain(analysis)
+    if gain is None:
+        return 0.0
+    # never raise a track past full scale: the gain is capped by the sample peak
+    if analysis['peak'] > 0:
+        gain = min(gain, -20 * math.log10(analysis['peak']))
+    return gain
+
+def loudness_tags(analysis, audio_format, applied_gain=0.0):
+    gain = track_gain(analysis)
+    if gain is None:
+        return {}
+    gain -= applied_gain
+    peak = analysis['peak'] * 10 ** (applied_gain / 20)
+    if audio_format == 'opus':
+        # Opus players read R128 gains in Q7.8 against -23 LUFS instead of ReplayGain tags
+        return {'R128_TRACK_GAIN': str(max(-32768, min(32767, int(round((gain + R128_REFERENCE - REPLAYGAIN_REFERENCE) * 256)))))}
+    if audio_format == 'wav':
+        return {}
+    return {'REPLAYGAIN_TRACK_GAIN': '{:+.2f} dB'.format(gain), 'REPLAYGAIN_TRACK_PEAK': '{:.6f}'.format(peak)}
@@ -0,0 +1,194 @@
+import json
+import time
+from contextlib import contextmanager
+from threading import Lock, Thread
+
+from .config import load_settings
+
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+METRIC_HELP = {
+    'yad_stage_seconds': ('histogram', 'Time spent in each pipeline stage per entry.'),
+    'yad_downloaded_bytes_total': ('counter', 'Bytes transferred from the network.'),
+    'yad_retries_total': ('counter', 'Entry retries by reason.'),
+    'yad_ffmpeg_cpu_seconds_total': ('counter', 'User and system CPU time used by ffmpeg.'),
+    'yad_entries_total': ('counter', 'Playlist entries by outcome.'),
+    'yad_jobs_total': ('counter', 'Finished jobs by status.')
+}
+
+def label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in labels) + '}'
+
+class Metrics:
+    def __init__(self, log_path=None):
+        self.lock = Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.log = None
+        self.server = None
+        if log_path:
+            self.open_log(log_path)
+
+    def open_log(self, log_path):
+        with self.lock:
+            if self.log is not None:
+                self.log.close()
+            self.log = open(log_path, 'a', encoding='utf-8')
+
+    def close(self):
+        with self.lock:
+            if self.log is not None:
+                self.log.close()
+                self.log = None
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.setdefault(key, {'buckets': [0] * len(STAGE_BUCKETS), 'sum': 0.0, 'count': 0})
+            for position, bound in enumerate(STAGE_BUCKETS):
+                if value <= bound:
+                    histogram['buckets'][position] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def write(self, record):
+        with self.lock:
+            if self.log is None:
+                return
+            self.log.write(json.dumps(dict(record, ts=round(time.time(), 3))) + '\n')
+            self.log.flush()
+
+    def prometheus_text(self):
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, dict(value, buckets=list(value['buckets']))) for key, value in self.histograms.items())
+
+        lines = []
+        described = set()
+        for (name, labels), value in counters:
+            describe(lines, described, name)
+            lines.append('{}{} {}'.format(name, label_text(labels), value))
+        for (name, labels), histogram in histograms:
+            describe(lines, described, name)
+            for bound, count in zip(STAGE_BUCKETS, histogram['buckets']):
+                lines.append('{}_bucket{} {}'.format(name, label_text(labels + (('le', bound),)), count))
+            lines.append('{}_bucket{} {}'.format(name, label_text(labels + (('le', '+Inf'),)), histogram['count']))
+            lines.append('{}_sum{} {}'.format(name, label_text(labels), round(histogram['sum'], 6)))
+            lines.append('{}_count{} {}'.format(name, label_text(labels), histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='127.0.0.1'):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.daemon_threads = True
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server.server_address[1]
+
+def describe(lines, described, name):
+    if name in described or name not in METRIC_HELP:
+        return
+    described.add(name)
+    metric_type, help_text = METRIC_HELP[name]
+    lines.append('# HELP {} {}'.format(name, help_text))
+    lines.append('# TYPE {} {}'.format(name, metric_type))
+
+class JobMetrics:
+    def __init__(self, metrics, job_id):
+        self.metrics = metrics
+        self.job_id = job_id
+        self.lock = Lock()
+        self.started_at = time.monotonic()
+        self.stages = {}
+        self.downloaded_bytes = 0
+        self.retries = 0
+        self.ffmpeg_cpu_seconds = 0.0
+
+    @contextmanager
+    def stage(self, name, index=None):
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.monotonic() - started_at, index)
+
+    def add_stage(self, name, seconds, index=None):
+        with self.lock:
+            totals = self.stages.setdefault(name, {'count': 0, 'seconds': 0.0, 'max': 0.0})
+            totals['count'] += 1
+            totals['seconds'] += seconds
+            totals['max'] = max(totals['max'], seconds)
+        self.metrics.observe('yad_stage_seconds', seconds, stage=name)
+        self.metrics.write({'type': 'stage', 'job': self.job_id, 'index': index, 'stage': name, 'seconds': round(seconds, 6)})
+
+    def add_bytes(self, count):
+        with self.lock:
+            self.downloaded_bytes += count
+        self.metrics.increment('yad_downloaded_bytes_total', count)
+
+    def add_retry(self, reason, index=None):
+        with self.lock:
+            self.retries += 1
+        self.metrics.increment('yad_retries_total', reason=reason)
+        self.metrics.write({'type': 'retry', 'job': self.job_id, 'index': index, 'reason': reason})
+
+    def add_ffmpeg_cpu(self, seconds):
+        with self.lock:
+            self.ffmpeg_cpu_seconds += seconds
+        self.metrics.increment('yad_ffmpeg_cpu_seconds_total', seconds)
+
+    def add_entry(self, outcome):
+        self.metrics.increment('yad_entries_total', outcome=outcome)
+
+    def summary(self):
+        with self.lock:
+            return {
+                'elapsed': round(time.monotonic() - self.started_at, 6),
+                'stages': {name: dict(totals, seconds=round(totals['seconds'], 6), max=round(totals['max'], 6))
+                           for name, totals in self.stages.items()},
+                'downloaded_bytes': self.downloaded_bytes,
+                'retries': self.retries,
+                'ffmpeg_cpu_seconds': round(self.ffmpeg_cpu_seconds, 6)
+            }
+
+    def finish(self, status):
+        summary = self.summary()
+        self.metrics.increment('yad_jobs_total', status=status)
+        self.metrics.write(dict(summary, type='job', job=self.job_id, status=status))
+        return summary
+
+default_metrics = None
+default_metrics_lock = Lock()
+
+def get_metrics():
+    global default_metrics
+    with default_metrics_lock:
+        if default_metrics is None:
+            default_metrics = Metrics(load_settings()['metrics_log'] or None)
+        return default_metrics
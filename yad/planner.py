@@ -0,0 +1,57 @@
+COPY_CODECS = {
+    'mp3': ('mp3',),
+    'flac': ('flac',),
+    'wav': ('pcm',),
+    'm4a': ('aac',),
+    'opus': ('opus',)
+}
+
+EXTENSION_CODECS = {
+    'mp3': 'mp3',
+    'flac': 'flac',
+    'wav': 'pcm',
+    'm4a': 'aac',
+    'opus': 'opus'
+}
+
+TRANSCODE_FORMAT = 'bestaudio/best'
+
+def source_codec(fmt):
+    acodec = (fmt.get('acodec') or '').lower()
+    if acodec == 'none':
+        return None
+    if not acodec:
+        return EXTENSION_CODECS.get(fmt.get('ext'))
+    codec = acodec.split('.')[0]
+    return 'aac' if codec == 'mp4a' else codec
+
+def is_audio_only(fmt):
+    vcodec = fmt.get('vcodec')
+    if vcodec is None:
+        return fmt.get('ext') in EXTENSION_CODECS
+    return vcodec == 'none'
+
+def can_copy(codec, audio_format):
+    return codec is not None and any(codec.startswith(prefix) for prefix in COPY_CODECS.get(audio_format, ()))
+
+def plan_conversion(info, audio_formats):
+    formats = info.get('formats') or [info]
+    best = None
+    best_key = None
+    for fmt in formats:
+        if not fmt.get('format_id') or not fmt.get('url') or not is_audio_only(fmt):
+            continue
+        codec = source_codec(fmt)
+        copied = [audio_format for audio_format in audio_formats if can_copy(codec, audio_format)]
+        if not copied:
+            continue
+        key = (len(copied), fmt.get('abr') or fmt.get('tbr') or 0, fmt.get('filesize') or 0)
+        if best_key is None or key > best_key:
+            best, best_key = (fmt['format_id'], copied), key
+
+    if best is None:
+        return {'format': TRANSCODE_FORMAT, 'copy': []}
+    return {'format': best[0], 'copy': best[1]}
+
+def conversion_methods(plan, audio_formats):
+    return {audio_format: 'copy' if audio_format in plan['copy'] else 'transcode' for audio_format in audio_formats}
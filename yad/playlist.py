@@ -0,0 +1,108 @@
+from .archive import archive_id
+from .pool import get_youtubedl_pool
+
+PLAYLIST_TYPES = ('playlist', 'multi_video')
+URL_RESULT_TYPES = ('url', 'url_transparent')
+MAX_URL_REDIRECTS = 5
+PAGE_SIZE = 100
+CACHE_MAX_ENTRIES = 5000
+PLAYLIST_OPTIONS = {
+    'extract_flat': 'in_playlist',
+    'quiet': True,
+    'logtostderr': True,
+    'noplaylist': False
+}
+
+class PlaylistExpansion:
+    def __init__(self, url, info_cache=None):
+        self.url = url
+        self.info_cache = info_cache
+        self.title = None
+        self.count = None
+
+    def __iter__(self):
+        key = 'playlist:' + self.url
+        info = self.info_cache.get(key) if self.info_cache is not None else None
+        if info is not None:
+            yield from self.cached_entries(info)
+            return
+
+        with get_youtubedl_pool().lease(PLAYLIST_OPTIONS) as ydl:
+            info = follow_url_results(ydl, ydl.extract_info(self.url, download=False, process=False))
+            if info.get('_type') not in PLAYLIST_TYPES:
+                info = ydl.sanitize_info(ydl.process_ie_result(info, download=False), remove_private_keys=True)
+                self.cache(key, info)
+                self.cache(video_cache_key(self.url, archive_id(info.get('extractor_key'), info.get('id'))), info)
+                yield from self.cached_entries(info)
+                return
+
+            self.title = info.get('title') or info.get('id')
+            entries = info.get('entries')
+            self.count = info.get('playlist_count') or (len(entries) if isinstance(entries, list) else None)
+            listing = {field: info.get(field) for field in ('_type', 'id', 'title', 'extractor_key')}
+            cached = []
+            for entry in iterate_entries(entries):
+                if not entry:
+                    continue
+                entry = ydl.sanitize_info(entry, remove_private_keys=True)
+                if cached is not None:
+                    # a listing too long to cache is not kept either, so memory stays flat however long the playlist is
+                    cached.append(entry)
+                    if len(cached) > CACHE_MAX_ENTRIES:
+                        cached = None
+                record = entry_record(entry, info.get('extractor_key'))
+                if record is not None:
+                    yield record
+            if cached is not None:
+                self.cache(key, dict(listing, entries=cached))
+
+    def cached_entries(self, info):
+        if info.get('_type') not in PLAYLIST_TYPES:
+            self.title = None
+            self.count = 1
+            yield {'url': self.url, 'archive_id': archive_id(info.get('extractor_key'), info.get('id'))}
+            return
+        self.title = info.get('title') or info.get('id')
+        self.count = len(info.get('entries') or [])
+        for entry in info.get('entries') or []:
+            record = entry_record(entry, info.get('extractor_key')) if entry else None
+            if record is not None:
+                yield record
+
+    def cache(self, key, info):
+        if self.info_cache is not None:
+            self.info_cache.put(key, info)
+
+def follow_url_results(ydl, info):
+    # resolving a url result with process=True would materialize the whole playlist behind it
+    for _ in range(MAX_URL_REDIRECTS):
+        if info.get('_type') not in URL_RESULT_TYPES:
+            break
+        info = ydl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+    return info
+
+def iterate_entries(entries):
+    import yt_dlp
+    if isinstance(entries, yt_dlp.utils.PagedList):
+        start = 0
+        while True:
+            page = entries.getslice(start, start + PAGE_SIZE)
+            if not page:
+                return
+            yield from page
+            start += len(page)
+    yield from entries or []
+
+def entry_record(entry, extractor_key):
+    entry_url = entry.get('webpage_url') or entry.get('url')
+    if not entry_url:
+        return None
+    return {'url': entry_url, 'archive_id': archive_id(entry.get('ie_key') or extractor_key, entry.get('id'))}
+
+def expand_playlist(url, info_cache=None):
+    expansion = PlaylistExpansion(url, info_cache)
+    entries = list(expansion)
+    return expansion.title, entries
+
+def video_cache_key(url, entry_archive_id):
+    return 'video:' + (entry_archive_id or url)
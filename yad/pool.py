@@ -0,0 +1,91 @@
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+MAX_IDLE_INSTANCES = 8
+IDLE_TIMEOUT = 600
+# output streams are picked once in YoutubeDL.__init__, so they cannot vary per lease
+BASE_OPTIONS = {'logtostderr': True}
+
+class YoutubeDLPool:
+    def __init__(self, max_idle=MAX_IDLE_INSTANCES, idle_timeout=IDLE_TIMEOUT):
+        self.lock = Lock()
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.idle = []
+        self.created = 0
+        self.reused = 0
+
+    def create(self):
+        import yt_dlp
+        ydl = yt_dlp.YoutubeDL(dict(BASE_OPTIONS))
+        # every lease starts from the parameters of a fresh instance, whatever the previous lease set
+        ydl.yad_defaults = dict(ydl.params)
+        return ydl
+
+    def acquire(self):
+        now = time.monotonic()
+        expired = []
+        with self.lock:
+            while self.idle and now - self.idle[0][0] > self.idle_timeout:
+                expired.append(self.idle.pop(0)[1])
+            ydl = self.idle.pop()[1] if self.idle else None
+            if ydl is None:
+                self.created += 1
+            else:
+                self.reused += 1
+        for stale in expired:
+            stale.close()
+        return ydl or self.create()
+
+    def release(self, ydl):
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append((time.monotonic(), ydl))
+                return
+        ydl.close()
+
+    @contextmanager
+    def lease(self, options):
+        ydl = self.acquire()
+        configure(ydl, options)
+        try:
+            yield ydl
+        finally:
+            configure(ydl, {})
+            self.release(ydl)
+
+    def warm(self):
+        with self.lease({}):
+            pass
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for _, ydl in idle:
+            ydl.close()
+
+    def stats(self):
+        with self.lock:
+            return {'idle': len(self.idle), 'created': self.created, 'reused': self.reused}
+
+def configure(ydl, options):
+    # mirrors what YoutubeDL.__init__ derives from its params, keeping the extractor instances and the request director
+    ydl.params.clear()
+    ydl.params.update(ydl.yad_defaults)
+    ydl.params.update(options)
+    ydl._parse_outtmpl()
+    ydl.format_selector = ydl.build_format_selector(ydl.params['format']) if ydl.params.get('format') else None
+    ydl._progress_hooks = list(ydl.params.get('progress_hooks') or [])
+    ydl._num_downloads = 0
+    ydl._download_retcode = 0
+
+default_pool = None
+default_pool_lock = Lock()
+
+def get_youtubedl_pool():
+    global default_pool
+    with default_pool_lock:
+        if default_pool is None:
+            default_pool = YoutubeDLPool()
+        return default_pool
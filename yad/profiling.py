@@ -0,0 +1,74 @@
+import io
+import os
+import tracemalloc
+from contextlib import contextmanager
+from threading import Lock
+
+PROFILE_TOP_FUNCTIONS = 40
+PROFILE_TOP_ALLOCATIONS = 25
+
+class JobProfiler:
+    def __init__(self, job_id, directory):
+        self.job_id = job_id
+        self.directory = directory
+        self.lock = Lock()
+        self.profiles = []
+        self.started_tracing = not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+
+    @contextmanager
+    def thread(self):
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler already owns this thread (or, on 3.12+, the interpreter) and sees these calls
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self.lock:
+                self.profiles.append(profile)
+
+    def wrap(self, function):
+        def wrapper(*args, **kwargs):
+            with self.thread():
+                return function(*args, **kwargs)
+        return wrapper
+
+    def dump(self):
+        os.makedirs(self.directory, exist_ok=True)
+        base_path = os.path.join(self.directory, 'job-{}'.format(self.job_id))
+        paths = {}
+
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            if self.started_tracing:
+                tracemalloc.stop()
+            paths['memory'] = base_path + '-memory.txt'
+            with open(paths['memory'], 'w', encoding='utf-8') as memory_file:
+                memory_file.write('current {} KiB, peak {} KiB\n\n'.format(current // 1024, peak // 1024))
+                for statistic in snapshot.statistics('lineno')[:PROFILE_TOP_ALLOCATIONS]:
+                    memory_file.write('{}\n'.format(statistic))
+
+        with self.lock:
+            profiles = [profile for profile in self.profiles if profile.getstats()]
+        if profiles:
+            import pstats
+            stats = pstats.Stats(*profiles)
+            paths['profile'] = base_path + '.prof'
+            stats.dump_stats(paths['profile'])
+
+            report = io.StringIO()
+            stats.stream = report
+            stats.sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+            stats.sort_stats('tottime').print_stats(PROFILE_TOP_FUNCTIONS)
+            paths['report'] = base_path + '-cpu.txt'
+            with open(paths['report'], 'w', encoding='utf-8') as report_file:
+                report_file.write(report.getvalue())
+        return paths
@@ -0,0 +1,166 @@
+import json
+import os
+import re
+import time
+from contextlib import nullcontext
+from threading import Event, Lock, Thread
+
+from .adaptive import RETRY_ATTEMPTS, backoff_delay, is_throttled, is_transient
+
+SEGMENT_PROTOCOLS = ('http', 'https')
+# below this, extra connections spend longer ramping up than they save
+MIN_SEGMENT_BYTES = 8 * 1024 * 1024
+SEGMENT_CHUNK_SIZE = 256 * 1024
+STATE_SAVE_SECONDS = 2.0
+PART_SUFFIX = '.yad-part'
+STATE_SUFFIX = '.yad-segments'
+CONTENT_RANGE = re.compile(r'^bytes 0-0/(\d+)$')
+
+class SegmentError(Exception):
+    pass
+
+def segment_count(info, segments):
+    if (segments or 0) < 2 or info.get('protocol') not in SEGMENT_PROTOCOLS or info.get('requested_formats') or not info.get('url'):
+        return 0
+    return min(segments, (info.get('filesize') or info.get('filesize_approx') or 0) // MIN_SEGMENT_BYTES)
+
+def split_ranges(total, count):
+    size = -(-total // count)
+    return [[start, min(total, start + size) - 1, 0] for start in range(0, total, size)]
+
+class SegmentedDownload:
+    def __init__(self, ydl, info, path, count, hook, connection=None):
+        self.ydl = ydl
+        self.info = info
+        self.path = path
+        self.count = count
+        self.hook = hook
+        self.connection = connection or (lambda url: nullcontext())
+        self.part_path = path + PART_SUFFIX
+        self.state_path = path + STATE_SUFFIX
+        self.lock = Lock()
+        self.stop = Event()
+        self.errors = []
+        self.total = 0
+        self.segments = []
+        self.downloaded = 0
+        self.resumed = 0
+        self.started_at = time.monotonic()
+        self.saved_at = self.started_at
+
+    def request(self, byte_range):
+        import yt_dlp
+        headers = dict(self.info.get('http_headers') or {}, Range='bytes={}-{}'.format(*byte_range))
+        return self.ydl.urlopen(yt_dlp.networking.Request(self.info['url'], headers=headers))
+
+    def probe(self):
+        # a one-byte request tells whether the server honours ranges and how large the file really is
+        with self.connection(self.info['url']), self.request((0, 0)) as response:
+            match = CONTENT_RANGE.match(response.headers.get('Content-Range') or '')
+            return int(match.group(1)) if response.status == 206 and match else None
+
+    def run(self):
+        if os.path.exists(self.path) and not os.path.exists(self.state_path):
+            size = os.path.getsize(self.path)
+            self.hook({'status': 'finished', 'downloaded_bytes': size, 'total_bytes': size, 'filename': self.path})
+            return self.path
+        total = self.probe()
+        if not total:
+            return None
+        self.prepare(total)
+        if self.downloaded < self.total:
+            readers = [Thread(target=self.read_segment, args=(segment,)) for segment in self.segments if segment[2] <= segment[1] - segment[0]]
+            for reader in readers:
+                reader.start()
+            for reader in readers:
+                reader.join()
+            if self.errors:
+                with self.lock:
+                    self.save_state()
+                raise self.errors[0]
+        os.replace(self.part_path, self.path)
+        os.remove(self.state_path)
+        self.hook({'status': 'finished', 'downloaded_bytes': self.total, 'total_bytes': self.total, 'filename': self.path})
+        return self.path
+
+    def prepare(self, total):
+        self.total = total
+        try:
+            with open(self.state_path, 'r') as state_file:
+                state = json.load(state_file)
+            # a state left by another format or another size of the same title cannot be trusted
+            if state['total'] == total and state['format_id'] == self.info.get('format_id') and os.path.getsize(self.part_path) == total:
+                self.segments = state['segments']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        if not self.segments:
+            self.segments = split_ranges(total, self.count)
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.part_path, 'wb') as part_file:
+                if hasattr(os, 'posix_fallocate'):
+                    os.posix_fallocate(part_file.fileno(), 0, total)
+                else:
+                    part_file.truncate(total)
+            with self.lock:
+                self.save_state()
+        self.downloaded = self.resumed = sum(segment[2] for segment in self.segments)
+
+    def save_state(self):
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w') as state_file:
+            json.dump({'total': self.total, 'format_id': self.info.get('format_id'), 'segments': self.segments}, state_file)
+        os.replace(temp_path, self.state_path)
+        self.saved_at = time.monotonic()
+
+    def read_segment(self, segment):
+        attempt = 0
+        try:
+            while not self.stop.is_set() and segment[2] <= segment[1] - segment[0]:
+                before = segment[2]
+                try:
+                    self.fetch(segment)
+                except Exception as e:
+                    if segment[2] > before:
+                        attempt = 0
+                    attempt += 1
+                    if attempt >= RETRY_ATTEMPTS or not (is_throttled(e) or is_transient(e)):
+                        raise
+                    self.stop.wait(backoff_delay(attempt - 1, e))
+        except BaseException as e:
+            with self.lock:
+                self.errors.append(e)
+            self.stop.set()
+
+    def fetch(self, segment):
+        start = segment[0] + segment[2]
+        with self.connection(self.info['url']), self.request((start, segment[1])) as response:
+            if response.status != 206:
+                raise SegmentError('the server stopped honouring byte ranges')
+            with open(self.part_path, 'r+b') as part_file:
+                part_file.seek(start)
+                while not self.stop.is_set() and segment[2] <= segment[1] - segment[0]:
+                    chunk = response.read(min(SEGMENT_CHUNK_SIZE, segment[1] - segment[0] + 1 - segment[2]))
+                    if not chunk:
+                        raise ConnectionError('segment closed at byte {} of {}'.format(segment[0] + segment[2], segment[1]))
+                    part_file.write(chunk)
+                    # flushed first, so every byte the state file counts has already reached the operating system
+                    part_file.flush()
+                    self.progress(segment, len(chunk))
+
+    def progress(self, segment, amount):
+        with self.lock:
+            segment[2] += amount
+            self.downloaded += amount
+            if time.monotonic() - self.saved_at >= STATE_SAVE_SECONDS:
+                self.save_state()
+            elapsed = time.monotonic() - self.started_at
+            # the hook is not thread safe and may block on the shared bandwidth budget or raise on cancel
+            self.hook({
+                'status': 'downloading',
+                'downloaded_bytes': self.downloaded,
+                'total_bytes': self.total,
+                'speed': (self.downloaded - self.resumed) / elapsed if elapsed > 0 else 0
+            })
+
+def download_segments(ydl, info, path, count, hook, connection=None):
+    return SegmentedDownload(ydl, info, path, count, hook, connection).run()
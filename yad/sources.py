@@ -0,0 +1,208 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from threading import Lock
+
+from .config import get_cache_dir, load_settings
+
+SOURCE_CACHE_DIRNAME = 'sources'
+HASH_BLOCK_SIZE = 1024 * 1024
+
+def source_key(archive_id, format_id):
+    if not archive_id or not format_id:
+        return None
+    return '{} {}'.format(archive_id, format_id)
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source_file:
+        for block in iter(lambda: source_file.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def link_or_copy(source_path, target_path):
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copyfile(source_path, target_path)
+
+class SourceWriter:
+    def __init__(self, cache, key, ext):
+        self.cache = cache
+        self.key = key
+        self.ext = ext
+        self.digest = hashlib.sha256()
+        self.size = 0
+        handle, self.temp_path = tempfile.mkstemp(dir=cache.objects_dir, suffix='.part')
+        self.file = os.fdopen(handle, 'wb')
+
+    def write(self, chunk):
+        self.file.write(chunk)
+        self.digest.update(chunk)
+        self.size += len(chunk)
+
+    def commit(self):
+        self.file.close()
+        self.cache.add_object(self.key, self.temp_path, self.digest.hexdigest(), self.size, self.ext)
+
+    def discard(self):
+        if not self.file.closed:
+            self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+def tee_to_cache(chunks, writer):
+    committed = False
+    try:
+        for chunk in chunks:
+            writer.write(chunk)
+            yield chunk
+        try:
+            writer.commit()
+            committed = True
+        except OSError:
+            pass
+    finally:
+        if not committed:
+            writer.discard()
+
+class SourceCache:
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.max_bytes = max_bytes
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.corrupt = 0
+        self.evictions = 0
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(root, 'index.sqlite3'), timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS sources ('
+                'key TEXT PRIMARY KEY, '
+                'digest TEXT NOT NULL, '
+                'size INTEGER NOT NULL, '
+                'ext TEXT NOT NULL, '
+                'accessed_at REAL NOT NULL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS sources_accessed_at ON sources (accessed_at)')
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def fetch(self, key, target_path):
+        with self.lock, self.connection:
+            row = self.connection.execute('SELECT digest, size FROM sources WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return False
+            self.connection.execute('UPDATE sources SET accessed_at = ? WHERE key = ?', (time.time(), key))
+
+        digest, size = row
+        object_path = self.object_path(digest)
+        try:
+            valid = os.path.getsize(object_path) == size and file_digest(object_path) == digest
+        except OSError:
+            valid = False
+        if not valid:
+            with self.lock, self.connection:
+                self.connection.execute('DELETE FROM sources WHERE key = ?', (key,))
+                self.remove_unreferenced(digest)
+                self.corrupt += 1
+                self.misses += 1
+            return False
+
+        os.makedirs(os.path.dirname(os.path.abspath(target_path)), exist_ok=True)
+        try:
+            if os.path.exists(target_path):
+                os.remove(target_path)
+            link_or_copy(object_path, target_path)
+        except OSError:
+            with self.lock:
+                self.misses += 1
+            return False
+        with self.lock:
+            self.hits += 1
+        return True
+
+    def store(self, key, source_path, ext):
+        handle, temp_path = tempfile.mkstemp(dir=self.objects_dir, suffix='.part')
+        os.close(handle)
+        os.remove(temp_path)
+        try:
+            link_or_copy(source_path, temp_path)
+            self.add_object(key, temp_path, file_digest(temp_path), os.path.getsize(temp_path), ext)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def writer(self, key, ext):
+        return SourceWriter(self, key, ext)
+
+    def add_object(self, key, temp_path, digest, size, ext):
+        object_path = self.object_path(digest)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        with self.lock, self.connection:
+            if os.path.exists(object_path):
+                os.remove(temp_path)
+            else:
+                os.replace(temp_path, object_path)
+            self.connection.execute(
+                'INSERT OR REPLACE INTO sources (key, digest, size, ext, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                (key, digest, size, ext, time.time()))
+            self.evict()
+
+    def remove_unreferenced(self, digest):
+        if self.connection.execute('SELECT 1 FROM sources WHERE digest = ?', (digest,)).fetchone() is None:
+            object_path = self.object_path(digest)
+            if os.path.exists(object_path):
+                os.remove(object_path)
+
+    def evict(self):
+        total = self.connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM sources)').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, digest, size in self.connection.execute('SELECT key, digest, size FROM sources ORDER BY accessed_at').fetchall():
+            self.connection.execute('DELETE FROM sources WHERE key = ?', (key,))
+            self.evictions += 1
+            if self.connection.execute('SELECT 1 FROM sources WHERE digest = ?', (digest,)).fetchone() is None:
+                self.remove_unreferenced(digest)
+                total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sources').fetchone()
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'corrupt': self.corrupt,
+                'evictions': self.evictions,
+                'entries': entries,
+                'bytes': size
+            }
+
+default_source_cache = None
+default_source_cache_lock = Lock()
+
+def get_source_cache():
+    global default_source_cache
+    with default_source_cache_lock:
+        if default_source_cache is None:
+            settings = load_settings()
+            default_source_cache = SourceCache(os.path.join(get_cache_dir(), SOURCE_CACHE_DIRNAME),
+                                               settings['source_cache_max_bytes'])
+        return default_source_cache
@@ -0,0 +1,84 @@
+import time
+from queue import Queue, Full, Empty
+from threading import Thread, Event
+
+STREAM_CHUNK_SIZE = 256 * 1024
+STREAM_BUFFER_CHUNKS = 32
+STREAMABLE_PROTOCOLS = ('http', 'https')
+STREAMABLE_EXTENSIONS = ('webm', 'weba', 'opus', 'ogg', 'mp3', 'aac', 'flac', 'wav')
+STREAM_FORMAT = 'bestaudio[protocol^=http][ext!=m4a][ext!=mp4]/bestaudio/best'
+
+class StreamError(Exception):
+    pass
+
+def is_streamable(info):
+    return (info.get('protocol') in STREAMABLE_PROTOCOLS
+            and info.get('ext') in STREAMABLE_EXTENSIONS
+            and not info.get('requested_formats')
+            and bool(info.get('url')))
+
+def read_stream(ydl, info, buffer, stop, hook):
+    import yt_dlp
+    downloaded_bytes = 0
+    started_at = time.monotonic()
+    try:
+        request = yt_dlp.networking.Request(info['url'], headers=info.get('http_headers'))
+        with ydl.urlopen(request) as response:
+            total_bytes = int(response.headers.get('Content-Length') or 0) or info.get('filesize') or 0
+            while not stop.is_set():
+                chunk = response.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                while not stop.is_set():
+                    try:
+                        buffer.put(chunk, timeout=0.5)
+                        break
+                    except Full:
+                        continue
+                downloaded_bytes += len(chunk)
+                elapsed = time.monotonic() - started_at
+                hook({
+                    'status': 'downloading',
+                    'downloaded_bytes': downloaded_bytes,
+                    'total_bytes': total_bytes,
+                    'speed': downloaded_bytes / elapsed if elapsed > 0 else 0
+                })
+        hook({'status': 'finished', 'downloaded_bytes': downloaded_bytes, 'total_bytes': downloaded_bytes})
+        result = None
+    except (yt_dlp.networking.exceptions.RequestError, OSError) as e:
+        result = StreamError('streaming download failed: {}'.format(e))
+        result.__cause__ = e
+    except Exception as e:
+        result = e
+
+    while not stop.is_set():
+        try:
+            buffer.put(result, timeout=0.5)
+            return
+        except Full:
+            continue
+
+def buffered_chunks(buffer):
+    while True:
+        chunk = buffer.get()
+        if chunk is None:
+            return
+        if isinstance(chunk, Exception):
+            raise chunk
+        yield chunk
+
+def stream_to(consumer, ydl, info, hook):
+    buffer = Queue(maxsize=STREAM_BUFFER_CHUNKS)
+    stop = Event()
+    reader = Thread(target=read_stream, args=(ydl, info, buffer, stop, hook))
+    reader.start()
+    try:
+        return consumer(buffered_chunks(buffer))
+    finally:
+        stop.set()
+        while True:
+            try:
+                buffer.get_nowait()
+            except Empty:
+                break
+        reader.join()
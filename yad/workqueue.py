@@ -0,0 +1,259 @@
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from threading import Event, Lock, Thread
+
+from .config import DEFAULT_MAX_WORKERS
+from .core import download_audio
+from .ffmpeg import format_list
+from .jobs import DEFAULT_MAX_JOBS, JobControl
+
+LEASE_SECONDS = 60
+HEARTBEATS_PER_LEASE = 3
+POLL_SECONDS = 2.0
+# a job whose workers keep dying is failed instead of taking down every node in turn
+MAX_LEASES = 3
+UNFINISHED_STATES = ('queued', 'leased')
+
+class SqliteWorkQueue:
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.lock = Lock()
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        with self.lock, self.connection:
+            # the rollback journal instead of WAL: WAL needs shared memory, which nodes mounting the file over the network do not share
+            self.connection.execute('PRAGMA journal_mode=DELETE')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS work ('
+                'job_key INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'url TEXT NOT NULL, '
+                'destination_folder TEXT NOT NULL, '
+                'formats TEXT NOT NULL, '
+                'priority INTEGER NOT NULL, '
+                'max_workers INTEGER NOT NULL, '
+                'state TEXT NOT NULL, '
+                'worker TEXT, '
+                'lease TEXT, '
+                'lease_expires REAL, '
+                'leases INTEGER NOT NULL DEFAULT 0, '
+                'error TEXT, '
+                'created_at REAL NOT NULL, '
+                'updated_at REAL NOT NULL)')
+            # claims only live as long as the job holding them, so a table from before output folders were part of the key can go
+            columns = [row[1] for row in self.connection.execute('PRAGMA table_info(entry_claims)')]
+            if columns and 'output_folder' not in columns:
+                self.connection.execute('DROP TABLE entry_claims')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS entry_claims ('
+                'archive_id TEXT NOT NULL, '
+                'format TEXT NOT NULL, '
+                'output_folder TEXT NOT NULL, '
+                'job_key INTEGER NOT NULL, '
+                'PRIMARY KEY (archive_id, format, output_folder))')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS work_state ON work (state, priority, job_key)')
+            self.connection.execute('CREATE UNIQUE INDEX IF NOT EXISTS work_lease ON work (lease)')
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def submit(self, url, destination_folder, audio_formats, priority=0, max_workers=DEFAULT_MAX_WORKERS):
+        now = time.time()
+        destination_folder = os.path.abspath(destination_folder)
+        with self.lock, self.connection:
+            duplicate = self.connection.execute(
+                'SELECT job_key FROM work WHERE url = ? AND destination_folder = ? AND state IN (?, ?)',
+                (url.strip(), destination_folder) + UNFINISHED_STATES).fetchone()
+            if duplicate:
+                return None
+            cursor = self.connection.execute(
+                'INSERT INTO work (url, destination_folder, formats, priority, max_workers, state, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (url.strip(), destination_folder, json.dumps(format_list(audio_formats)), priority, max_workers, 'queued', now, now))
+            return cursor.lastrowid
+
+    def claim(self, worker, lease_seconds=LEASE_SECONDS):
+        now = time.time()
+        lease = uuid.uuid4().hex
+        with self.lock, self.connection:
+            expired = 'state = ? AND lease_expires < ?'
+            self.connection.execute(
+                'DELETE FROM entry_claims WHERE job_key IN (SELECT job_key FROM work WHERE {} AND leases >= ?)'.format(expired),
+                ('leased', now, MAX_LEASES))
+            self.connection.execute(
+                'UPDATE work SET state = ?, lease = NULL, error = ?, updated_at = ? WHERE {} AND leases >= ?'.format(expired),
+                ('failed', 'no worker finished the job after {} leases'.format(MAX_LEASES), now, 'leased', now, MAX_LEASES))
+            # one statement picks and takes the job, so two nodes polling at once can never both get it
+            self.connection.execute(
+                'UPDATE work SET state = ?, worker = ?, lease = ?, lease_expires = ?, leases = leases + 1, updated_at = ? '
+                'WHERE job_key = (SELECT job_key FROM work WHERE state = ? OR ({}) ORDER BY priority DESC, job_key LIMIT 1)'.format(expired),
+                ('leased', worker, lease, now + lease_seconds, now, 'queued', 'leased', now))
+            row = self.connection.execute(
+                'SELECT job_key, url, destination_folder, formats, priority, max_workers, leases FROM work WHERE lease = ?', (lease,)).fetchone()
+        if row is None:
+            return None
+        job_key, url, destination_folder, formats, priority, max_workers, leases = row
+        return {
+            'job_key': job_key,
+            'lease': lease,
+            'url': url,
+            'destination_folder': destination_folder,
+            'audio_formats': json.loads(formats),
+            'priority': priority,
+            'max_workers': max_workers,
+            'leases': leases
+        }
+
+    def renew(self, lease, lease_seconds=LEASE_SECONDS):
+        now = time.time()
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                'UPDATE work SET lease_expires = ?, updated_at = ? WHERE lease = ? AND state = ?',
+                (now + lease_seconds, now, lease, 'leased'))
+        return cursor.rowcount == 1
+
+    def finish(self, lease, state, error=None):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM entry_claims WHERE job_key = (SELECT job_key FROM work WHERE lease = ?)', (lease,))
+            cursor = self.connection.execute(
+                'UPDATE work SET state = ?, lease = NULL, error = ?, updated_at = ? WHERE lease = ? AND state = ?',
+                (state, error, time.time(), lease, 'leased'))
+        return cursor.rowcount == 1
+
+    def release(self, lease):
+        # handed back by a node that is shutting down, so the lease does not count against the job
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                'UPDATE work SET state = ?, worker = NULL, lease = NULL, lease_expires = NULL, leases = leases - 1, updated_at = ? '
+                'WHERE lease = ? AND state = ?',
+                ('queued', time.time(), lease, 'leased'))
+        return cursor.rowcount == 1
+
+    def claim_entry(self, lease, entry_archive_id, audio_formats, output_folder):
+        with self.lock, self.connection:
+            row = self.connection.execute('SELECT job_key FROM work WHERE lease = ? AND state = ?', (lease, 'leased')).fetchone()
+            if row is None:
+                return []
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO entry_claims (archive_id, format, output_folder, job_key) VALUES (?, ?, ?, ?)',
+                [(entry_archive_id, audio_format, output_folder, row[0]) for audio_format in audio_formats])
+            owners = dict(self.connection.execute(
+                'SELECT format, job_key FROM entry_claims WHERE archive_id = ? AND output_folder = ? AND format IN ({})'.format(', '.join('?' * len(audio_formats))),
+                (entry_archive_id, output_folder) + tuple(audio_formats)).fetchall())
+        return [audio_format for audio_format in audio_formats if owners.get(audio_format) == row[0]]
+
+    def counts(self):
+        with self.lock:
+            return dict(self.connection.execute('SELECT state, COUNT(*) FROM work GROUP BY state').fetchall())
+
+    def unfinished(self):
+        counts = self.counts()
+        return sum(counts.get(state, 0) for state in UNFINISHED_STATES)
+
+QUEUE_BACKENDS = {'sqlite': SqliteWorkQueue}
+
+def open_work_queue(location):
+    scheme, separator, path = location.partition('://')
+    if not separator:
+        scheme, path = 'sqlite', location
+    if scheme not in QUEUE_BACKENDS:
+        raise ValueError('unknown work queue backend {!r} (known: {})'.format(scheme, ', '.join(sorted(QUEUE_BACKENDS))))
+    return QUEUE_BACKENDS[scheme](path)
+
+class WorkerNode:
+    def __init__(self, work_queue, channel, max_jobs=DEFAULT_MAX_JOBS, download_options=None, worker_id=None, lease_seconds=LEASE_SECONDS, drain=False):
+        self.work_queue = work_queue
+        self.channel = channel
+        self.download_options = download_options or {}
+        self.worker_id = worker_id or '{}:{}'.format(socket.gethostname(), os.getpid())
+        self.lease_seconds = lease_seconds
+        self.drain = drain
+        self.lock = Lock()
+        self.stopping = Event()
+        self.finished = Event()
+        self.running = {}
+        self.errors = {}
+        self.workers = [Thread(target=self.worker, daemon=True) for _ in range(max(1, max_jobs))]
+        self.heartbeat_thread = Thread(target=self.heartbeat, daemon=True)
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        self.heartbeat_thread.start()
+
+    def put(self, event):
+        job_id, status, _, data = event
+        if status == 'failed':
+            self.errors[job_id] = data
+        self.channel.put(event)
+
+    def running_job(self, job_key):
+        with self.lock:
+            return next((job for job in self.running.values() if job['job_key'] == job_key), None)
+
+    def worker(self):
+        while not self.stopping.is_set():
+            job = self.work_queue.claim(self.worker_id, self.lease_seconds)
+            if job is None:
+                if self.drain and not self.work_queue.unfinished():
+                    return
+                self.stopping.wait(POLL_SECONDS)
+                continue
+
+            job['control'] = JobControl()
+            job['lost'] = False
+            with self.lock:
+                self.running[job['lease']] = job
+            try:
+                state = download_audio(job['url'], job['destination_folder'], job['audio_formats'], job['job_key'], self,
+                                       job['max_workers'], control=job['control'],
+                                       claim_entry=lambda entry_archive_id, audio_formats, output_folder, lease=job['lease']: self.work_queue.claim_entry(lease, entry_archive_id, audio_formats, output_folder),
+                                       **self.download_options)
+            except Exception as e:
+                # a failure before the job set itself up must not leave the lease renewed forever by a dead thread
+                state = 'failed'
+                self.put((job['job_key'], 'failed', None, str(e)))
+            finally:
+                with self.lock:
+                    del self.running[job['lease']]
+            if job['lost']:
+                continue
+            if state == 'ffmpeg_missing':
+                # the job is fine, this node just cannot convert: hand it back for a node that can and stop taking more
+                self.work_queue.release(job['lease'])
+                self.stop()
+            elif state == 'cancelled' and self.stopping.is_set():
+                self.work_queue.release(job['lease'])
+            else:
+                self.work_queue.finish(job['lease'], state, self.errors.pop(job['job_key'], None))
+
+    def heartbeat(self):
+        while not self.finished.wait(self.lease_seconds / HEARTBEATS_PER_LEASE):
+            with self.lock:
+                running = list(self.running.values())
+            for job in running:
+                # another node took the job over after a missed lease: stop here so the two never write the same files
+                if not self.work_queue.renew(job['lease'], self.lease_seconds):
+                    job['lost'] = True
+                    job['control'].cancel()
+
+    def alive(self):
+        return any(worker.is_alive() for worker in self.workers)
+
+    def stop(self, cancel=True):
+        self.stopping.set()
+        if cancel:
+            with self.lock:
+                for job in self.running.values():
+                    job['control'].cancel()
+
+    def wait(self):
+        for worker in self.workers:
+            worker.join()
+        self.finished.set()
+        self.heartbeat_thread.join()